@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""Compare pyverilog codegen with tapa.verilog.emitter on a large top module.
+
+The synthetic top module instantiates many FIFOs the same way
+`tapa.core.Program` does, which is what dominates the generated code of real
+designs.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pyverilog.ast_code_generator import codegen
+
+from tapa.verilog import ast
+from tapa.verilog import xilinx as rtl
+from tapa.verilog.emitter import Emitter
+
+TOP_MODULE = '''
+module top (
+  ap_clk,
+  ap_rst_n
+);
+  input ap_clk;
+  input ap_rst_n;
+endmodule
+'''
+
+
+def make_top(fifo_count: int, width: int, depth: int,
+             register_level: int) -> rtl.Module:
+  with tempfile.TemporaryDirectory(prefix='tapa-benchmark-') as tmpdir:
+    filename = os.path.join(tmpdir, 'top.v')
+    with open(filename, 'w') as fileobj:
+      fileobj.write(TOP_MODULE)
+    module = rtl.Module([filename])
+  module.register_level = register_level
+  for idx in range(fifo_count):
+    name = f'fifo_{idx}'
+    module.add_signals(
+        ast.Wire(name=rtl.wire_name(name, suffix),
+                 width=ast.make_width(
+                     width + 1 if suffix in
+                     {rtl.ISTREAM_SUFFIXES[0], rtl.OSTREAM_SUFFIXES[0]} else 1))
+        for suffix in rtl.ISTREAM_SUFFIXES + rtl.OSTREAM_SUFFIXES)
+    module.add_fifo_instance(name=name, width=width + 1, depth=depth)
+  return module
+
+
+def bench(name: str, visit, node: ast.Node, repeat: int) -> str:
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    code = visit(node)
+    best = min(best, time.perf_counter() - start)
+  print(f'{name:>10}: {best:8.3f} s, {len(code)} chars')
+  return code
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Benchmark Verilog code generation of a top module.')
+  parser.add_argument('--fifo-count', type=int, default=5000)
+  parser.add_argument('--width', type=int, default=32)
+  parser.add_argument('--depth', type=int, default=2)
+  parser.add_argument('--register-level', type=int, default=1)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  module = make_top(
+      fifo_count=args.fifo_count,
+      width=args.width,
+      depth=args.depth,
+      register_level=args.register_level,
+  )
+  node = module.ast
+  print(f'{args.fifo_count} FIFOs, {len(node.description.definitions[0].items)}'
+        ' items')
+  expected = bench('pyverilog',
+                   codegen.ASTCodeGenerator().visit, node, args.repeat)
+  actual = bench('emitter', Emitter().visit, node, args.repeat)
+  if actual != expected:
+    raise ValueError('emitter output differs from pyverilog')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Measure the startup time of the tapa entry points.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so the
+numbers reflect what a user pays before `tapac` or `tapav` does any work.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+MODULES = (
+    'tapa.tapac',
+    'tapa.tapav',
+    'tapa.fake_hls',
+    'tapa.hls_executor',
+)
+
+_IMPORTTIME_PATTERN = re.compile(
+    r'^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|'
+    r'(?P<indent>\s*)(?P<module>\S+)$', re.MULTILINE)
+
+
+def import_times(module: str) -> Dict[str, int]:
+  """Import `module` in a fresh interpreter.
+
+  Returns:
+    Dict mapping each imported module to its cumulative import time in us.
+  """
+  proc = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.PIPE,
+      universal_newlines=True,
+      check=True,
+  )
+  return {
+      match['module']: int(match['cumulative'])
+      for match in _IMPORTTIME_PATTERN.finditer(proc.stderr)
+  }
+
+
+def time_help(module: str) -> float:
+  start = time.perf_counter()
+  subprocess.run(
+      [sys.executable, '-m', module, '--help'],
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL,
+      check=True,
+  )
+  return time.perf_counter() - start
+
+
+def bench(module: str, repeat: int, top: int, help_: bool) -> None:
+  best: Dict[str, int] = {}
+  for _ in range(repeat):
+    times = import_times(module)
+    for name, cumulative in times.items():
+      best[name] = min(best.get(name, cumulative), cumulative)
+  line = f'{module:>18}: {best[module] / 1e3:8.1f} ms import'
+  if help_:
+    line += f', {min(time_help(module) for _ in range(repeat)):6.3f} s --help'
+  print(line)
+
+  heaviest: List[Tuple[int, str]] = sorted(
+      ((cumulative, name)
+       for name, cumulative in best.items()
+       if name != module and not name.startswith(module + '.')),
+      reverse=True,
+  )
+  for cumulative, name in heaviest[:top]:
+    print(f'{"":>20}{cumulative / 1e3:8.1f} ms {name}')
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Benchmark the startup time of tapa entry points.')
+  parser.add_argument('modules', nargs='*', default=MODULES)
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--top',
+                      type=int,
+                      default=5,
+                      help='number of heaviest imports to list per module')
+  parser.add_argument('--help-time',
+                      action='store_true',
+                      help='also time running each module with --help')
+  args = parser.parse_args()
+
+  for module in args.modules:
+    bench(module, args.repeat, args.top, args.help_time)
+
+
+if __name__ == '__main__':
+  main()
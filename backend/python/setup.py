@@ -34,21 +34,25 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
         'Topic :: System :: Hardware',
     ],
     packages=find_packages(),
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[
         'haoda>=0.0.20200507.dev1',
         'pyverilog>=1.2.0',
         'toposort',
     ],
     entry_points={
-        'console_scripts': ['tapac=tapa.tapac:main', 'tapav=tapa.tapav:main'],
+        'console_scripts': [
+            'tapac=tapa.tapac:main',
+            'tapav=tapa.tapav:main',
+            'tapa-fake-hls=tapa.fake_hls:main',
+            'tapa-hls-worker=tapa.hls_executor:main',
+        ],
     },
     include_package_data=True,
 )
@@ -0,0 +1,322 @@
+"""Persistent, content-addressed caches of build artifacts.
+
+Entries are files named after the hex digest of the inputs that produced them.
+The modification time of each entry is refreshed on every hit so that the least
+recently used entries can be evicted once the cache grows beyond its size limit.
+
+A `Manifest` records which inputs produced each artifact of a build and the
+digest of the artifact, so that intact and up-to-date artifacts can be reused
+when an interrupted build is resumed.
+
+A `ProbeCache` records what was found by probing the environment, e.g., the
+location and version of tools, so that repeated runs skip the probes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+_logger = logging.getLogger().getChild(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or
+    os.path.join(os.path.expanduser('~'), '.cache'),
+    'tapa',
+)
+
+# once the cache grows beyond its size limit, entries are evicted until it is
+# within this fraction of the limit, so that it is not scanned on every put
+_EVICT_LOW_WATERMARK = 0.9
+
+
+def get_key(*inputs: Any) -> str:
+  """Return the hex digest of JSON-serializable inputs.
+
+  Args:
+    inputs: JSON-serializable objects. Dicts are serialized with sorted keys so
+        the key does not depend on insertion order.
+
+  Returns:
+    str: SHA-256 hex digest of the inputs.
+  """
+  return hashlib.sha256(json.dumps(inputs,
+                                   sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_file_digest(filename: str) -> str:
+  """Return the SHA-256 hex digest of the content of a file."""
+  digest = hashlib.sha256()
+  with open(filename, 'rb') as fileobj:
+    for chunk in iter(lambda: fileobj.read(1 << 20), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+class Cache:
+  """A directory of content-addressed files with LRU eviction.
+
+  Attributes:
+    cache_dir: Directory where the entries are stored.
+    max_size: Maximum total size of the entries in bytes; 0 means unlimited.
+  """
+
+  def __init__(self, cache_dir: str, max_size: int = 0):
+    self.cache_dir = os.path.abspath(cache_dir)
+    self.max_size = max_size
+    # approximate total size of the entries, or None before the first scan
+    self._size: Optional[int] = None
+    self._lock = threading.Lock()
+    os.makedirs(self.cache_dir, exist_ok=True)
+
+  def __getstate__(self) -> Dict[str, Any]:
+    # locks cannot be pickled, e.g., to pass the cache to worker processes
+    state = self.__dict__.copy()
+    del state['_lock']
+    return state
+
+  def __setstate__(self, state: Dict[str, Any]) -> None:
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def _get_entry(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key[:2], key)
+
+  def get_path(self, key: str) -> Optional[str]:
+    """Return the path of the entry and mark it as recently used, if any."""
+    entry = self._get_entry(key)
+    try:
+      os.utime(entry)
+    except FileNotFoundError:
+      return None
+    return entry
+
+  def get(self, key: str, fileobj: BinaryIO) -> bool:
+    """Copy the entry to fileobj.
+
+    Returns:
+      bool: True if it is a hit, False otherwise.
+    """
+    entry = self.get_path(key)
+    if entry is None:
+      return False
+    try:
+      with open(entry, 'rb') as entry_fileobj:
+        shutil.copyfileobj(entry_fileobj, fileobj)
+    except FileNotFoundError:
+      # evicted by a concurrent process
+      return False
+    return True
+
+  def put(self, key: str, fileobj: BinaryIO) -> None:
+    """Store the content of fileobj as the entry of key.
+
+    The entry is written to a temporary file first and then renamed, so
+    concurrent readers never observe a partially written entry.
+
+    The cache directory is scanned for eviction only when the running total of
+    the entry sizes exceeds max_size.
+    """
+    entry = self._get_entry(key)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(entry),
+                                     prefix=f'.{key}.',
+                                     delete=False) as tmp_fileobj:
+      shutil.copyfileobj(fileobj, tmp_fileobj)
+      size = tmp_fileobj.tell()
+    os.replace(tmp_fileobj.name, entry)
+    if not self.max_size:
+      return
+    with self._lock:
+      if self._size is not None:
+        self._size += size
+      if self._size is None or self._size > self.max_size:
+        self._evict()
+
+  def evict(self) -> None:
+    """Remove the least recently used entries if max_size is exceeded.
+
+    Entries are removed until the total size is at most a fraction of
+    max_size, which leaves room for more puts before the next scan. The
+    running total is reset to the scanned size, which also accounts for entries
+    written or removed by other processes.
+    """
+    if not self.max_size:
+      return
+    with self._lock:
+      self._evict()
+
+  def _evict(self) -> None:
+    entries: List[Tuple[float, int, str]] = []
+    for dirpath, _, filenames in os.walk(self.cache_dir):
+      for filename in filenames:
+        if filename.startswith('.'):
+          continue
+        path = os.path.join(dirpath, filename)
+        try:
+          stat = os.stat(path)
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    if total_size > self.max_size:
+      target_size = int(self.max_size * _EVICT_LOW_WATERMARK)
+    else:
+      target_size = total_size
+    for _, size, path in sorted(entries):
+      if total_size <= target_size:
+        break
+      _logger.debug('evicting %s from cache', path)
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total_size -= size
+    self._size = total_size
+
+
+class Manifest:
+  """Keys and digests of the artifacts of a build, persisted as a JSON file.
+
+  An artifact is valid only if it was produced from inputs of the same key and
+  its content still has the recorded digest, so truncated or stale files are
+  never mistaken for results. The file is rewritten atomically on each update.
+
+  Attributes:
+    filename: Path to the JSON file.
+  """
+
+  def __init__(self, filename: str):
+    self.filename = filename
+    self._lock = threading.Lock()
+    self._entries: Dict[str, Dict[str, Any]] = {}
+    try:
+      with open(filename) as fileobj:
+        self._entries = json.load(fileobj)
+    except FileNotFoundError:
+      pass
+    except ValueError as e:
+      _logger.warning('ignoring malformed manifest %s: %s', filename, e)
+
+  def is_valid(self, name: str, key: str, path: str) -> bool:
+    """Whether path is an intact artifact of name produced from key."""
+    with self._lock:
+      entry = self._entries.get(name)
+    if entry is None or entry.get('key') != key:
+      return False
+    try:
+      if os.path.getsize(path) != entry.get('size'):
+        return False
+      return get_file_digest(path) == entry.get('digest')
+    except OSError:
+      return False
+
+  def put(self, name: str, key: str, path: str) -> None:
+    """Record path as the artifact of name produced from key."""
+    entry = {
+        'key': key,
+        'size': os.path.getsize(path),
+        'digest': get_file_digest(path),
+    }
+    with self._lock:
+      self._entries[name] = entry
+      self._save()
+
+  def remove(self, name: str) -> None:
+    """Invalidate the artifact of name, if any."""
+    with self._lock:
+      if self._entries.pop(name, None) is not None:
+        self._save()
+
+  def _save(self) -> None:
+    _dump_json(self._entries, self.filename)
+
+
+class ProbeCache:
+  """Results of probing the environment, persisted as a JSON file.
+
+  A result is reused only if it was probed with the same key and none of the
+  files it was derived from has been modified, created, or removed since, as
+  told by their modification times and sizes.
+
+  The file may be shared by concurrent processes; `put` merges the results of
+  this process into the latest content of the file.
+
+  Attributes:
+    filename: Path to the JSON file.
+  """
+
+  def __init__(self, filename: str):
+    self.filename = filename
+    self._lock = threading.Lock()
+    self._entries: Dict[str, Dict[str, Any]] = self._load()
+    self._updates: Dict[str, Dict[str, Any]] = {}
+
+  def _load(self) -> Dict[str, Dict[str, Any]]:
+    try:
+      with open(self.filename) as fileobj:
+        return json.load(fileobj)
+    except FileNotFoundError:
+      return {}
+    except ValueError as e:
+      _logger.warning('ignoring malformed probe cache %s: %s', self.filename, e)
+      return {}
+
+  def get(self, name: str, key: Any) -> Optional[Any]:
+    """Return the result of probe name with key, or None if it is stale."""
+    with self._lock:
+      entry = self._entries.get(name)
+    if entry is None or entry.get('key') != get_key(key):
+      return None
+    stamps = entry.get('stamps', {})
+    if any(_get_stamp(path) != stamp for path, stamp in stamps.items()):
+      return None
+    _logger.debug('reusing cached result of probing %s', name)
+    return entry.get('value')
+
+  def put(self, name: str, key: Any, value: Any,
+          paths: Iterable[str] = ()) -> None:
+    """Record value as the result of probe name with key.
+
+    Args:
+      name: Name of the probe.
+      key: JSON-serializable inputs of the probe.
+      value: JSON-serializable result of the probe.
+      paths: Files or directories the result is derived from; they need not
+          exist.
+    """
+    entry = {
+        'key': get_key(key),
+        'stamps': {path: _get_stamp(path) for path in paths},
+        'value': value,
+    }
+    with self._lock:
+      self._updates[name] = entry
+      self._entries = self._load()
+      self._entries.update(self._updates)
+      _dump_json(self._entries, self.filename)
+
+
+def _get_stamp(path: str) -> Optional[List[int]]:
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return [stat.st_mtime_ns, stat.st_size]
+
+
+def _dump_json(obj: Any, filename: str) -> None:
+  """Write obj to filename atomically."""
+  dirname = os.path.dirname(os.path.abspath(filename))
+  os.makedirs(dirname, exist_ok=True)
+  with tempfile.NamedTemporaryFile('w',
+                                   dir=dirname,
+                                   prefix=f'.{os.path.basename(filename)}.',
+                                   delete=False) as fileobj:
+    json.dump(obj, fileobj, indent=2, sort_keys=True)
+  os.replace(fileobj.name, filename)
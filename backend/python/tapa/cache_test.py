@@ -0,0 +1,178 @@
+# pylint: disable=protected-access
+
+import io
+import os
+import pickle
+import tempfile
+import unittest
+import unittest.mock
+
+from tapa import cache as cache_lib
+
+
+class TempDirTestCase(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-cache-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.tmpdir = tmpdir.name
+
+  def write_file(self, name: str, content: bytes) -> str:
+    path = os.path.join(self.tmpdir, name)
+    with open(path, 'wb') as fileobj:
+      fileobj.write(content)
+    return path
+
+
+class CacheTest(TempDirTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.cache = cache_lib.Cache(os.path.join(self.tmpdir, 'cache'),
+                                 max_size=1000)
+    self.keys = [cache_lib.get_key('entry', i) for i in range(11)]
+
+  def put(self, idx: int, mtime: float) -> None:
+    self.cache.put(self.keys[idx], io.BytesIO(b'x' * 100))
+    # make the order of use deterministic
+    path = self.cache.get_path(self.keys[idx])
+    os.utime(path, (mtime, mtime))
+
+  def get_hits(self):
+    # unlike get_path, this does not mark the entries as recently used
+    return [os.path.exists(self.cache._get_entry(key)) for key in self.keys]
+
+  def test_get_and_put(self):
+    fileobj = io.BytesIO()
+    self.assertFalse(self.cache.get(self.keys[0], fileobj))
+    self.cache.put(self.keys[0], io.BytesIO(b'foo'))
+    self.assertTrue(self.cache.get(self.keys[0], fileobj))
+    self.assertEqual(fileobj.getvalue(), b'foo')
+
+  def test_evict_to_low_watermark(self):
+    with unittest.mock.patch.object(self.cache,
+                                    '_evict',
+                                    wraps=self.cache._evict) as evict:
+      for idx in range(10):
+        self.put(idx, mtime=1000 + idx)
+      # the first put scans the cache, and later puts fit in the limit
+      self.assertEqual(evict.call_count, 1)
+      self.assertEqual(self.get_hits(), [True] * 10 + [False])
+
+      # entry 0 was used most recently
+      os.utime(self.cache.get_path(self.keys[0]), (2000, 2000))
+      self.put(10, mtime=3000)
+      self.assertEqual(evict.call_count, 2)
+
+    # evicted to at most 90% of the limit, least recently used first
+    self.assertEqual(self.get_hits(), [True, False, False] + [True] * 8)
+
+  def test_evict_counts_entries_of_other_processes(self):
+    self.put(0, mtime=1000)
+    other = cache_lib.Cache(self.cache.cache_dir, max_size=1000)
+    for idx in range(1, 10):
+      other.put(self.keys[idx], io.BytesIO(b'x' * 100))
+    self.put(10, mtime=3000)
+    self.assertEqual(self.get_hits(), [True] * 11)
+    # the running total of this process is only corrected by a scan
+    self.cache.evict()
+    self.assertEqual(self.get_hits().count(True), 9)
+
+  def test_pickle(self):
+    self.put(0, mtime=1000)
+    cache = pickle.loads(pickle.dumps(self.cache))
+    self.assertEqual(cache.cache_dir, self.cache.cache_dir)
+    self.assertIsNotNone(cache.get_path(self.keys[0]))
+    for idx in range(1, 11):
+      cache.put(self.keys[idx], io.BytesIO(b'x' * 100))
+    self.assertEqual(self.get_hits().count(True), 9)
+
+
+class ManifestTest(TempDirTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.filename = os.path.join(self.tmpdir, 'manifest.json')
+    self.artifact = self.write_file('foo.tar', b'foo')
+    self.manifest = cache_lib.Manifest(self.filename)
+    self.manifest.put('foo', 'key', self.artifact)
+
+  def test_valid(self):
+    self.assertTrue(self.manifest.is_valid('foo', 'key', self.artifact))
+    # the manifest is persisted
+    self.assertTrue(
+        cache_lib.Manifest(self.filename).is_valid('foo', 'key', self.artifact))
+
+  def test_unknown_name_or_key(self):
+    self.assertFalse(self.manifest.is_valid('bar', 'key', self.artifact))
+    self.assertFalse(self.manifest.is_valid('foo', 'other', self.artifact))
+
+  def test_truncated_artifact(self):
+    self.write_file('foo.tar', b'fo')
+    self.assertFalse(self.manifest.is_valid('foo', 'key', self.artifact))
+
+  def test_stale_artifact(self):
+    # same size but different content
+    self.write_file('foo.tar', b'bar')
+    self.assertFalse(self.manifest.is_valid('foo', 'key', self.artifact))
+
+  def test_missing_artifact(self):
+    os.remove(self.artifact)
+    self.assertFalse(self.manifest.is_valid('foo', 'key', self.artifact))
+
+  def test_remove(self):
+    self.manifest.remove('foo')
+    self.assertFalse(self.manifest.is_valid('foo', 'key', self.artifact))
+    self.assertFalse(
+        cache_lib.Manifest(self.filename).is_valid('foo', 'key', self.artifact))
+
+  def test_malformed_manifest(self):
+    self.write_file('manifest.json', b'{')
+    manifest = cache_lib.Manifest(self.filename)
+    self.assertFalse(manifest.is_valid('foo', 'key', self.artifact))
+
+
+class ProbeCacheTest(TempDirTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.filename = os.path.join(self.tmpdir, 'probe.json')
+
+  def test_get_and_put(self):
+    probe_cache = cache_lib.ProbeCache(self.filename)
+    self.assertIsNone(probe_cache.get('foo', ['key']))
+    probe_cache.put('foo', ['key'], {'version': 1})
+    self.assertEqual(probe_cache.get('foo', ['key']), {'version': 1})
+    self.assertIsNone(probe_cache.get('foo', ['other']))
+    self.assertEqual(
+        cache_lib.ProbeCache(self.filename).get('foo', ['key']), {'version': 1})
+
+  def test_stale_paths(self):
+    tool = self.write_file('tool', b'v1')
+    missing = os.path.join(self.tmpdir, 'missing')
+    probe_cache = cache_lib.ProbeCache(self.filename)
+    probe_cache.put('foo', 'key', 'v1', paths=[tool, missing])
+    self.assertEqual(probe_cache.get('foo', 'key'), 'v1')
+
+    self.write_file('tool', b'v22')
+    self.assertIsNone(probe_cache.get('foo', 'key'))
+
+    probe_cache.put('foo', 'key', 'v22', paths=[tool, missing])
+    self.write_file('missing', b'')
+    self.assertIsNone(probe_cache.get('foo', 'key'))
+
+  def test_merge_on_put(self):
+    first = cache_lib.ProbeCache(self.filename)
+    second = cache_lib.ProbeCache(self.filename)
+    first.put('foo', 'key', 'foo')
+    second.put('bar', 'key', 'bar')
+    # each put keeps the results of other processes and its own earlier puts
+    first.put('baz', 'key', 'baz')
+    probe_cache = cache_lib.ProbeCache(self.filename)
+    for name in 'foo', 'bar', 'baz':
+      self.assertEqual(probe_cache.get(name, 'key'), name)
+    self.assertEqual(first.get('bar', 'key'), 'bar')
+
+
+if __name__ == '__main__':
+  unittest.main()
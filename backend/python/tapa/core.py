@@ -1,21 +1,29 @@
 import collections
+import functools
+import glob
+import io
 import json
 import logging
 import os.path
+import posixpath
+import queue
+import re
 import shutil
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import xml.etree.ElementTree as ET
 from concurrent import futures
-from typing import (Any, BinaryIO, Dict, List, Optional, Set, TextIO, Tuple,
-                    Union)
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, List, Optional,
+                    Set, TextIO, Tuple, Union)
 
 import toposort
-from haoda.backend import xilinx as hls
 
 import tapa.autobridge as autobridge
-from tapa import util
+from tapa import cache as cache_lib
+from tapa import hls_executor, scheduler, util
 from tapa.verilog import ast
 from tapa.verilog import xilinx as rtl
 
@@ -126,69 +134,548 @@ class Program:
     os.makedirs(os.path.join(self.work_dir, 'tar'), exist_ok=True)
     return os.path.join(self.work_dir, 'tar', name + '.tar')
 
+  def get_tmp_tar(self, name: str) -> str:
+    os.makedirs(os.path.join(self.work_dir, 'tar'), exist_ok=True)
+    return os.path.join(self.work_dir, 'tar', '.' + name + '.tar.tmp')
+
+  @property
+  def tar_manifest(self) -> str:
+    return os.path.join(self.work_dir, 'tar', 'manifest.json')
+
+  def get_log(self, name: str) -> str:
+    # `log/<task>.log` is extracted from the HLS tarball
+    os.makedirs(os.path.join(self.work_dir, 'log'), exist_ok=True)
+    return os.path.join(self.work_dir, 'log', name + '.hls.log')
+
   def get_rtl(self, name: str, prefix: bool = True) -> str:
     return os.path.join(self.rtl_dir,
                         (util.get_module_name(name) if prefix else name) +
                         rtl.RTL_SUFFIX)
 
+  def get_report(self, name: str) -> str:
+    return os.path.join(self.work_dir, 'report', f'{name}_csynth.xml')
+
   def get_area(self, name: str) -> Dict[str, int]:
-    filename = os.path.join(self.work_dir, 'report', f'{name}_csynth.xml')
-    node = ET.parse(filename).find('./AreaEstimates/Resources')
-    return {x.tag: int(x.text) for x in sorted(node, key=lambda x: x.tag)}
+    return _read_area(self.get_report(name))
 
-  def extract_cpp(self) -> 'Program':
-    """Extract HLS C++ files."""
+  def extract_cpp(
+      self,
+      probe_cache: Optional[cache_lib.ProbeCache] = None,
+      cache: Optional[cache_lib.Cache] = None,
+      max_workers: Optional[int] = None,
+  ) -> 'Program':
+    """Extract HLS C++ files.
+
+    Tasks are formatted by clang-format subprocesses in a thread pool. Files
+    that already have the extracted content are not rewritten, so their
+    modification times stay stable for incremental builds.
+
+    Args:
+      probe_cache: Optional cache of the location of clang-format.
+      cache: Optional cache of the formatted code of tasks.
+      max_workers: Maximum number of concurrent clang-format processes.
+    """
     _logger.info('extracting HLS C++ files')
-    for task in self._tasks.values():
-      with open(self.get_cpp(task.name), 'w') as src_code:
-        src_code.write(util.clang_format(task.code))
+    # probe clang-format once so that the threads reuse the cached result
+    util.find_clang_format(probe_cache)
+    task_list = list(self._tasks.values())
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+      codes = pool.map(
+          functools.partial(util.clang_format,
+                            probe_cache=probe_cache,
+                            cache=cache),
+          [x.code for x in task_list],
+      )
+      for task, code in zip(task_list, codes):
+        _write_if_changed(self.get_cpp(task.name), code)
     for name, content in self.headers.items():
       header_path = os.path.join(self.cpp_dir, name)
       os.makedirs(os.path.dirname(header_path), exist_ok=True)
-      with open(header_path, 'w') as header_fp:
-        header_fp.write(content)
+      _write_if_changed(header_path, content)
     return self
 
-  def run_hls(self, clock_period: Union[int, float, str],
-              part_num: str) -> 'Program':
-    """Run HLS with extracted HLS C++ files and generate tarballs."""
+  def get_hls_key(
+      self,
+      task: Task,
+      clock_period: Union[int, float, str],
+      part_num: str,
+      hls: str = 'vitis_hls',
+  ) -> str:
+    """Return the key of a task's HLS result from all inputs that affect it."""
+    return cache_lib.get_key(
+        task.name,
+        task.code,
+        self.headers,
+        self.cflags,
+        str(clock_period),
+        part_num,
+        _get_hls_version(hls),
+        _get_assets_digest(),
+    )
+
+  def get_normalized_hls_key(
+      self,
+      task: Task,
+      clock_period: Union[int, float, str],
+      part_num: str,
+      hls: str = 'vitis_hls',
+  ) -> str:
+    """Return a key shared by tasks whose HLS inputs differ only in the name."""
+    return cache_lib.get_key(
+        re.sub(_get_identifier_pattern(task.name), '\0', task.code),
+        self.headers,
+        self.cflags,
+        str(clock_period),
+        part_num,
+        _get_hls_version(hls),
+        _get_assets_digest(),
+    )
+
+  def run_hls(
+      self,
+      clock_period: Union[int, float, str],
+      part_num: str,
+      cache: Optional[cache_lib.Cache] = None,
+      history_file: Optional[str] = None,
+      hls: str = 'vitis_hls',
+      executor: Optional[hls_executor.HlsExecutor] = None,
+      progress_interval: float = 10.,
+      keep_going: bool = False,
+      retry_policy: scheduler.RetryPolicy = scheduler.RetryPolicy(),
+      resume: bool = False,
+      dedup: bool = True,
+      hls_upper_tasks: bool = False,
+      on_task_done: Optional[Callable[[str], None]] = None,
+  ) -> 'Program':
+    """Run HLS with extracted HLS C++ files and generate tarballs.
+
+    Tasks are dispatched in descending order of their predicted HLS time so
+    that long tasks do not start last. The wall time and peak memory of each
+    task are recorded to improve the predictions of future runs. By default,
+    HLS runs on this host and the number of concurrent HLS jobs adapts to the
+    free memory and load of the host. The output of HLS is streamed to
+    `log/<task>.hls.log` in the working directory, and the latest progress of
+    each task is logged at most every `progress_interval` seconds.
+
+    Unless `keep_going` is set, the first task that fails HLS cancels the tasks
+    that have not started and terminates the running ones, so that the failure
+    is reported without waiting for the other tasks. Tarballs of failed and
+    terminated tasks are removed.
+
+    Failures that are likely caused by an overloaded host are retried according
+    to `retry_policy`, and each of them lowers the number of concurrent jobs.
+    The number of retries of each task and the time they cost are included in
+    `hls_schedule.json` in the working directory.
+
+    Tarballs are written to temporary files and renamed once complete, and are
+    recorded in a manifest with the key of their inputs and their digest. If
+    `resume` is set, tasks whose tarballs are valid per the manifest are not
+    synthesized again, so an interrupted run can be continued.
+
+    If `dedup` is set, tasks whose code is identical except for the task name,
+    e.g., instances of the same template, are synthesized only once. The
+    tarballs of the others are derived by renaming the top module.
+
+    Unless `hls_upper_tasks` is set, upper-level tasks do not run HLS. Their
+    tarballs contain shells generated from the ports of the tasks instead, since
+    the logic HLS generates for them is removed when the RTL is instrumented.
+
+    Args:
+      clock_period: Target clock period.
+      part_num: Target part number.
+      cache: Optional cache of HLS tarballs. If given, tasks whose inputs are
+          unchanged reuse the cached tarballs instead of running HLS.
+      history_file: Optional JSON file of the HLS history, which may be shared
+          by different programs. Defaults to one in the working directory.
+      hls: Name of the HLS executable, e.g., `tapa-fake-hls` for testing.
+      executor: Optional executor of HLS jobs, e.g., a
+          `hls_executor.RemoteExecutor` that runs HLS on other hosts. Defaults
+          to a `hls_executor.LocalExecutor`.
+      progress_interval: Minimum interval in seconds between two progress
+          messages of the same task.
+      keep_going: Whether to run all tasks even if some of them fail, e.g., to
+          find all failures in continuous integration.
+      retry_policy: Policy of retrying flaky HLS failures.
+      resume: Whether to reuse valid tarballs of a previous run.
+      dedup: Whether to synthesize tasks with identical code only once.
+      hls_upper_tasks: Whether to run HLS for upper-level tasks instead of
+          generating their shells.
+      on_task_done: Optional callback that is called with the name of each task
+          once its tarball is ready. It is called from the HLS threads, and an
+          exception raised by it fails the task.
+
+    Returns:
+      Program: Return self.
+    """
     _logger.info('running HLS')
+    history = scheduler.History(history_file or
+                                os.path.join(self.work_dir, 'hls_history.json'))
+    predictions = {
+        task.name: history.predict(task.name, len(task.code))
+        for task in self._tasks.values()
+    }
+    manifest = cache_lib.Manifest(self.tar_manifest)
+    job_stats: Dict[str, scheduler.JobStats] = {}
+    attempts: Dict[str, int] = {}
+    retry_times: Dict[str, float] = {}
+    elapsed_times: Dict[str, float] = {}
+    cancelled = threading.Event()
+    shells: Set[str] = set()
+    if not hls_upper_tasks:
+      shells.update(x.name
+                    for x in self._tasks.values()
+                    if x.is_upper and self._is_shell_supported(x))
+
+    def get_key(task: Task) -> str:
+      key = self.get_hls_key(task, clock_period, part_num, hls)
+      if task.name in shells:
+        # a shell is not a valid HLS result of the same inputs
+        key = cache_lib.get_key(key, 'shell')
+      return key
+
+    def get_progress_reporter(task: Task) -> Optional[Callable[[str], None]]:
+      if not _logger.isEnabledFor(logging.INFO):
+        return None
+      last_time = -progress_interval
+
+      def report_progress(message: str) -> None:
+        nonlocal last_time
+        now = time.monotonic()
+        if now - last_time >= progress_interval:
+          last_time = now
+          _logger.info('HLS progress of %s: %s', task.name, message)
+
+      return report_progress
+
+    # tasks that differ only in their names are synthesized only once
+    duplicates: Dict[str, List[Task]] = collections.OrderedDict(
+        (x.name, []) for x in self._tasks.values())
+    if dedup:
+      representatives: Dict[str, Task] = {}
+      for task in self._tasks.values():
+        if task.name in shells:
+          continue  # generating shells is cheaper than renaming them
+        representative = representatives.setdefault(
+            self.get_normalized_hls_key(task, clock_period, part_num, hls),
+            task)
+        if representative is not task:
+          del duplicates[task.name]
+          duplicates[representative.name].append(task)
+      for name, tasks in duplicates.items():
+        if tasks:
+          _logger.info('synthesizing %s for %s', name,
+                       ', '.join(x.name for x in tasks))
+
+    def derive(task: Task, duplicate: Task) -> None:
+      key = get_key(duplicate)
+      tar = self.get_tar(duplicate.name)
+      tmp_tar = self.get_tmp_tar(duplicate.name)
+      if resume and manifest.is_valid(duplicate.name, key, tar):
+        return
+      manifest.remove(duplicate.name)
+      try:
+        with open(tmp_tar, 'wb') as tarfileobj:
+          _rename_hls_tar(self.get_tar(task.name), tarfileobj, task.name,
+                          duplicate.name)
+      except BaseException:
+        if os.path.exists(tmp_tar):
+          os.remove(tmp_tar)
+        raise
+      os.replace(tmp_tar, tar)
+      manifest.put(duplicate.name, key, tar)
 
     def worker(task: Task) -> None:
-      with open(self.get_tar(task.name), 'wb') as tarfileobj:
-        with hls.RunHls(
-            tarfileobj,
-            kernel_files=[(self.get_cpp(task.name), self.cflags)],
-            top_name=task.name,
-            clock_period=clock_period,
-            part_num=part_num,
-            auto_prefix=True,
-            hls='vitis_hls',
-        ) as proc:
-          stdout, stderr = proc.communicate()
-      if proc.returncode != 0:
-        if b'Pre-synthesis failed.' in stdout and b'\nERROR:' not in stdout:
-          _logger.error(
-              'HLS failed for %s, but the failure may be flaky; retrying',
-              task.name,
-          )
-          worker(task)
+      synthesize(task)
+      if on_task_done is not None:
+        on_task_done(task.name)
+      for duplicate in duplicates[task.name]:
+        derive(task, duplicate)
+        if on_task_done is not None:
+          on_task_done(duplicate.name)
+
+    def synthesize(task: Task) -> None:
+      key = get_key(task)
+      tar = self.get_tar(task.name)
+      tmp_tar = self.get_tmp_tar(task.name)
+      if resume and manifest.is_valid(task.name, key, tar):
+        _logger.info('reusing HLS result of %s from a previous run', task.name)
+        return
+      manifest.remove(task.name)
+
+      def remove_tars() -> None:
+        # neither a partial nor an outdated tarball is a valid result
+        for filename in tmp_tar, tar:
+          if os.path.exists(filename):
+            os.remove(filename)
+
+      if task.name in shells:
+        _logger.info('generating the shell of %s without HLS', task.name)
+        try:
+          with open(tmp_tar, 'wb') as tarfileobj:
+            self._write_shell_tar(task, tarfileobj)
+          os.replace(tmp_tar, tar)
+          manifest.put(task.name, key, tar)
+        except BaseException:
+          remove_tars()
+          raise
+        return
+      if cache is not None:
+        try:
+          with open(tmp_tar, 'wb') as tarfileobj:
+            is_hit = cache.get(key, tarfileobj)
+          if is_hit:
+            _logger.info('reusing cached HLS result for %s', task.name)
+            os.replace(tmp_tar, tar)
+            manifest.put(task.name, key, tar)
+        except BaseException:
+          remove_tars()
+          raise
+        if is_hit:
           return
-        sys.stdout.write(stdout.decode('utf-8'))
-        sys.stderr.write(stderr.decode('utf-8'))
-        raise RuntimeError('HLS failed for {}'.format(task.name))
-
-    # Vitis HLS often fails with "Pre-synthesis failed" when the load is high.
-    # Use a simple heuristic to avoid that.
-    max_workers = max(1, os.cpu_count() - int(os.getloadavg()[0]))
-    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-      tasks = [executor.submit(worker, x) for x in self._tasks.values()]
-      futures.wait(tasks)
+      job = hls_executor.HlsJob(
+          top_name=task.name,
+          cpp_dir=self.cpp_dir,
+          cpp_file=os.path.basename(self.get_cpp(task.name)),
+          header_files=tuple(self.headers),
+          cflags=self.cflags,
+          clock_period=str(clock_period),
+          part_num=part_num,
+          hls=hls,
+          predicted_rss=predictions[task.name].peak_rss,
+      )
+      first_start_time = time.monotonic()
+      attempt = 0
+      try:
+        while True:
+          attempt += 1
+          attempts[task.name] = attempt
+          if attempt > 1:
+            retry_times[task.name] = time.monotonic() - first_start_time
+          with open(tmp_tar, 'wb') as tarfileobj, \
+              open(self.get_log(task.name), 'wb') as logfileobj:
+            log = hls_executor.HlsLog(logfileobj, get_progress_reporter(task))
+            result = executor.run(job, tarfileobj, log)
+          if result.returncode == 0:
+            break
+          if log.is_flaky and attempt < retry_policy.max_attempts:
+            delay = retry_policy.get_delay(attempt)
+            _logger.error(
+                'HLS failed for %s, but the failure may be flaky; retrying in '
+                '%.1f s (attempt %d of %d)',
+                task.name,
+                delay,
+                attempt + 1,
+                retry_policy.max_attempts,
+            )
+            # flaky failures are usually caused by an overloaded host
+            executor.throttle()
+            if cancelled.wait(delay):
+              raise futures.CancelledError()
+            continue
+          sys.stderr.write(b''.join(log.error_lines or
+                                    log.tail).decode('utf-8', 'replace'))
+          raise RuntimeError('HLS failed for {}{}; see {} for details'.format(
+              task.name,
+              f' after {attempt} attempts' if log.is_flaky else '',
+              self.get_log(task.name),
+          ))
+      except BaseException:
+        remove_tars()
+        raise
+      finally:
+        elapsed_times[task.name] = time.monotonic() - first_start_time
+      # the tarball appears only when it is complete
+      os.replace(tmp_tar, tar)
+      manifest.put(task.name, key, tar)
+      stats = scheduler.JobStats(
+          code_size=len(task.code),
+          wall_time=result.wall_time,
+          peak_rss=result.peak_rss,
+      )
+      history.record(task.name, stats)
+      job_stats[task.name] = stats
+      executor.recover()
+      if cache is not None:
+        with open(tar, 'rb') as tarfileobj:
+          cache.put(key, tarfileobj)
+
+    # Vitis HLS often fails with "Pre-synthesis failed" when the load is high,
+    # and may run out of memory on shared hosts. The local executor admits jobs
+    # only if the host can afford them.
+    if executor is None:
+      executor = hls_executor.LocalExecutor()
+    max_workers = executor.max_jobs
+    errors: Dict[str, BaseException] = collections.OrderedDict()
+
+    def cancel(tasks: Iterable[futures.Future]) -> None:
       for task in tasks:
-        task.result()
+        task.cancel()
+      cancelled.set()
+      executor.cancel()
+
+    start_time = time.monotonic()
+    try:
+      with executor:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+          # the pool starts jobs in the order of submission
+          tasks = collections.OrderedDict(
+              (pool.submit(worker, x), x.name) for x in scheduler.sort_by_cost(
+                  (self._tasks[x] for x in duplicates),
+                  lambda x: predictions[x.name].wall_time,
+              ))
+          try:
+            for task in futures.as_completed(tasks):
+              if task.cancelled():
+                continue
+              error = task.exception()
+              if error is None or isinstance(error, futures.CancelledError):
+                continue
+              _logger.error('%s', error)
+              errors[tasks[task]] = error
+              if not keep_going and len(errors) == 1:
+                _logger.error('cancelling the remaining HLS tasks')
+                cancel(tasks)
+          except BaseException:
+            cancel(tasks)
+            raise
+    finally:
+      history.save()
+      self._report_hls_schedule(
+          job_stats,
+          predictions,
+          max_workers,
+          time.monotonic() - start_time,
+          attempts,
+          retry_times,
+          elapsed_times,
+          errors,
+      )
+    if len(errors) == 1:
+      raise next(iter(errors.values()))
+    if errors:
+      raise RuntimeError('HLS failed for {} tasks: {}'.format(
+          len(errors), ', '.join(errors))) from next(iter(errors.values()))
 
     return self
 
+  def _is_shell_supported(self, task: Task) -> bool:
+    """Return whether the ports of an upper-level task describe its module.
+
+    The shell of a task is generated from its ports, which are not reported
+    precisely for some kinds of arguments, e.g., arrays of streams. Such tasks
+    fall back to HLS. An argument passed to a child is checked if it is neither
+    a FIFO declared in the task nor a constant.
+    """
+    if task.name == self.top and any(
+        rtl.match_array_name(x.name) is not None
+        for x in self.toplevel_ports
+        if x.cat in {Instance.Arg.Cat.ISTREAM, Instance.Arg.Cat.OSTREAM}):
+      return False
+    for objs in task.tasks.values():
+      for obj in objs:
+        for arg in obj['args'].values():
+          if "'d" in arg['arg'] or 'depth' in task.fifos.get(arg['arg'], {}):
+            continue
+          port = task.ports.get(rtl.sanitize_array_name(arg['arg']))
+          is_stream = arg['cat'] in {'istream', 'ostream'}
+          if port is None or is_stream != (port.cat in {
+              Instance.Arg.Cat.ISTREAM,
+              Instance.Arg.Cat.OSTREAM,
+          }):
+            _logger.info(
+                'running HLS for %s because its port %s is not recognized',
+                task.name, arg['arg'])
+            return False
+    return True
+
+  def _write_shell_tar(self, task: Task, tarfileobj: BinaryIO) -> None:
+    """Write a tarball of the shell of an upper-level task, as HLS would."""
+    is_top = task.name == self.top
+    module_name = util.get_module_name(task.name)
+    files = {
+        f'hdl/{module_name}{rtl.RTL_SUFFIX}':
+            rtl.generate_upper_shell(module_name, task.ports.values(), is_top),
+    }
+    area = dict.fromkeys(('BRAM_18K', 'DSP', 'FF', 'LUT', 'URAM'), 0)
+    if is_top:
+      files[f'hdl/{module_name}_control_s_axi{rtl.RTL_SUFFIX}'] = (
+          rtl.generate_control_s_axi(module_name, task.ports.values()))
+      # rough estimate of the control interface: a flip-flop for each bit of
+      # the argument registers and the read data, and as many LUTs
+      area['FF'] = area['LUT'] = 32 * (1 + sum(
+          words
+          for _, _, words in rtl.get_s_axi_registers(task.ports.values())))
+    files[f'report/{task.name}_csynth.xml'] = _SHELL_REPORT.format(**area)
+    with tarfile.open(mode='w', fileobj=tarfileobj) as tar:
+      for name, content in files.items():
+        data = content.encode('utf-8')
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+
+  def _report_hls_schedule(
+      self,
+      job_stats: Dict[str, scheduler.JobStats],
+      predictions: Dict[str, scheduler.JobStats],
+      workers: int,
+      makespan: float,
+      attempts: Dict[str, int],
+      retry_times: Dict[str, float],
+      elapsed_times: Dict[str, float],
+      errors: Dict[str, BaseException],
+  ) -> None:
+    """Compare the HLS makespan with its lower bound and write a report.
+
+    The report includes every task that ran HLS, whether it succeeded, failed,
+    or was cancelled, with its number of attempts, the time from its first
+    attempt to its last attempt if retried, and the time from its first attempt
+    to its end.
+    """
+    if not attempts:
+      return
+    lower_bound = scheduler.get_makespan_lower_bound(
+        (x.wall_time for x in job_stats.values()), workers)
+    _logger.info(
+        'HLS makespan: %.1f s; lower bound: %.1f s (%.0f%% efficient)',
+        makespan,
+        lower_bound,
+        100 * lower_bound / makespan if makespan > 0 else 100,
+    )
+    total_retries = sum(x - 1 for x in attempts.values())
+    total_retry_time = sum(retry_times.values(), 0.)
+    if total_retries > 0:
+      _logger.warning('%d flaky HLS failures cost %.1f s of HLS time',
+                      total_retries, total_retry_time)
+    tasks: Dict[str, Dict[str, Any]] = {}
+    for name, attempt in attempts.items():
+      stats = job_stats.get(name)
+      if stats is not None:
+        status = 'succeeded'
+      elif name in errors:
+        status = 'failed'
+      else:
+        status = 'cancelled'
+      tasks[name] = {
+          'status': status,
+          'predicted_wall_time': predictions[name].wall_time,
+          **(stats._asdict() if stats is not None else {}),
+          'attempts': attempt,
+          'retries': attempt - 1,
+          'retry_time': retry_times.get(name, 0.),
+          'elapsed_time': elapsed_times.get(name, 0.),
+      }
+    report = {
+        'makespan': makespan,
+        'lower_bound': lower_bound,
+        'workers': workers,
+        'retries': total_retries,
+        'retry_time': total_retry_time,
+        'tasks': tasks,
+    }
+    with open(os.path.join(self.work_dir, 'hls_schedule.json'), 'w') as fp:
+      json.dump(report, fp, indent=2)
+
   def extract_rtl(self) -> 'Program':
     """Extract HDL files from tarballs generated from HLS."""
     _logger.info('extracting RTL files')
@@ -201,28 +688,51 @@ class Program:
       self,
       directive: Optional[Dict[str, Any]] = None,
       register_level: int = 0,
+      cache: Optional[cache_lib.Cache] = None,
   ) -> 'Program':
     """Instrument HDL files generated from HLS.
 
     Args:
         directive: Optional, if given it should a tuple of json object and file.
         register_level: Non-zero value overrides self.register_level.
+        cache: Optional cache of parsed Verilog ASTs.
 
     Returns:
         Program: Return self.
     """
     # extract and parse RTL and populate tasks
     _logger.info('parsing RTL files and populating tasks')
-    oldcwd = os.getcwd()
-    os.chdir(self.work_dir)
+    self._parse_tasks(self._tasks.values(), cache)
     for task in self._tasks.values():
-      _logger.debug('parsing %s', task.name)
-      task.module = rtl.Module([self.get_rtl(task.name)])
-      task.self_area = self.get_area(task.name)
       _logger.debug('populating %s', task.name)
       self._populate_task(task)
-    os.chdir(oldcwd)
 
+    # tasks are in topological order, so children are rolled up before parents
+    for task in self._tasks.values():
+      task.compute_total_area()
+      _logger.debug('total area of %s: %s', task.name, task.total_area)
+
+    self._settle_register_level(directive, register_level)
+
+    # instrument the upper-level RTL
+    _logger.info('instrumenting upper-level RTL')
+    for task in self._tasks.values():
+      if task.is_upper:
+        self._instrument_upper_task(task)
+
+    self._write_rtl_assets()
+    return self
+
+  def _settle_register_level(
+      self,
+      directive: Optional[Dict[str, Any]],
+      register_level: int,
+  ) -> None:
+    """Apply the partitioning directive and the register level, if any.
+
+    The register level of the top task is used to instrument all upper-level
+    tasks. If a floorplan has to be generated, all tasks must be populated.
+    """
     # generate partitioning constraints if partitioning directive is given
     if directive is not None:
       _logger.info('generating partitioning constraints')
@@ -239,29 +749,30 @@ class Program:
     if register_level:
       self.top_task.module.register_level = register_level
 
-    # instrument the upper-level RTL
-    _logger.info('instrumenting upper-level RTL')
-    for task in self._tasks.values():
-      if task.is_upper:
-        task.module.cleanup()
-        self._instantiate_fifos(task)
-        self._connect_fifos(task)
-        width_table = {port.name: port.width for port in task.ports.values()}
-        is_done_signals = self._instantiate_children_tasks(task, width_table)
-        self._instantiate_global_fsm(task, is_done_signals)
+  def _instrument_upper_task(self, task: Task) -> None:
+    """Instrument the RTL of an upper-level task and write it."""
+    _logger.debug('instrumenting %s', task.name)
+    task.module.cleanup()
+    self._instantiate_fifos(task)
+    self._connect_fifos(task)
+    width_table = {port.name: port.width for port in task.ports.values()}
+    is_done_signals = self._instantiate_children_tasks(task, width_table)
+    self._instantiate_global_fsm(task, is_done_signals)
 
-        if task.name == self.top:
-          task.module.name = task.name
+    if task.name == self.top:
+      task.module.name = task.name
 
-        with open(self.get_rtl(task.name), 'w') as rtl_code:
-          rtl_code.write(task.module.code)
+    with open(self.get_rtl(task.name), 'w') as rtl_code:
+      task.module.write(rtl_code)
 
+  def _write_rtl_assets(self) -> None:
+    """Write the RTL files that are not generated from tasks."""
     _logger.info('writing RTL files')
     for name, content in self.tcl_files.items():
       with open(os.path.join(self.rtl_dir, name + '.tcl'), 'w') as tcl_file:
         tcl_file.write(content)
 
-    for name, content in rtl.OTHER_MODULES.items():
+    for name, content in rtl.get_other_modules().items():
       with open(self.get_rtl(name, prefix=False), 'w') as rtl_code:
         rtl_code.write(content)
 
@@ -271,8 +782,120 @@ class Program:
           os.path.join(os.path.dirname(util.__file__), 'assets', 'verilog',
                        file_name), self.rtl_dir)
 
+  def run_pipeline(
+      self,
+      clock_period: Union[int, float, str],
+      part_num: str,
+      directive: Optional[Dict[str, Any]] = None,
+      register_level: int = 0,
+      rtl_cache: Optional[cache_lib.Cache] = None,
+      **kwargs,
+  ) -> 'Program':
+    """Run HLS, extract RTL, and instrument RTL with the steps overlapped.
+
+    This is equivalent to `run_hls`, `extract_rtl`, and `instrument_rtl`, except
+    that the tarball of each task is extracted and its RTL is parsed as soon as
+    its HLS job completes. A task is populated once all its children are, and an
+    upper-level task is instrumented once all its children are instrumented and
+    the register level of the top task is settled. If a floorplan has to be
+    generated, the register level depends on the area of all tasks, so upper-
+    level tasks are instrumented only after all tasks are populated.
+
+    Args:
+      clock_period: Target clock period.
+      part_num: Target part number.
+      directive: Same as in `instrument_rtl`.
+      register_level: Same as in `instrument_rtl`.
+      rtl_cache: Optional cache of parsed Verilog ASTs.
+      kwargs: Other keyword arguments of `run_hls`.
+
+    Returns:
+      Program: Return self.
+    """
+    _logger.info('running HLS, extracting and instrumenting RTL as a pipeline')
+    executor = kwargs.pop('executor', None) or hls_executor.LocalExecutor()
+    # each event is a completed parse job, or the HLS job if name is None
+    events: 'queue.Queue[Tuple[Optional[str], futures.Future]]' = queue.Queue()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), _RECURSION_LIMIT))
+    with futures.ProcessPoolExecutor(
+        initializer=_init_parse_worker,
+        initargs=(self.work_dir,),
+    ) as parse_pool, futures.ThreadPoolExecutor(max_workers=1) as hls_pool:
+
+      def on_task_done(name: str) -> None:
+        with tarfile.open(self.get_tar(name), 'r') as tarfileobj:
+          tarfileobj.extractall(path=self.work_dir)
+        parse_pool.submit(
+            _parse_task,
+            name,
+            self.get_rtl(name),
+            self.get_report(name),
+            rtl_cache,
+            self._tasks[name].is_lower,
+        ).add_done_callback(lambda x: events.put((name, x)))
+
+      hls_pool.submit(
+          self.run_hls,
+          clock_period,
+          part_num,
+          executor=executor,
+          on_task_done=on_task_done,
+          **kwargs,
+      ).add_done_callback(lambda x: events.put((None, x)))
+
+      try:
+        self._run_pipeline_events(events, directive, register_level)
+      except BaseException:
+        # leaving the pools waits for the HLS jobs, which may take hours
+        executor.cancel()
+        raise
+
+    self._write_rtl_assets()
     return self
 
+  def _run_pipeline_events(
+      self,
+      events: 'queue.Queue[Tuple[Optional[str], futures.Future]]',
+      directive: Optional[Dict[str, Any]],
+      register_level: int,
+  ) -> None:
+    """Populate and instrument tasks as their parse jobs complete."""
+    parsed: Set[str] = set()
+    populated: Set[str] = set()
+    instrumented: Set[str] = set()
+    is_register_level_settled = False
+    while len(instrumented) < len(self._tasks):
+      name, future = events.get()
+      if name is None:
+        future.result()  # raises if HLS failed
+        continue
+      task = self._tasks[name]
+      task.module, task.self_area = future.result()
+      parsed.add(name)
+      _logger.debug('parsed %s', name)
+
+      # tasks are in topological order, so children come before parents
+      for task in self._tasks.values():
+        if (task.name in parsed and task.name not in populated and
+            populated.issuperset(task.tasks)):
+          _logger.debug('populating %s', task.name)
+          self._populate_task(task)
+          populated.add(task.name)
+
+      if not is_register_level_settled and self.top in parsed and (
+          directive is None or len(populated) == len(self._tasks)):
+        self._settle_register_level(directive, register_level)
+        is_register_level_settled = True
+      if not is_register_level_settled:
+        continue
+
+      for task in self._tasks.values():
+        if (task.name in populated and task.name not in instrumented and
+            instrumented.issuperset(task.tasks)):
+          if task.is_upper:
+            self._instrument_upper_task(task)
+          instrumented.add(task.name)
+
   def pack_rtl(self, output_file: BinaryIO) -> 'Program':
     _logger.info('packaging RTL code')
     rtl.pack(top_name=self.top,
@@ -366,6 +989,40 @@ class Program:
                  self.top_task.module.register_level)
     self.top_task.module.fifo_partition_count = fifo_partition_count
 
+  def _parse_tasks(
+      self,
+      tasks: Iterable[Task],
+      cache: Optional[cache_lib.Cache] = None,
+      max_workers: Optional[int] = None,
+  ) -> None:
+    """Parse the RTL and read the area report of tasks in a process pool.
+
+    Parsing with pyverilog is CPU-bound and holds the GIL, so the tasks are
+    parsed in worker processes. Results are collected in the order of `tasks`
+    so that the output does not depend on scheduling.
+
+    Lower-level tasks are only instantiated, so only their port declarations
+    are scanned; they are parsed lazily if their body is ever accessed.
+    """
+    task_list = list(tasks)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), _RECURSION_LIMIT))
+    with futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_parse_worker,
+        initargs=(self.work_dir,),
+    ) as executor:
+      results = executor.map(
+          _parse_task,
+          [x.name for x in task_list],
+          [self.get_rtl(x.name) for x in task_list],
+          [self.get_report(x.name) for x in task_list],
+          [cache] * len(task_list),
+          [x.is_lower for x in task_list],
+      )
+      for task, (module, area) in zip(task_list, results):
+        task.module = module
+        task.self_area = area
+
   def _populate_task(self, task: Task) -> None:
     task.instances = tuple(
         Instance(self.get_task(name), verilog=rtl, instance_id=idx, **obj)
@@ -769,3 +1426,134 @@ class Program:
         fifo_port, rtl.OSTREAM_SUFFIXES[0])
     # TODO: err properly if not integer literals
     return int(port.width.msb.value) - int(port.width.lsb.value) + 1
+
+
+# Area report of shells of upper-level tasks, in the format of HLS reports.
+_SHELL_REPORT = '''<?xml version="1.0" encoding="UTF-8"?>
+<profile>
+  <AreaEstimates>
+    <Resources>
+      <BRAM_18K>{BRAM_18K}</BRAM_18K>
+      <DSP>{DSP}</DSP>
+      <FF>{FF}</FF>
+      <LUT>{LUT}</LUT>
+      <URAM>{URAM}</URAM>
+    </Resources>
+  </AreaEstimates>
+</profile>
+'''
+
+# Pickling deeply nested expressions in the AST needs a deep stack.
+_RECURSION_LIMIT = 10000
+
+
+def _read_area(filename: str) -> Dict[str, int]:
+  node = ET.parse(filename).find('./AreaEstimates/Resources')
+  return {x.tag: int(x.text) for x in sorted(node, key=lambda x: x.tag)}
+
+
+def _write_if_changed(filename: str, content: str) -> bool:
+  """Write content to filename unless the file already has the content.
+
+  Returns:
+    bool: True if the file is written, False otherwise.
+  """
+  try:
+    with open(filename) as fileobj:
+      if fileobj.read() == content:
+        return False
+  except (OSError, UnicodeDecodeError):
+    pass
+  with open(filename, 'w') as fileobj:
+    fileobj.write(content)
+  return True
+
+
+def _get_identifier_pattern(name: str) -> str:
+  """Return the pattern of name as a whole C++ or Verilog identifier."""
+  return rf'(?<![\w$]){re.escape(name)}(?![\w$])'
+
+
+def _rename_hls_tar(src: str, dst: BinaryIO, old_name: str,
+                    new_name: str) -> None:
+  """Write an HLS tarball of task old_name as if it were of task new_name.
+
+  Only the HDL and report files of the top module are renamed. Vitis HLS
+  prefixes submodules with the name of the top module, so the submodules keep
+  their names and are shared by the original and the renamed tarballs.
+  """
+  old_module = util.get_module_name(old_name)
+  new_module = util.get_module_name(new_name)
+  file_renames = [
+      (re.compile(rf'{re.escape(old_module)}(\.\w+)'), new_module),
+      (re.compile(rf'{re.escape(old_name)}(_csynth\.\w+)'), new_name),
+  ]
+  replacements = [(re.compile(_get_identifier_pattern(old).encode()),
+                   new.encode()) for old, new in {
+                       old_name: new_name,
+                       old_module: new_module,
+                   }.items()]
+  with tarfile.open(src, 'r') as src_tar, \
+      tarfile.open(mode='w', fileobj=dst) as dst_tar:
+    for info in src_tar:
+      fileobj = src_tar.extractfile(info) if info.isfile() else None
+      dirname, basename = posixpath.split(info.name)
+      for pattern, prefix in file_renames:
+        match = pattern.fullmatch(basename)
+        if fileobj is not None and match is not None:
+          content = fileobj.read()
+          for old, new in replacements:
+            content = old.sub(new, content)
+          info.name = posixpath.join(dirname, prefix + match[1])
+          info.size = len(content)
+          fileobj = io.BytesIO(content)
+          break
+      dst_tar.addfile(info, fileobj)
+
+
+def _init_parse_worker(work_dir: str) -> None:
+  # pyverilog writes its parser tables to the current working directory.
+  os.chdir(work_dir)
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), _RECURSION_LIMIT))
+
+
+def _parse_task(
+    name: str,
+    rtl_file: str,
+    report_file: str,
+    cache: Optional[cache_lib.Cache],
+    ports_only: bool,
+) -> Tuple[rtl.Module, Dict[str, int]]:
+  """Parse the RTL of a task and read its area; runs in a worker process."""
+  _logger.debug('%s %s', 'scanning' if ports_only else 'parsing', name)
+  return (rtl.Module([rtl_file], cache,
+                     ports_only=ports_only), _read_area(report_file))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hls_version(hls: str) -> str:
+  """Identify the HLS installation by the resolved path of its executable.
+
+  Xilinx installs each release in a versioned directory, so the path is a cheap
+  substitute for running the tool just to print its version.
+  """
+  for env in 'XILINX_HLS', 'XILINX_VITIS', 'XILINX_VIVADO':
+    root = os.environ.get(env)
+    if root is not None and os.path.exists(os.path.join(root, 'bin', hls)):
+      return os.path.realpath(os.path.join(root, 'bin', hls))
+  exe = shutil.which(hls)
+  return os.path.realpath(exe) if exe is not None else hls
+
+
+@functools.lru_cache(maxsize=None)
+def _get_assets_digest() -> str:
+  """Digest of the TAPA headers shipped with this package."""
+  assets_dir = os.path.join(os.path.dirname(util.__file__), 'assets', 'cpp')
+  contents = {}
+  for filename in sorted(
+      glob.glob(os.path.join(assets_dir, '**', '*'), recursive=True)):
+    if os.path.isfile(filename):
+      with open(filename, 'rb') as fileobj:
+        contents[os.path.relpath(filename, assets_dir)] = fileobj.read().decode(
+            'utf-8', 'replace')
+  return cache_lib.get_key(contents)
@@ -0,0 +1,139 @@
+# pylint: disable=protected-access
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+from typing import Any, Dict
+
+from tapa import core
+
+
+def make_program(work_dir: str, codes: Dict[str, str]) -> core.Program:
+  """Return a program whose top-level task instantiates each task in codes."""
+  tasks: Dict[str, Any] = {
+      name: {
+          'level': 'lower',
+          'code': code
+      } for name, code in codes.items()
+  }
+  tasks['Top'] = {
+      'level': 'upper',
+      'code': 'void Top() {}',
+      'ports': [],
+      'tasks': {name: [{
+          'args': {},
+          'step': 0
+      }] for name in codes},
+      'fifos': {},
+  }
+  program = json.dumps({'top': 'Top', 'tasks': tasks})
+  return core.Program(io.StringIO(program), cflags='', work_dir=work_dir)
+
+
+class DedupTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-core-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.tmpdir = tmpdir.name
+    self.program = make_program(
+        os.path.join(self.tmpdir, 'work'), {
+            'Foo': 'void Foo(int x) { FooBar(x); }',
+            'Bar': 'void Bar(int x) { FooBar(x); }',
+            'Baz': 'void Baz(int x) { FooBar(x + 1); }',
+        })
+
+  def get_keys(self, get_key):
+    return {
+        name: get_key(self.program.get_task(name), '3.33', 'xcu250')
+        for name in ('Foo', 'Bar', 'Baz')
+    }
+
+  def test_normalized_hls_key(self):
+    keys = self.get_keys(self.program.get_normalized_hls_key)
+    self.assertEqual(keys['Foo'], keys['Bar'])
+    self.assertNotEqual(keys['Foo'], keys['Baz'])
+    keys = self.get_keys(self.program.get_hls_key)
+    self.assertNotEqual(keys['Foo'], keys['Bar'])
+
+  def test_rename_hls_tar(self):
+    files = {
+        'hdl/Foo.v': 'module Foo (ap_clk);\n'
+                     '  Foo_sub Foo_sub_U (.ap_clk(ap_clk));\n'
+                     '  // generated for Foo by FooBar\n'
+                     'endmodule //Foo\n',
+        'hdl/Foo_sub.v': 'module Foo_sub (ap_clk);\nendmodule\n',
+        'report/Foo_csynth.xml': '<TopModelName>Foo</TopModelName>\n',
+        'report/Foo_sub_csynth.xml': '<TopModelName>Foo_sub</TopModelName>\n',
+    }
+    src = os.path.join(self.tmpdir, 'Foo.tar')
+    with tarfile.open(src, 'w') as tar:
+      for name, content in files.items():
+        data = content.encode()
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    dst = io.BytesIO()
+    core._rename_hls_tar(src, dst, 'Foo', 'Bar')
+    dst.seek(0)
+    with tarfile.open(fileobj=dst) as tar:
+      renamed = {x.name: tar.extractfile(x).read().decode() for x in tar}
+
+    self.assertEqual(
+        renamed, {
+            'hdl/Bar.v': 'module Bar (ap_clk);\n'
+                         '  Foo_sub Foo_sub_U (.ap_clk(ap_clk));\n'
+                         '  // generated for Bar by FooBar\n'
+                         'endmodule //Bar\n',
+            'hdl/Foo_sub.v': files['hdl/Foo_sub.v'],
+            'report/Bar_csynth.xml': '<TopModelName>Bar</TopModelName>\n',
+            'report/Foo_sub_csynth.xml': files['report/Foo_sub_csynth.xml'],
+        })
+
+
+class WriteIfChangedTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-core-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.filename = os.path.join(tmpdir.name, 'Foo.cpp')
+
+  def write(self, content: str, mtime: int) -> None:
+    with open(self.filename, 'w') as fileobj:
+      fileobj.write(content)
+    os.utime(self.filename, (mtime, mtime))
+
+  def read(self) -> str:
+    with open(self.filename) as fileobj:
+      return fileobj.read()
+
+  def test_missing_file(self):
+    self.assertTrue(core._write_if_changed(self.filename, 'foo'))
+    self.assertEqual(self.read(), 'foo')
+
+  def test_unchanged_content_keeps_mtime(self):
+    self.write('foo', mtime=1000)
+    self.assertFalse(core._write_if_changed(self.filename, 'foo'))
+    self.assertEqual(os.stat(self.filename).st_mtime, 1000)
+
+  def test_changed_content(self):
+    for content in 'bar', 'fo', 'foo\n':
+      with self.subTest(content=content):
+        self.write('foo', mtime=1000)
+        self.assertTrue(core._write_if_changed(self.filename, content))
+        self.assertEqual(self.read(), content)
+        self.assertNotEqual(os.stat(self.filename).st_mtime, 1000)
+
+  def test_binary_content(self):
+    with open(self.filename, 'wb') as fileobj:
+      fileobj.write(b'\xff')
+    self.assertTrue(core._write_if_changed(self.filename, 'foo'))
+    self.assertEqual(self.read(), 'foo')
+
+
+if __name__ == '__main__':
+  unittest.main()
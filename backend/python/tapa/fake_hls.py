@@ -0,0 +1,124 @@
+"""A stand-in for vitis_hls to test HLS scheduling without Xilinx tools.
+
+It accepts the Tcl script generated by `haoda.backend.xilinx.RunHls`, holds the
+configured amount of memory for the configured duration, and then creates the
+report, HDL, and log files that `RunHls` packs into the tarball.
+
+Environment variables:
+  TAPA_FAKE_HLS_MEMORY: Memory to hold in MiB, default to 0.
+  TAPA_FAKE_HLS_DURATION: Duration in seconds, default to 0.
+  TAPA_FAKE_HLS_FAILURES: Comma-separated names of top functions for which HLS
+      fails with an error.
+  TAPA_FAKE_HLS_FLAKY_RATE: Probability that HLS fails in a flaky way, i.e.,
+      with "Pre-synthesis failed." but no error, default to 0.
+"""
+
+import argparse
+import os
+import os.path
+import random
+import re
+import sys
+import time
+
+from tapa import util
+
+REPORT = '''<?xml version="1.0" encoding="UTF-8"?>
+<profile>
+  <AreaEstimates>
+    <Resources>
+      <BRAM_18K>0</BRAM_18K>
+      <DSP>0</DSP>
+      <FF>{ff}</FF>
+      <LUT>{lut}</LUT>
+      <URAM>0</URAM>
+    </Resources>
+  </AreaEstimates>
+</profile>
+'''
+
+VERILOG = '''module {name} (
+        ap_clk,
+        ap_rst_n,
+        ap_start,
+        ap_done,
+        ap_idle,
+        ap_ready
+);
+
+input   ap_clk;
+input   ap_rst_n;
+input   ap_start;
+output   ap_done;
+output   ap_idle;
+output   ap_ready;
+
+assign ap_done = ap_start;
+assign ap_idle = 1'b1;
+assign ap_ready = ap_start;
+
+endmodule //{name}
+'''
+
+
+def _get_tcl_arg(commands: str, command: str) -> str:
+  match = re.search(rf'^{command}\s+"?([^"\n]*)"?', commands, re.MULTILINE)
+  if match is None:
+    raise ValueError(f'`{command}` is not found in the Tcl script')
+  return match[1]
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      prog=os.path.basename(sys.argv[0]),
+      description='Fake HLS that holds memory for a while')
+  parser.add_argument('-f', dest='tcl_file', required=True)
+  args = parser.parse_args()
+
+  memory = int(float(os.environ.get('TAPA_FAKE_HLS_MEMORY', 0)) * 2**20)
+  duration = float(os.environ.get('TAPA_FAKE_HLS_DURATION', 0))
+
+  with open(args.tcl_file) as fileobj:
+    commands = fileobj.read()
+  project_dir = _get_tcl_arg(commands, 'cd')
+  top_name = _get_tcl_arg(commands, 'set_top')
+  solution_dir = os.path.join(project_dir, _get_tcl_arg(commands,
+                                                        'open_project'),
+                              _get_tcl_arg(commands, 'open_solution'))
+
+  if top_name in os.environ.get('TAPA_FAKE_HLS_FAILURES', '').split(','):
+    print(f'ERROR: [HLS 200-70] Fake failure of {top_name}')
+    sys.exit(1)
+  if random.random() < float(os.environ.get('TAPA_FAKE_HLS_FLAKY_RATE', 0)):
+    print('Pre-synthesis failed.')
+    sys.exit(1)
+
+  # multiplication writes every byte, so the memory is resident
+  ballast = b'\xa5' * memory
+  deadline = time.monotonic() + duration
+  step = 0
+  while time.monotonic() < deadline:
+    step += 1
+    print(f'INFO: [HLS 200-10] Fake step {step} of {top_name}', flush=True)
+    time.sleep(max(0., min(1., deadline - time.monotonic())))
+  del ballast
+
+  report_dir = os.path.join(solution_dir, 'syn', 'report')
+  os.makedirs(report_dir, exist_ok=True)
+  with open(os.path.join(report_dir, f'{top_name}_csynth.xml'), 'w') as fp:
+    fp.write(REPORT.format(ff=memory >> 20, lut=int(duration)))
+
+  hdl_dir = os.path.join(solution_dir, 'syn', 'verilog')
+  os.makedirs(hdl_dir, exist_ok=True)
+  module_name = util.get_module_name(top_name)
+  with open(os.path.join(hdl_dir, module_name + '.v'), 'w') as fp:
+    fp.write(VERILOG.format(name=module_name))
+
+  # RunHls expects the log in the working directory
+  with open(os.path.basename(sys.argv[0]) + '.log', 'w') as fp:
+    fp.write(f'INFO: fake HLS finished for {top_name}\n')
+  print('INFO: [HLS 200-111] Finished Command csynth_design')
+
+
+if __name__ == '__main__':
+  main()
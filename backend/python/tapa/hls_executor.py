@@ -0,0 +1,724 @@
+"""Executors that run HLS jobs locally or on remote workers.
+
+`LocalExecutor` runs HLS on this host, admitting jobs with a
+`scheduler.ConcurrencyController`. `RemoteExecutor` ships the C++ files, cflags,
+and device info of each job to workers started by `tapa-hls-worker` and
+receives the tarball back, so idle machines can share the HLS load.
+
+Each message of the worker protocol is a fixed-size prefix with the lengths of
+a JSON header and a binary payload, followed by the header and the payload. A
+request carries the job in the header and a tarball of the input files in the
+payload. The worker streams the HLS output back in log messages as it is
+produced, followed by a result message that carries the HLS tarball in the
+payload. A connection serves exactly one job.
+
+Workers run whatever the request asks them to synthesize, so each request must
+carry the shared token of the worker, which is read from the
+`TAPA_HLS_WORKER_TOKEN` environment variable on both ends. The token is sent
+in plain text; run workers on a trusted network or behind an SSH tunnel. Jobs
+are validated before anything is written to the Tcl script or the disk, and
+the HLS command is chosen by the worker.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hmac
+import io
+import json
+import logging
+import os
+import os.path
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+from typing import (IO, Any, BinaryIO, Callable, Deque, Dict, Iterable, List,
+                    NamedTuple, Optional, Set, Tuple)
+
+from tapa import scheduler
+
+_logger = logging.getLogger().getChild(__name__)
+
+_PREFIX = struct.Struct('>II')
+
+# interval in seconds to check whether a running job is cancelled
+_POLL_INTERVAL = 0.5
+
+# cflags refer to the TAPA headers, whose location differs on each host
+_ASSETS_DIR = os.path.join(os.path.dirname(__file__), 'assets', 'cpp')
+_ASSETS_DIR_TOKEN = '${TAPA_ASSETS_DIR}'
+
+TOKEN_ENV = 'TAPA_HLS_WORKER_TOKEN'
+
+# characters that are special in a double-quoted Tcl word, or control chars
+_TCL_UNSAFE_PATTERN = re.compile(r'["$\[\]\\{}\x00-\x1f\x7f]')
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_]\w*')
+_PART_NUM_PATTERN = re.compile(r'[\w.-]+')
+_CLOCK_PERIOD_PATTERN = re.compile(r'\d+(\.\d*)?|\.\d+')
+
+Address = Tuple[str, int]
+
+
+class HlsJob(NamedTuple):
+  """Inputs of an HLS job.
+
+  Attributes:
+    top_name: Name of the top-level function.
+    cpp_dir: Directory of the C++ files.
+    cpp_file: Path of the C++ file relative to cpp_dir.
+    header_files: Paths of the headers relative to cpp_dir.
+    cflags: Cflags of the C++ file.
+    clock_period: Target clock period.
+    part_num: Target part number.
+    hls: Name of the HLS executable.
+    predicted_rss: Predicted peak RSS in bytes; 0 if unknown.
+  """
+  top_name: str
+  cpp_dir: str
+  cpp_file: str
+  header_files: Tuple[str, ...]
+  cflags: str
+  clock_period: str
+  part_num: str
+  hls: str
+  predicted_rss: int = 0
+
+
+class HlsResult(NamedTuple):
+  """Outputs of an HLS job, except for the tarball and the log.
+
+  Attributes:
+    returncode: Exit status of HLS.
+    wall_time: Wall time of HLS in seconds.
+    peak_rss: Peak RSS of the HLS process tree in bytes.
+  """
+  returncode: int
+  wall_time: float
+  peak_rss: int
+
+
+class HlsLog:
+  """Sink of the output of an HLS job that scans it for failures on the fly.
+
+  The output is written to a file as it is produced instead of being buffered,
+  and only the few lines needed to report a failure are kept in memory. Writes
+  from multiple threads are serialized; each write should consist of complete
+  lines so that the lines of stdout and stderr are not mixed up.
+
+  Attributes:
+    fileobj: File object that the output is written to.
+    on_progress: Optional callback that is called with each progress message of
+        HLS, e.g., "INFO: [HLS 200-111] Finished Command csynth_design".
+    is_presynthesis_failed: Whether HLS reported "Pre-synthesis failed.".
+    error_count: Number of lines that start with "ERROR:".
+    error_lines: The first few lines that start with "ERROR:".
+    tail: The last few lines of the output.
+  """
+  MAX_ERROR_LINES = 20
+  MAX_TAIL_LINES = 20
+
+  def __init__(
+      self,
+      fileobj: IO[bytes],
+      on_progress: Optional[Callable[[str], None]] = None,
+  ):
+    self.fileobj = fileobj
+    self.on_progress = on_progress
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self) -> None:
+    """Discard the output written so far, e.g., before running HLS again."""
+    with self._lock:
+      if self.fileobj.seekable():
+        self.fileobj.seek(0)
+        self.fileobj.truncate()
+      self.is_presynthesis_failed = False
+      self.error_count = 0
+      self.error_lines: List[bytes] = []
+      self.tail: Deque[bytes] = collections.deque(maxlen=self.MAX_TAIL_LINES)
+      self._partial_line = b''
+
+  @property
+  def is_flaky(self) -> bool:
+    """Whether the failure, if any, is likely to succeed if retried.
+
+    Vitis HLS may fail with "Pre-synthesis failed." without reporting an error
+    when the host is heavily loaded.
+    """
+    return self.is_presynthesis_failed and self.error_count == 0
+
+  def write(self, data: bytes) -> None:
+    with self._lock:
+      self.fileobj.write(data)
+      lines = (self._partial_line + data).split(b'\n')
+      self._partial_line = lines.pop()
+      for line in lines:
+        self._scan(line + b'\n')
+
+  def flush(self) -> None:
+    """Scan the incomplete last line, if any, and flush the file."""
+    with self._lock:
+      if self._partial_line:
+        self._scan(self._partial_line)
+        self._partial_line = b''
+      self.fileobj.flush()
+
+  def _scan(self, line: bytes) -> None:
+    self.tail.append(line)
+    if line.startswith(b'ERROR:'):
+      self.error_count += 1
+      if len(self.error_lines) < self.MAX_ERROR_LINES:
+        self.error_lines.append(line)
+    elif b'Pre-synthesis failed.' in line:
+      self.is_presynthesis_failed = True
+    elif line.startswith(b'INFO: [HLS ') and self.on_progress is not None:
+      self.on_progress(line.decode('utf-8', 'replace').rstrip())
+
+
+def _copy_lines(src: IO[bytes], log: HlsLog) -> None:
+  for line in iter(src.readline, b''):
+    log.write(line)
+
+
+def _is_alive(pid: int) -> bool:
+  try:
+    with open(f'/proc/{pid}/stat') as fileobj:
+      stat = fileobj.read()
+  except OSError:
+    return False
+  # zombies are dead but remain until their parent reaps them
+  return stat[stat.rfind(')') + 2:].split()[0] != 'Z'
+
+
+def terminate_process_tree(pid: int, timeout: float = 10.) -> None:
+  """Terminate a process and its descendants.
+
+  HLS tools are shell scripts that start other processes, so terminating only
+  the direct child would leave the actual tool running. All processes receive
+  SIGTERM first, and those alive after timeout seconds receive SIGKILL.
+  """
+  pids = scheduler.get_tree_pids(pid)
+  for sig in signal.SIGTERM, signal.SIGKILL:
+    for pid in pids:
+      try:
+        os.kill(pid, sig)
+      except ProcessLookupError:
+        pass
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+      pids = [x for x in pids if _is_alive(x)]
+      if not pids:
+        return
+      time.sleep(0.1)
+
+
+def run_hls(
+    job: HlsJob,
+    tarfileobj: BinaryIO,
+    log: HlsLog,
+    cancelled: Optional[threading.Event] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+) -> HlsResult:
+  """Run HLS on this host.
+
+  Args:
+    job: The HLS job.
+    tarfileobj: File object that the tarball is written to.
+    log: Sink of the stdout and stderr of HLS.
+    cancelled: Optional event that terminates HLS once set.
+    on_start: Optional callback that is called with the PID of HLS once it
+        starts.
+
+  Returns:
+    HlsResult: Result of the job.
+
+  Raises:
+    concurrent.futures.CancelledError: If the job is cancelled.
+  """
+  # pylint: disable=import-outside-toplevel
+  from haoda.backend import xilinx as hls_backend
+
+  start_time = time.monotonic()
+  with hls_backend.RunHls(
+      tarfileobj,
+      kernel_files=[(os.path.join(job.cpp_dir, job.cpp_file), job.cflags)],
+      top_name=job.top_name,
+      clock_period=job.clock_period,
+      part_num=job.part_num,
+      auto_prefix=True,
+      hls=job.hls,
+  ) as proc:
+    if on_start is not None:
+      on_start(proc.pid)
+    with scheduler.PeakRssMonitor(proc.pid) as monitor:
+      threads = [
+          threading.Thread(target=_copy_lines, args=(src, log), daemon=True)
+          for src in (proc.stdout, proc.stderr)
+      ]
+      for thread in threads:
+        thread.start()
+      is_terminated = False
+      for thread in threads:
+        while thread.is_alive():
+          thread.join(_POLL_INTERVAL)
+          if cancelled is not None and cancelled.is_set() and not is_terminated:
+            _logger.info('terminating HLS for %s', job.top_name)
+            terminate_process_tree(proc.pid)
+            is_terminated = True
+      proc.wait()
+  log.flush()
+  if is_terminated:
+    raise concurrent.futures.CancelledError()
+  return HlsResult(
+      returncode=proc.returncode,
+      wall_time=time.monotonic() - start_time,
+      peak_rss=monitor.peak_rss,
+  )
+
+
+class HlsExecutor:
+  """Interface of HLS executors.
+
+  Executors are context managers; `run` may be called concurrently by up to
+  `max_jobs` threads while the executor is entered. `cancel` may be called from
+  any thread to abort running and future jobs.
+
+  Attributes:
+    max_jobs: Maximum number of jobs that may run concurrently.
+  """
+  max_jobs: int = 1
+
+  def __enter__(self) -> 'HlsExecutor':
+    return self
+
+  def __exit__(self, *args) -> None:
+    pass
+
+  def run(self, job: HlsJob, tarfileobj: BinaryIO, log: HlsLog) -> HlsResult:
+    """Run an HLS job, writing the tarball to tarfileobj and output to log.
+
+    Raises:
+      concurrent.futures.CancelledError: If the executor is cancelled.
+    """
+    raise NotImplementedError
+
+  def cancel(self) -> None:
+    """Terminate running jobs and make all jobs raise CancelledError."""
+    raise NotImplementedError
+
+  def throttle(self) -> None:
+    """Run fewer jobs concurrently, e.g., after a flaky failure."""
+
+  def recover(self) -> None:
+    """Allow more concurrent jobs again, e.g., after a job succeeds."""
+
+
+class LocalExecutor(HlsExecutor):
+  """Run HLS jobs on this host with adaptive concurrency."""
+
+  def __init__(self, max_jobs: Optional[int] = None):
+    self.max_jobs = max_jobs or os.cpu_count() or 1
+    self._controller = scheduler.ConcurrencyController(max_jobs=self.max_jobs)
+    self._cancelled = threading.Event()
+
+  def __enter__(self) -> 'LocalExecutor':
+    self._controller.__enter__()
+    return self
+
+  def __exit__(self, *args) -> None:
+    self._controller.__exit__(*args)
+
+  def run(self, job: HlsJob, tarfileobj: BinaryIO, log: HlsLog) -> HlsResult:
+    with self._controller.slot(job.predicted_rss) as track:
+      if self._cancelled.is_set():
+        raise concurrent.futures.CancelledError()
+      return run_hls(job, tarfileobj, log, self._cancelled, on_start=track)
+
+  def cancel(self) -> None:
+    self._cancelled.set()
+    self._controller.cancel()
+
+  def throttle(self) -> None:
+    self._controller.throttle()
+
+  def recover(self) -> None:
+    self._controller.recover()
+
+
+def parse_address(address: str) -> Address:
+  """Parse `host:port` into a tuple."""
+  host, sep, port = address.rpartition(':')
+  if not sep or not port.isdigit():
+    raise ValueError(f'invalid worker address: {address}')
+  return host or 'localhost', int(port)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+  buf = bytearray()
+  while len(buf) < size:
+    chunk = sock.recv(min(size - len(buf), 1 << 20))
+    if not chunk:
+      raise ConnectionError('connection closed unexpectedly')
+    buf += chunk
+  return bytes(buf)
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any],
+                 payload: bytes) -> None:
+  header_bytes = json.dumps(header).encode('utf-8')
+  sock.sendall(_PREFIX.pack(len(header_bytes), len(payload)))
+  sock.sendall(header_bytes)
+  sock.sendall(payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+  header_size, payload_size = _PREFIX.unpack(_recv_exactly(sock, _PREFIX.size))
+  header = json.loads(_recv_exactly(sock, header_size).decode('utf-8'))
+  return header, _recv_exactly(sock, payload_size)
+
+
+class RemoteExecutor(HlsExecutor):
+  """Run HLS jobs on remote workers, one job per worker at a time.
+
+  A worker that cannot be reached or breaks the protocol is considered dead and
+  the job is retried on a different worker. A job that is run again (e.g., after
+  a flaky HLS failure) prefers a different worker than last time.
+
+  A worker that rejects a job, e.g., because of a wrong token, fails the job
+  instead of being retried.
+
+  Attributes:
+    addresses: Addresses of the workers. Listing a worker multiple times allows
+        it to run multiple jobs concurrently.
+    timeout: Timeout in seconds of socket operations; None means no timeout.
+  """
+
+  def __init__(self,
+               addresses: Iterable[Address],
+               token: str,
+               timeout: Optional[float] = None):
+    self.addresses: List[Address] = list(addresses)
+    if not self.addresses:
+      raise ValueError('no HLS worker is given')
+    if not token:
+      raise ValueError(f'{TOKEN_ENV} must be set to use HLS workers')
+    self.max_jobs = len(self.addresses)
+    self.timeout = timeout
+    self._token = token
+    self._idle: List[int] = list(range(len(self.addresses)))
+    self._dead: Set[int] = set()
+    self._last_worker: Dict[str, int] = {}
+    self._sockets: Set[socket.socket] = set()
+    self._is_cancelled = False
+    self._cond = threading.Condition()
+
+  def _acquire(self, job: HlsJob, exclude: Set[int]) -> int:
+    with self._cond:
+      while True:
+        if self._is_cancelled:
+          raise concurrent.futures.CancelledError()
+        if len(self._dead | exclude) >= len(self.addresses):
+          raise RuntimeError(f'no HLS worker is available for {job.top_name}')
+        candidates = [x for x in self._idle if x not in exclude]
+        if candidates:
+          # prefer a different worker than last time
+          last = self._last_worker.get(job.top_name)
+          idx = next((x for x in candidates if x != last), candidates[0])
+          self._idle.remove(idx)
+          self._last_worker[job.top_name] = idx
+          return idx
+        self._cond.wait()
+
+  def _release(self, idx: int, is_dead: bool) -> None:
+    with self._cond:
+      if is_dead:
+        # all slots of the same address are dead
+        self._dead.update(x for x, addr in enumerate(self.addresses)
+                          if addr == self.addresses[idx])
+      else:
+        self._idle.append(idx)
+      self._cond.notify_all()
+
+  def _request(self, address: Address, job: HlsJob, tarfileobj: BinaryIO,
+               log: HlsLog) -> HlsResult:
+    inputs = io.BytesIO()
+    with tarfile.open(mode='w', fileobj=inputs) as tar:
+      for filename in (job.cpp_file,) + job.header_files:
+        tar.add(os.path.join(job.cpp_dir, filename), arcname=filename)
+    with socket.create_connection(address, timeout=self.timeout) as sock:
+      with self._cond:
+        if self._is_cancelled:
+          raise concurrent.futures.CancelledError()
+        self._sockets.add(sock)
+      try:
+        send_message(
+            sock,
+            {
+                'token':
+                    self._token,
+                **job._replace(
+                    cpp_dir='',
+                    cflags=job.cflags.replace(_ASSETS_DIR, _ASSETS_DIR_TOKEN),
+                )._asdict(),
+            },
+            inputs.getvalue(),
+        )
+        while True:
+          header, payload = recv_message(sock)
+          if header['type'] != 'log':
+            break
+          log.write(payload)
+        if header['type'] == 'error':
+          raise RuntimeError('HLS worker {}:{} rejected {}: {}'.format(
+              *address, job.top_name, header['message']))
+      finally:
+        with self._cond:
+          self._sockets.discard(sock)
+    log.flush()
+    tarfileobj.write(payload)
+    return HlsResult(
+        returncode=header['returncode'],
+        wall_time=header['wall_time'],
+        peak_rss=header['peak_rss'],
+    )
+
+  def run(self, job: HlsJob, tarfileobj: BinaryIO, log: HlsLog) -> HlsResult:
+    exclude: Set[int] = set()
+    while True:
+      idx = self._acquire(job, exclude)
+      address = self.addresses[idx]
+      _logger.debug('running HLS for %s on %s:%d', job.top_name, *address)
+      try:
+        tarfileobj.seek(0)
+        tarfileobj.truncate()
+        log.reset()
+        result = self._request(address, job, tarfileobj, log)
+      except (OSError, ValueError, KeyError) as e:
+        if self._is_cancelled:
+          self._release(idx, is_dead=False)
+          raise concurrent.futures.CancelledError() from e
+        _logger.warning('HLS worker %s:%d failed for %s: %s; retrying',
+                        *address, job.top_name, e)
+        self._release(idx, is_dead=True)
+        exclude.add(idx)
+        continue
+      except BaseException:
+        self._release(idx, is_dead=False)
+        raise
+      self._release(idx, is_dead=False)
+      return result
+
+  def cancel(self) -> None:
+    # workers terminate HLS once the connection is closed
+    with self._cond:
+      self._is_cancelled = True
+      for sock in self._sockets:
+        try:
+          sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+          pass
+      self._cond.notify_all()
+
+
+class _LogSender:
+  """File-like object that sends each write to the client as a log message."""
+
+  def __init__(self, sock: socket.socket):
+    self._sock = sock
+
+  def seekable(self) -> bool:
+    return False
+
+  def write(self, data: bytes) -> None:
+    try:
+      send_message(self._sock, {'type': 'log'}, data)
+    except OSError:
+      pass  # the client is gone and the job will be cancelled
+
+  def flush(self) -> None:
+    pass
+
+
+def _check_job(job: HlsJob) -> None:
+  """Raise ValueError if job could inject commands into the Tcl script."""
+  if _IDENTIFIER_PATTERN.fullmatch(job.top_name) is None:
+    raise ValueError(f'invalid top name: {job.top_name!r}')
+  if _PART_NUM_PATTERN.fullmatch(job.part_num) is None:
+    raise ValueError(f'invalid part number: {job.part_num!r}')
+  if _CLOCK_PERIOD_PATTERN.fullmatch(job.clock_period) is None:
+    raise ValueError(f'invalid clock period: {job.clock_period!r}')
+  if _TCL_UNSAFE_PATTERN.search(job.cflags.replace(_ASSETS_DIR_TOKEN, '')):
+    raise ValueError(f'unsafe characters in cflags: {job.cflags!r}')
+  if _TCL_UNSAFE_PATTERN.search(job.cpp_file):
+    raise ValueError(f'unsafe characters in file name: {job.cpp_file!r}')
+
+
+def _extract_inputs(tar: tarfile.TarFile, cpp_dir: str) -> None:
+  """Extract the input files, rejecting members that escape cpp_dir."""
+  members = tar.getmembers()
+  for member in members:
+    parts = member.name.split('/')
+    if os.path.isabs(member.name) or '..' in parts:
+      raise ValueError(f'unsafe path in tarball: {member.name!r}')
+    if not (member.isfile() or member.isdir()):
+      raise ValueError(f'unsupported member in tarball: {member.name!r}')
+  for member in members:
+    # do not restore permissions or owners from the client
+    member.mode = 0o755 if member.isdir() else 0o644
+    member.uid = member.gid = 0
+    member.uname = member.gname = ''
+    tar.extract(member, cpp_dir, set_attrs=False)
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+
+  def _watch_client(self, cancelled: threading.Event) -> None:
+    # the client sends nothing after the request, so any return means the
+    # connection is closed
+    try:
+      self.request.recv(1)
+    except OSError:
+      pass
+    cancelled.set()
+
+  def _reject(self, message: str) -> None:
+    _logger.warning('rejected request from %s:%d: %s', *self.client_address[:2],
+                    message)
+    send_message(self.request, {'type': 'error', 'message': message}, b'')
+
+  def handle(self) -> None:
+    header, payload = recv_message(self.request)
+    token = header.pop('token', '')
+    if not isinstance(token, str) or not hmac.compare_digest(
+        token.encode('utf-8'), self.server.token.encode('utf-8')):
+      self._reject('authentication failed')
+      return
+    try:
+      header['header_files'] = tuple(header['header_files'])
+      job = HlsJob(**header)
+      _check_job(job)
+    except (TypeError, KeyError, ValueError) as e:
+      self._reject(f'invalid job: {e}')
+      return
+    hls = self.server.hls
+    if job.hls in self.server.allowed_hls:
+      hls = job.hls
+    elif job.hls != hls:
+      _logger.warning('ignoring HLS command %r requested for %s; using %r',
+                      job.hls, job.top_name, hls)
+    _logger.info('running HLS for %s from %s:%d', job.top_name,
+                 *self.client_address[:2])
+    cpp_dir = tempfile.mkdtemp(prefix=f'tapa-hls-worker-{job.top_name}-')
+    try:
+      try:
+        with tarfile.open(mode='r', fileobj=io.BytesIO(payload)) as tar:
+          _extract_inputs(tar, cpp_dir)
+      except (tarfile.TarError, ValueError) as e:
+        self._reject(f'invalid inputs: {e}')
+        return
+      job = job._replace(
+          cpp_dir=cpp_dir,
+          cflags=job.cflags.replace(_ASSETS_DIR_TOKEN, _ASSETS_DIR),
+          hls=hls,
+      )
+      tarfileobj = io.BytesIO()
+      cancelled = threading.Event()
+      threading.Thread(target=self._watch_client,
+                       args=(cancelled,),
+                       daemon=True).start()
+      result = run_hls(job, tarfileobj, HlsLog(_LogSender(self.request)),
+                       cancelled)
+    except concurrent.futures.CancelledError:
+      _logger.info('cancelled HLS for %s', job.top_name)
+      return
+    finally:
+      shutil.rmtree(cpp_dir)
+    send_message(
+        self.request,
+        {
+            'type': 'result',
+            **result._asdict()
+        },
+        tarfileobj.getvalue(),
+    )
+    _logger.info('finished HLS for %s with exit status %d', job.top_name,
+                 result.returncode)
+
+
+class WorkerServer(socketserver.TCPServer):
+  """Server of HLS jobs; serves one job at a time.
+
+  Attributes:
+    token: Shared token that each request must carry.
+    hls: HLS command that runs the jobs.
+    allowed_hls: HLS commands that clients may request instead of hls.
+  """
+  allow_reuse_address = True
+
+  def __init__(
+      self,
+      address: Address,
+      token: str,
+      hls: str = 'vitis_hls',
+      allowed_hls: Iterable[str] = (),
+  ):
+    if not token:
+      raise ValueError('the token of an HLS worker must not be empty')
+    super().__init__(address, _WorkerHandler)
+    self.token = token
+    self.hls = hls
+    self.allowed_hls = frozenset(allowed_hls)
+
+
+def main():
+  parser = argparse.ArgumentParser(prog='tapa-hls-worker',
+                                   description='Serve HLS jobs of tapac')
+  parser.add_argument('--host',
+                      type=str,
+                      dest='host',
+                      default='127.0.0.1',
+                      help='address to listen on (default: %(default)s)')
+  parser.add_argument('--port',
+                      type=int,
+                      dest='port',
+                      default=7437,
+                      help='port to listen on (default: %(default)s)')
+  parser.add_argument('--hls',
+                      type=str,
+                      dest='hls',
+                      metavar='command',
+                      default='vitis_hls',
+                      help='HLS command that runs the jobs '
+                      '(default: %(default)s)')
+  parser.add_argument('--allow-hls',
+                      action='append',
+                      dest='allowed_hls',
+                      metavar='command',
+                      default=[],
+                      help='HLS command that clients may request instead of '
+                      '--hls; may be given multiple times')
+  args = parser.parse_args()
+  token = os.environ.get(TOKEN_ENV, '')
+  if not token:
+    parser.error(f'{TOKEN_ENV} must be set to a shared secret')
+  logging.basicConfig(level=logging.INFO)
+  with WorkerServer(
+      (args.host, args.port),
+      token=token,
+      hls=args.hls,
+      allowed_hls=args.allowed_hls,
+  ) as server:
+    _logger.info('serving HLS jobs on %s:%d', *server.server_address[:2])
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+  main()
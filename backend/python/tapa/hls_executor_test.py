@@ -0,0 +1,243 @@
+# pylint: disable=protected-access
+
+import concurrent.futures
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+import tapa.core  # pylint: disable=unused-import # avoid circular imports
+from tapa import hls_executor, scheduler
+
+TOKEN = 'secret'
+FAKE_HLS = 'tapa-fake-hls'
+
+# the fake HLS has to be found on PATH by its name, so that RunHls finds its log
+FAKE_HLS_SCRIPT = f'''#!{sys.executable}
+import sys
+sys.path.insert(0, {os.path.dirname(os.path.dirname(__file__))!r})
+from tapa.fake_hls import main
+sys.exit(main())
+'''
+
+
+def _get_fake_hls_pids():
+  pids = []
+  for pid in scheduler.get_tree_pids(os.getpid()):
+    try:
+      with open(f'/proc/{pid}/cmdline', 'rb') as fileobj:
+        if FAKE_HLS.encode() in fileobj.read():
+          pids.append(pid)
+    except OSError:
+      pass
+  return pids
+
+
+class RemoteExecutorTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-hls-executor-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.tmpdir = tmpdir.name
+
+    bin_dir = os.path.join(self.tmpdir, 'bin')
+    os.mkdir(bin_dir)
+    with open(os.path.join(bin_dir, FAKE_HLS), 'w') as fileobj:
+      fileobj.write(FAKE_HLS_SCRIPT)
+    os.chmod(os.path.join(bin_dir, FAKE_HLS), 0o755)
+    env = unittest.mock.patch.dict(
+        os.environ, {
+            'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+            'TAPA_FAKE_HLS_DURATION': '0',
+            'TAPA_FAKE_HLS_FAILURES': '',
+        })
+    env.start()
+    self.addCleanup(env.stop)
+
+    self.cpp_dir = os.path.join(self.tmpdir, 'cpp')
+    os.mkdir(self.cpp_dir)
+    for name in 'Foo.cpp', 'Foo.h':
+      with open(os.path.join(self.cpp_dir, name), 'w') as fileobj:
+        fileobj.write('// empty\n')
+
+    self.addresses = []
+    for _ in range(2):
+      server = hls_executor.WorkerServer(('localhost', 0),
+                                         token=TOKEN,
+                                         hls=FAKE_HLS)
+      threading.Thread(target=server.serve_forever, daemon=True).start()
+      self.addCleanup(server.server_close)
+      self.addCleanup(server.shutdown)
+      self.addresses.append(server.server_address[:2])
+
+  def make_job(self, top_name: str = 'Foo') -> hls_executor.HlsJob:
+    return hls_executor.HlsJob(
+        top_name=top_name,
+        cpp_dir=self.cpp_dir,
+        cpp_file='Foo.cpp',
+        header_files=('Foo.h',),
+        cflags='-I' + hls_executor._ASSETS_DIR,
+        clock_period='3.33',
+        part_num='xcu250-figd2104-2L-e',
+        hls=FAKE_HLS,
+    )
+
+  def run_job(self, executor: hls_executor.HlsExecutor,
+              job: hls_executor.HlsJob):
+    tarfileobj = io.BytesIO()
+    log = hls_executor.HlsLog(io.BytesIO())
+    result = executor.run(job, tarfileobj, log)
+    return result, tarfileobj, log
+
+  def test_success_on_all_workers(self):
+    executor = hls_executor.RemoteExecutor(self.addresses, TOKEN)
+    jobs = [self.make_job(f'Foo{i}') for i in range(4)]
+    with executor, concurrent.futures.ThreadPoolExecutor(
+        max_workers=executor.max_jobs) as pool:
+      outputs = list(pool.map(lambda x: self.run_job(executor, x), jobs))
+    for job, (result, tarfileobj, log) in zip(jobs, outputs):
+      self.assertEqual(result.returncode, 0)
+      tarfileobj.seek(0)
+      with tarfile.open(mode='r', fileobj=tarfileobj) as tar:
+        self.assertIn(f'log/{job.top_name}.log', tar.getnames())
+      self.assertIn(b'Finished Command csynth_design', log.fileobj.getvalue())
+
+  def test_failure(self):
+    os.environ['TAPA_FAKE_HLS_FAILURES'] = 'Bar'
+    with hls_executor.RemoteExecutor(self.addresses, TOKEN) as executor:
+      result, tarfileobj, log = self.run_job(executor, self.make_job('Bar'))
+    self.assertNotEqual(result.returncode, 0)
+    self.assertEqual(tarfileobj.getvalue(), b'')
+    self.assertEqual(log.error_count, 1)
+    self.assertFalse(log.is_flaky)
+
+  def test_bad_token(self):
+    with hls_executor.RemoteExecutor(self.addresses, 'wrong') as executor:
+      with self.assertRaisesRegex(RuntimeError, 'authentication failed'):
+        self.run_job(executor, self.make_job())
+      # a rejection is not a dead worker
+      self.assertFalse(executor._dead)
+
+  def test_unsafe_job_is_rejected(self):
+    with hls_executor.RemoteExecutor(self.addresses, TOKEN) as executor:
+      with self.assertRaisesRegex(RuntimeError, 'invalid job'):
+        self.run_job(executor, self.make_job('Foo;exec rm -rf /'))
+
+  def test_cancel_terminates_hls(self):
+    os.environ['TAPA_FAKE_HLS_DURATION'] = '60'
+    executor = hls_executor.RemoteExecutor(self.addresses, TOKEN)
+    started = threading.Event()
+    log = hls_executor.HlsLog(io.BytesIO(), on_progress=lambda _: started.set())
+    with executor, concurrent.futures.ThreadPoolExecutor() as pool:
+      future = pool.submit(executor.run, self.make_job(), io.BytesIO(), log)
+      self.assertTrue(started.wait(30))
+      self.assertTrue(_get_fake_hls_pids())
+      executor.cancel()
+      with self.assertRaises(concurrent.futures.CancelledError):
+        future.result(timeout=30)
+
+    deadline = time.monotonic() + 30
+    while _get_fake_hls_pids() and time.monotonic() < deadline:
+      time.sleep(0.1)
+    self.assertFalse(_get_fake_hls_pids())
+
+
+class ValidationTest(unittest.TestCase):
+
+  def test_check_job(self):
+    job = hls_executor.HlsJob(
+        top_name='Foo',
+        cpp_dir='',
+        cpp_file='Foo.cpp',
+        header_files=(),
+        cflags='-I${TAPA_ASSETS_DIR} -DFOO=1',
+        clock_period='3.33',
+        part_num='xcu250-figd2104-2L-e',
+        hls=FAKE_HLS,
+    )
+    hls_executor._check_job(job)
+    for field, value in (
+        ('top_name', 'Foo\nexec rm'),
+        ('part_num', 'xcu250}; exec rm {'),
+        ('clock_period', '3.33 -name x'),
+        ('cflags', '-DFOO=[exec rm]'),
+        ('cflags', '-DFOO=$env(HOME)'),
+        ('cpp_file', 'Foo".cpp'),
+    ):
+      with self.subTest(field=field, value=value):
+        with self.assertRaises(ValueError):
+          hls_executor._check_job(job._replace(**{field: value}))
+
+  def test_extract_inputs(self):
+    with tempfile.TemporaryDirectory(
+        prefix='tapa-hls-executor-test-') as tmpdir:
+      cpp_dir = os.path.join(tmpdir, 'cpp')
+      os.mkdir(cpp_dir)
+
+      def make_tar(*members: tarfile.TarInfo) -> tarfile.TarFile:
+        fileobj = io.BytesIO()
+        with tarfile.open(mode='w', fileobj=fileobj) as tar:
+          for member in members:
+            tar.addfile(member, io.BytesIO(b'x' * member.size))
+        fileobj.seek(0)
+        return tarfile.open(mode='r', fileobj=fileobj)
+
+      def make_file(name: str) -> tarfile.TarInfo:
+        member = tarfile.TarInfo(name)
+        member.size = 1
+        member.mode = 0o4777
+        return member
+
+      def make_symlink(name: str, target: str) -> tarfile.TarInfo:
+        member = tarfile.TarInfo(name)
+        member.type = tarfile.SYMTYPE
+        member.linkname = target
+        return member
+
+      for members in (
+          (make_file('Foo.cpp'), make_file('../escaped')),
+          (make_file('/tmp/escaped'),),
+          (make_file('sub/../../escaped'),),
+          (make_symlink('Foo.h', '../escaped'),),
+      ):
+        with self.subTest(names=[x.name for x in members]):
+          with make_tar(*members) as tar, self.assertRaises(ValueError):
+            hls_executor._extract_inputs(tar, cpp_dir)
+          # nothing is extracted if any member is unsafe
+          self.assertEqual(os.listdir(cpp_dir), [])
+          self.assertFalse(os.path.exists(os.path.join(tmpdir, 'escaped')))
+
+      with make_tar(make_file('Foo.cpp'), make_file('sub/Foo.h')) as tar:
+        hls_executor._extract_inputs(tar, cpp_dir)
+      self.assertEqual(
+          os.stat(os.path.join(cpp_dir, 'sub', 'Foo.h')).st_mode & 0o7777,
+          0o644)
+
+
+class TerminateProcessTreeTest(unittest.TestCase):
+
+  def test_terminate_process_tree(self):
+    # the shell ignores SIGTERM, so it has to be killed
+    proc = subprocess.Popen(
+        ['sh', '-c', 'trap "" TERM; sleep 60 & sleep 60 & wait; wait'])
+    self.addCleanup(proc.wait)
+    deadline = time.monotonic() + 10
+    while (len(scheduler.get_tree_pids(proc.pid)) < 3 and
+           time.monotonic() < deadline):
+      time.sleep(0.1)
+    pids = scheduler.get_tree_pids(proc.pid)
+    self.assertEqual(len(pids), 3)
+    hls_executor.terminate_process_tree(proc.pid, timeout=1.)
+    proc.wait(timeout=10)
+    for pid in pids:
+      self.assertFalse(hls_executor._is_alive(pid))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,453 @@
+"""Scheduling of HLS jobs based on the history of previous runs.
+
+HLS jobs vary in duration by orders of magnitude. If a long job is dispatched
+last, the whole build waits for it while other workers are idle. The history
+records the wall time and peak memory of each job so that the jobs of the next
+run can be dispatched in longest-predicted-first order. Jobs not seen before
+are predicted from their code size.
+
+While the jobs run, `ConcurrencyController` adapts the number of concurrent
+jobs to the free memory and the load of the host. Jobs that fail in a way that
+may succeed if retried are retried according to a `RetryPolicy`.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import os.path
+import random
+import tempfile
+import threading
+from typing import (Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, TypeVar)
+
+_logger = logging.getLogger().getChild(__name__)
+
+_T = TypeVar('_T')
+
+
+class JobStats(NamedTuple):
+  """Resource usage of a job.
+
+  Attributes:
+    code_size: Size of the input code in bytes.
+    wall_time: Wall time in seconds.
+    peak_rss: Peak resident set size of the whole process tree in bytes.
+  """
+  code_size: int
+  wall_time: float
+  peak_rss: int
+
+
+class History:
+  """Resource usage of previous jobs, persisted as a JSON file.
+
+  The file may be shared by concurrent processes; `save` merges the records of
+  this process into the latest content of the file.
+
+  Attributes:
+    filename: Path to the JSON file.
+  """
+
+  def __init__(self, filename: str):
+    self.filename = filename
+    self._records: Dict[str, JobStats] = self._load()
+    self._updates: Dict[str, JobStats] = {}
+    self._lock = threading.Lock()
+
+  def _load(self) -> Dict[str, JobStats]:
+    try:
+      with open(self.filename) as fileobj:
+        obj = json.load(fileobj)
+      return {name: JobStats(**stats) for name, stats in obj.items()}
+    except FileNotFoundError:
+      return {}
+    except (ValueError, TypeError) as e:
+      _logger.warning('ignoring malformed job history %s: %s', self.filename, e)
+      return {}
+
+  def record(self, name: str, stats: JobStats) -> None:
+    with self._lock:
+      self._records[name] = stats
+      self._updates[name] = stats
+
+  def predict(self, name: str, code_size: int) -> JobStats:
+    """Predict the resource usage of a job.
+
+    A job recorded before is assumed to scale linearly with its code size.
+    Other jobs use the average usage per byte of all recorded jobs. Without any
+    record, the code size is used as the wall time so that the relative order
+    of jobs is still meaningful.
+    """
+    with self._lock:
+      record = self._records.get(name)
+      records = list(self._records.values())
+    if record is not None and record.code_size > 0:
+      return JobStats(
+          code_size=code_size,
+          wall_time=record.wall_time * code_size / record.code_size,
+          peak_rss=record.peak_rss,
+      )
+    total_size = sum(x.code_size for x in records)
+    if total_size <= 0:
+      return JobStats(code_size=code_size,
+                      wall_time=float(code_size),
+                      peak_rss=0)
+    return JobStats(
+        code_size=code_size,
+        wall_time=sum(x.wall_time for x in records) * code_size / total_size,
+        peak_rss=sum(x.peak_rss for x in records) * code_size // total_size,
+    )
+
+  def save(self) -> None:
+    """Write the records of this process to the file atomically."""
+    with self._lock:
+      updates = dict(self._updates)
+    if not updates:
+      return
+    records = self._load()
+    records.update(updates)
+    dirname = os.path.dirname(os.path.abspath(self.filename))
+    os.makedirs(dirname, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w',
+                                     dir=dirname,
+                                     prefix='.history.',
+                                     delete=False) as fileobj:
+      json.dump({name: x._asdict() for name, x in records.items()},
+                fileobj,
+                indent=2,
+                sort_keys=True)
+    os.replace(fileobj.name, self.filename)
+
+
+class RetryPolicy(NamedTuple):
+  """Bounded retry with exponential backoff and jitter.
+
+  The delay before the n-th retry is `initial_delay * multiplier**(n - 1)`,
+  capped at `max_delay` and randomly shortened by up to `jitter` of itself so
+  that jobs that failed together do not retry together.
+
+  Attributes:
+    max_attempts: Maximum number of attempts, including the first one.
+    initial_delay: Delay in seconds before the first retry.
+    multiplier: Factor by which the delay grows after each retry.
+    max_delay: Maximum delay in seconds.
+    jitter: Fraction of the delay that is randomized, between 0 and 1.
+  """
+  max_attempts: int = 3
+  initial_delay: float = 10.
+  multiplier: float = 2.
+  max_delay: float = 300.
+  jitter: float = 0.5
+
+  def get_delay(self, retry: int) -> float:
+    """Return the delay in seconds before the retry-th retry, starting at 1."""
+    delay = min(self.max_delay,
+                self.initial_delay * self.multiplier**(retry - 1))
+    return delay * (1 - self.jitter * random.random())
+
+
+def sort_by_cost(
+    jobs: Iterable[_T],
+    get_cost: Callable[[_T], float],
+) -> List[_T]:
+  """Return jobs in descending order of cost, keeping the order of ties."""
+  return sorted(jobs, key=get_cost, reverse=True)
+
+
+def get_makespan_lower_bound(
+    wall_times: Iterable[float],
+    workers: int,
+) -> float:
+  """Return the lower bound of the makespan of jobs on parallel workers.
+
+  No schedule finishes before the longest job does, nor before the total work
+  is evenly divided among the workers.
+  """
+  wall_time_list = list(wall_times)
+  if not wall_time_list:
+    return 0.
+  return max(max(wall_time_list), sum(wall_time_list) / max(workers, 1))
+
+
+def _get_children() -> Dict[int, List[int]]:
+  children: Dict[int, List[int]] = {}
+  for entry in os.listdir('/proc'):
+    if not entry.isdigit():
+      continue
+    try:
+      with open(f'/proc/{entry}/stat') as fileobj:
+        stat = fileobj.read()
+    except OSError:
+      continue  # the process has exited
+    # the command name may contain spaces and is enclosed by parentheses
+    ppid = int(stat[stat.rfind(')') + 2:].split()[1])
+    children.setdefault(ppid, []).append(int(entry))
+  return children
+
+
+def _get_rss(pid: int) -> int:
+  try:
+    with open(f'/proc/{pid}/statm') as fileobj:
+      return int(fileobj.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, IndexError, ValueError):
+    return 0
+
+
+def get_tree_pids(*roots: int) -> List[int]:
+  """Return the PIDs of processes and their descendants, parents first.
+
+  Returns only the given PIDs if /proc is not available.
+  """
+  if not os.path.isdir('/proc'):
+    return list(roots)
+  children = _get_children()
+  pids = list(dict.fromkeys(roots))
+  for pid in pids:
+    pids.extend(children.get(pid, ()))
+  return list(dict.fromkeys(pids))
+
+
+def get_tree_rss(*roots: int) -> int:
+  """Return the total resident set size of processes and their descendants.
+
+  Returns 0 if /proc is not available.
+  """
+  if not os.path.isdir('/proc') or not roots:
+    return 0
+  return sum(map(_get_rss, get_tree_pids(*roots)))
+
+
+class PeakRssMonitor:
+  """Sample the peak resident set size of a process tree in the background.
+
+  Usage:
+    with PeakRssMonitor(proc.pid) as monitor:
+      proc.wait()
+    peak_rss = monitor.peak_rss
+  """
+
+  def __init__(self, pid: int, interval: float = 1.):
+    self.pid = pid
+    self.interval = interval
+    self.peak_rss = 0
+    self._stop = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+
+  def _run(self) -> None:
+    while True:
+      self.peak_rss = max(self.peak_rss, get_tree_rss(self.pid))
+      if self._stop.wait(self.interval):
+        break
+
+  def __enter__(self) -> 'PeakRssMonitor':
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, *args) -> None:
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+
+def get_available_memory() -> Optional[int]:
+  """Return the memory available for new processes in bytes, if known."""
+  try:
+    with open('/proc/meminfo') as fileobj:
+      for line in fileobj:
+        if line.startswith('MemAvailable:'):
+          return int(line.split()[1]) * 1024
+  except (OSError, IndexError, ValueError):
+    pass
+  return None
+
+
+class ConcurrencyController:
+  """Admission control of concurrent jobs based on the host resources.
+
+  A background thread periodically samples the available memory, the load
+  average, and the RSS of the jobs, i.e., of the processes tracked by the jobs
+  and their descendants. Other child processes, e.g., workers parsing RTL, are
+  not counted as jobs. The number of concurrent jobs is
+  lowered if other processes load the host. A job is started only if the memory
+  left after all running jobs reach their predicted peak still covers the
+  reserve, and no job is started while the available memory is below the
+  reserve. Jobs are admitted in the order they request a slot. A job is always
+  admitted if no job is running, so that the build makes progress on busy hosts.
+
+  Jobs that fail because the host is overloaded should call `throttle`, which
+  halves the number of concurrent jobs; each job that succeeds afterwards
+  allows one more concurrent job again until `max_jobs` is reached.
+
+  Usage:
+    with ConcurrencyController(max_jobs=8) as controller:
+      ...
+      with controller.slot(predicted_rss) as track:
+        proc = start_job()
+        track(proc.pid)
+
+  Attributes:
+    max_jobs: Maximum number of concurrent jobs.
+    memory_reserve: Memory in bytes that is kept available for other processes.
+    job_memory: Memory in bytes assumed for a job without a prediction, until
+        larger jobs are observed.
+    interval: Sampling interval in seconds.
+    limit: Current maximum number of concurrent jobs.
+    running: Current number of running jobs.
+  """
+
+  def __init__(
+      self,
+      max_jobs: int,
+      memory_reserve: int = 2 << 30,
+      job_memory: int = 1 << 30,
+      interval: float = 5.,
+  ):
+    self.max_jobs = max(1, max_jobs)
+    self.memory_reserve = memory_reserve
+    self.job_memory = job_memory
+    self.interval = interval
+    self.limit = self.max_jobs
+    self.running = 0
+    self._cap = self.max_jobs  # lowered by throttle
+    self._mem_available: Optional[int] = None
+    self._children_rss = 0
+    self._committed_rss = 0  # sum of the predicted peaks of running jobs
+    self._pids: Dict[object, int] = {}  # processes of running jobs
+    self._is_paused = False
+    self._is_cancelled = False
+    self._queue: Deque[object] = collections.deque()
+    self._cond = threading.Condition()
+    self._stop = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+
+  def __enter__(self) -> 'ConcurrencyController':
+    self._sample()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, *args) -> None:
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def _run(self) -> None:
+    while not self._stop.wait(self.interval):
+      self._sample()
+
+  def _sample(self) -> None:
+    mem_available = get_available_memory()
+    load = os.getloadavg()[0]
+    with self._cond:
+      pids = tuple(self._pids.values())
+    children_rss = get_tree_rss(*pids)
+    with self._cond:
+      if self.running > 0:
+        self.job_memory = max(self.job_memory, children_rss // self.running)
+      self._children_rss = children_rss
+
+      # running jobs contribute to the load average themselves
+      external_load = max(0., load - self.running)
+      limit = max(
+          1,
+          min(self._cap, int((os.cpu_count() or 1) - external_load)),
+      )
+      if limit != self.limit:
+        _logger.debug('concurrency limit changed from %d to %d (load: %.2f)',
+                      self.limit, limit, load)
+      self.limit = limit
+
+      self._mem_available = mem_available
+      is_paused = (mem_available is not None and
+                   mem_available < self.memory_reserve)
+      if is_paused and not self._is_paused:
+        _logger.warning(
+            'pausing new jobs: only %d MiB of memory is available',
+            mem_available >> 20,
+        )
+      elif self._is_paused and not is_paused:
+        _logger.info('resuming new jobs')
+      self._is_paused = is_paused
+      self._cond.notify_all()
+
+  def throttle(self) -> None:
+    """Halve the number of concurrent jobs, e.g., after a flaky failure."""
+    with self._cond:
+      self._cap = max(1, min(self._cap, self.limit) // 2)
+      if self._cap < self.limit:
+        _logger.info('concurrency limit lowered from %d to %d', self.limit,
+                     self._cap)
+        self.limit = self._cap
+
+  def recover(self) -> None:
+    """Allow one more concurrent job, e.g., after a job succeeds."""
+    with self._cond:
+      self._cap = min(self.max_jobs, self._cap + 1)
+
+  def cancel(self) -> None:
+    """Make all jobs waiting for a slot, now or later, raise CancelledError."""
+    with self._cond:
+      self._is_cancelled = True
+      self._cond.notify_all()
+
+  def _get_estimate(self, rss: int) -> int:
+    return rss if rss > 0 else self.job_memory
+
+  def _can_start(self, rss: int) -> bool:
+    if self.running == 0:
+      return True
+    if self.running >= self.limit or self._is_paused:
+      return False
+    if self._mem_available is None:
+      return True
+    # memory of running jobs that is already in use is not available
+    mem_left = (self._mem_available + self._children_rss -
+                max(self._committed_rss, self._children_rss))
+    return mem_left - self._get_estimate(rss) >= self.memory_reserve
+
+  @contextlib.contextmanager
+  def slot(self, rss: int = 0) -> Iterator[Callable[[int], None]]:
+    """Wait until a job predicted to use rss bytes of memory can start.
+
+    Args:
+      rss: Predicted peak RSS of the job in bytes; 0 if unknown.
+
+    Yields:
+      A function that the job calls with the PID of the process it starts, so
+      that its memory is counted until the slot is released.
+
+    Raises:
+      concurrent.futures.CancelledError: If the controller is cancelled.
+    """
+    ticket = object()
+    with self._cond:
+      self._queue.append(ticket)
+      try:
+        while not (self._queue[0] is ticket and self._can_start(rss)):
+          if self._is_cancelled:
+            raise concurrent.futures.CancelledError()
+          self._cond.wait(self.interval)
+      finally:
+        self._queue.remove(ticket)
+      estimate = self._get_estimate(rss)
+      self.running += 1
+      self._committed_rss += estimate
+      self._cond.notify_all()
+
+    def track(pid: int) -> None:
+      with self._cond:
+        self._pids[ticket] = pid
+
+    try:
+      yield track
+    finally:
+      with self._cond:
+        self.running -= 1
+        self._committed_rss -= estimate
+        self._pids.pop(ticket, None)
+        self._cond.notify_all()
@@ -0,0 +1,256 @@
+# pylint: disable=protected-access
+
+import concurrent.futures
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from tapa import scheduler
+
+GiB = 1 << 30
+MiB = 1 << 20
+
+# minimal Tcl script that tapa.fake_hls accepts
+FAKE_HLS_TCL = '''
+cd "{project_dir}"
+open_project "project"
+set_top Foo
+open_solution "Foo"
+'''
+
+
+class HistoryTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-scheduler-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.filename = os.path.join(tmpdir.name, 'history.json')
+
+  def test_predict_without_history(self):
+    history = scheduler.History(self.filename)
+    self.assertEqual(
+        history.predict('Foo', 100),
+        scheduler.JobStats(code_size=100, wall_time=100., peak_rss=0))
+
+  def test_predict_with_history(self):
+    history = scheduler.History(self.filename)
+    history.record('Foo', scheduler.JobStats(100, 10., 4 * GiB))
+    history.record('Bar', scheduler.JobStats(300, 50., 2 * GiB))
+    # recorded jobs scale linearly with their code size
+    self.assertEqual(history.predict('Foo', 200),
+                     scheduler.JobStats(200, 20., 4 * GiB))
+    # other jobs use the average of all recorded jobs
+    self.assertEqual(history.predict('Baz', 200),
+                     scheduler.JobStats(200, 30., 3 * GiB))
+
+  def test_save_merges_records(self):
+    history = scheduler.History(self.filename)
+    other = scheduler.History(self.filename)
+    history.record('Foo', scheduler.JobStats(100, 10., 0))
+    other.record('Bar', scheduler.JobStats(100, 20., 0))
+    history.save()
+    other.save()
+    self.assertEqual(
+        scheduler.History(self.filename).predict('Foo', 100),
+        scheduler.JobStats(100, 10., 0))
+    self.assertEqual(
+        scheduler.History(self.filename).predict('Bar', 100),
+        scheduler.JobStats(100, 20., 0))
+
+
+class SortByCostTest(unittest.TestCase):
+
+  def test_sort_by_cost(self):
+    jobs = ['a', 'bb', 'c', 'dddd', 'ee']
+    self.assertEqual(scheduler.sort_by_cost(jobs, len),
+                     ['dddd', 'bb', 'ee', 'a', 'c'])
+
+  def test_sort_by_predicted_wall_time(self):
+    with tempfile.TemporaryDirectory(prefix='tapa-scheduler-test-') as tmpdir:
+      history = scheduler.History(os.path.join(tmpdir, 'history.json'))
+      code_sizes = {'Small': 10, 'Medium': 20, 'Large': 30}
+
+      def get_order():
+        return scheduler.sort_by_cost(
+            code_sizes, lambda x: history.predict(x, code_sizes[x]).wall_time)
+
+      # without history, larger code is predicted to take longer
+      self.assertEqual(get_order(), ['Large', 'Medium', 'Small'])
+
+      # the history overrides the code size
+      history.record('Small', scheduler.JobStats(10, 1000., 0))
+      history.record('Large', scheduler.JobStats(30, 3., 0))
+      self.assertEqual(get_order(), ['Small', 'Medium', 'Large'])
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+  def test_backoff_without_jitter(self):
+    policy = scheduler.RetryPolicy(initial_delay=10.,
+                                   multiplier=2.,
+                                   max_delay=50.,
+                                   jitter=0.)
+    self.assertEqual([policy.get_delay(x) for x in range(1, 6)],
+                     [10., 20., 40., 50., 50.])
+
+  def test_backoff_with_jitter(self):
+    policy = scheduler.RetryPolicy(initial_delay=10., max_delay=50., jitter=.5)
+    for retry, delay in (1, 10.), (2, 20.), (10, 50.):
+      with unittest.mock.patch('random.random', return_value=0.):
+        self.assertEqual(policy.get_delay(retry), delay)
+      with unittest.mock.patch('random.random', return_value=1.):
+        self.assertEqual(policy.get_delay(retry), delay / 2)
+      for _ in range(100):
+        self.assertGreaterEqual(policy.get_delay(retry), delay / 2)
+        self.assertLessEqual(policy.get_delay(retry), delay)
+
+  def test_default_limits(self):
+    policy = scheduler.RetryPolicy()
+    self.assertGreater(policy.max_attempts, 1)
+    self.assertLessEqual(policy.get_delay(100), policy.max_delay)
+
+
+class MakespanLowerBoundTest(unittest.TestCase):
+
+  def test_no_jobs(self):
+    self.assertEqual(scheduler.get_makespan_lower_bound([], 4), 0.)
+
+  def test_longest_job(self):
+    self.assertEqual(scheduler.get_makespan_lower_bound([10., 1., 1.], 4), 10.)
+
+  def test_total_work(self):
+    self.assertEqual(scheduler.get_makespan_lower_bound([3., 3., 3., 3.], 2),
+                     6.)
+
+  def test_no_workers(self):
+    self.assertEqual(scheduler.get_makespan_lower_bound([1., 2.], 0), 3.)
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mem_available = 16 * GiB
+    self.load = 0.
+    for target, getter in (
+        ('tapa.scheduler.get_available_memory', lambda: self.mem_available),
+        ('os.getloadavg', lambda: (self.load,) * 3),
+        ('os.cpu_count', lambda: 8),
+    ):
+      patcher = unittest.mock.patch(target, side_effect=getter)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.controller = scheduler.ConcurrencyController(max_jobs=4,
+                                                      memory_reserve=2 * GiB,
+                                                      job_memory=GiB,
+                                                      interval=0.01)
+    self.controller._sample()
+    self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+    self.addCleanup(self.pool.shutdown)
+    self.release = threading.Event()
+    self.addCleanup(self.release.set)
+
+  def start_jobs(self, *predicted_rss: int):
+    started = [threading.Event() for _ in predicted_rss]
+
+    def job(rss: int, event: threading.Event):
+      with self.controller.slot(rss):
+        event.set()
+        self.release.wait()
+
+    for rss, event in zip(predicted_rss, started):
+      self.pool.submit(job, rss, event)
+    time.sleep(0.2)
+    return [x.is_set() for x in started]
+
+  def test_admits_jobs_that_fit_in_memory(self):
+    # 16 GiB - 2 GiB reserve fits 2 jobs of 5 GiB, but not a third one
+    self.assertEqual(self.start_jobs(5 * GiB, 5 * GiB, 5 * GiB),
+                     [True, True, False])
+
+  def test_admits_up_to_max_jobs(self):
+    self.assertEqual(self.start_jobs(*[0] * 5), [True] * 4 + [False])
+
+  def test_admits_first_job_even_if_paused(self):
+    self.mem_available = GiB
+    self.controller._sample()
+    self.assertEqual(self.start_jobs(0, 0), [True, False])
+
+  def test_resumes_once_memory_is_available(self):
+    self.mem_available = GiB
+    self.controller._sample()
+    self.assertEqual(self.start_jobs(0, 0), [True, False])
+    self.mem_available = 16 * GiB
+    self.controller._sample()
+    time.sleep(0.2)
+    self.assertEqual(self.controller.running, 2)
+
+  def test_external_load_lowers_limit(self):
+    self.load = 6.
+    self.controller._sample()
+    self.assertEqual(self.controller.limit, 2)
+    self.assertEqual(self.start_jobs(0, 0, 0), [True, True, False])
+
+  def test_throttle_and_recover(self):
+    self.controller.throttle()
+    self.assertEqual(self.controller.limit, 2)
+    self.controller.throttle()
+    self.controller.throttle()
+    self.assertEqual(self.controller.limit, 1)
+    for _ in range(10):
+      self.controller.recover()
+    self.controller._sample()
+    self.assertEqual(self.controller.limit, 4)
+
+  def test_cancel(self):
+    self.assertEqual(self.start_jobs(0, 5 * GiB, 20 * GiB), [True, True, False])
+    self.controller.cancel()
+    with self.assertRaises(concurrent.futures.CancelledError):
+      with self.controller.slot(20 * GiB):
+        pass
+
+  def test_rss_of_fake_hls(self):
+    memory = 64
+    controller = scheduler.ConcurrencyController(max_jobs=4,
+                                                 memory_reserve=2 * GiB,
+                                                 job_memory=16 * MiB,
+                                                 interval=0.01)
+    # there is room for a second job only if it is as small as guessed
+    self.mem_available = 2 * GiB + 32 * MiB
+    controller._sample()
+    with tempfile.TemporaryDirectory(prefix='tapa-scheduler-test-') as tmpdir:
+      tcl_file = os.path.join(tmpdir, 'commands.tcl')
+      with open(tcl_file, 'w') as fileobj:
+        fileobj.write(FAKE_HLS_TCL.format(project_dir=tmpdir))
+      env = dict(
+          os.environ,
+          PYTHONPATH=os.path.dirname(os.path.dirname(__file__)),
+          TAPA_FAKE_HLS_MEMORY=str(memory),
+          TAPA_FAKE_HLS_DURATION='30',
+      )
+      with controller.slot(0) as track, subprocess.Popen(
+          [sys.executable, '-m', 'tapa.fake_hls', '-f', tcl_file],
+          cwd=tmpdir,
+          env=env,
+          stdout=subprocess.PIPE,
+      ) as proc:
+        try:
+          track(proc.pid)
+          self.assertTrue(controller._can_start(0))
+          # the memory is allocated before the first progress message
+          proc.stdout.readline()
+          controller._sample()
+          self.assertGreaterEqual(controller._children_rss, memory * MiB)
+          # jobs without predictions are assumed to use as much as this job
+          self.assertGreaterEqual(controller.job_memory, memory * MiB)
+          self.assertFalse(controller._can_start(0))
+        finally:
+          proc.terminate()
+
+
+if __name__ == '__main__':
+  unittest.main()
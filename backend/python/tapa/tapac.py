@@ -1,5 +1,7 @@
 #!/usr/bin/python3
 import argparse
+import functools
+import glob
 import io
 import json
 import logging
@@ -8,11 +10,11 @@ import os.path
 import re
 import shutil
 import subprocess
-from typing import Any, Dict, Optional
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Tuple
 
-import haoda.backend.xilinx
-
-import tapa.core
+import tapa.cache
+import tapa.scheduler
 
 logging.basicConfig(
     level=logging.WARNING,
@@ -23,6 +25,12 @@ logging.basicConfig(
 
 _logger = logging.getLogger().getChild(__name__)
 
+# Parsed ASTs are much smaller than HLS results.
+_AST_CACHE_SIZE = 4 << 30
+
+# Formatted C++ code is smaller still.
+_CPP_CACHE_SIZE = 1 << 30
+
 
 def main():
   parser = argparse.ArgumentParser(prog='tapac', description='TAPA compiler')
@@ -41,6 +49,62 @@ def main():
                       metavar='file',
                       dest='tapacc',
                       help='override tapacc')
+  parser.add_argument('--hls',
+                      type=str,
+                      metavar='command',
+                      dest='hls',
+                      default='vitis_hls',
+                      help='override the HLS command, e.g., tapa-fake-hls for '
+                      'testing (default: %(default)s)')
+  parser.add_argument('--hls-workers',
+                      type=str,
+                      metavar='host:port[,host:port...]',
+                      dest='hls_workers',
+                      help='run HLS on workers started by tapa-hls-worker '
+                      'instead of this host; list a worker multiple times to '
+                      'run multiple jobs on it concurrently; the shared token '
+                      'is read from $TAPA_HLS_WORKER_TOKEN')
+  parser.add_argument('--keep-going',
+                      '-k',
+                      action='store_true',
+                      dest='keep_going',
+                      help='run HLS for all tasks even if some of them fail, '
+                      'instead of stopping at the first failure')
+  parser.add_argument('--resume',
+                      action='store_true',
+                      dest='resume',
+                      help='skip HLS for tasks whose results in the working '
+                      'directory are intact and up to date')
+  parser.add_argument('--pipeline',
+                      action='store_true',
+                      dest='pipeline',
+                      help='extract and parse the RTL of each task as soon as '
+                      'its HLS finishes, and instrument upper-level tasks as '
+                      'soon as their children are ready')
+  parser.add_argument('--no-hls-dedup',
+                      action='store_false',
+                      dest='hls_dedup',
+                      help='synthesize tasks separately even if their code is '
+                      'identical except for the task name')
+  parser.add_argument('--hls-upper-tasks',
+                      action='store_true',
+                      dest='hls_upper_tasks',
+                      help='run HLS for upper-level tasks instead of '
+                      'generating their shells from the ports')
+  parser.add_argument('--hls-max-attempts',
+                      type=int,
+                      metavar='N',
+                      dest='hls_max_attempts',
+                      default=tapa.scheduler.RetryPolicy().max_attempts,
+                      help='maximum number of HLS attempts of a task that '
+                      'fails in a flaky way (default: %(default)s)')
+  parser.add_argument('--hls-retry-delay',
+                      type=float,
+                      metavar='seconds',
+                      dest='hls_retry_delay',
+                      default=tapa.scheduler.RetryPolicy().initial_delay,
+                      help='delay before the first HLS retry; doubled for '
+                      'each further retry (default: %(default)s)')
   parser.add_argument(
       '--work-dir',
       type=str,
@@ -110,6 +174,27 @@ def main():
                      dest='pack_xo',
                      help='package as Xilinx object')
 
+  group = parser.add_argument_group('caching')
+  group.add_argument('--cache-dir',
+                     type=str,
+                     dest='cache_dir',
+                     metavar='dir',
+                     default=tapa.cache.DEFAULT_CACHE_DIR,
+                     help='directory of persistent caches '
+                     '(default: %(default)s)')
+  group.add_argument('--no-cache',
+                     action='store_true',
+                     dest='no_cache',
+                     help='do not read or write persistent caches')
+  group.add_argument('--hls-cache-size',
+                     type=float,
+                     dest='hls_cache_size',
+                     metavar='GiB',
+                     default=32,
+                     help='size limit of the HLS result cache in GiB; '
+                     'least recently used results are evicted '
+                     '(default: %(default)s)')
+
   group = parser.add_argument_group('floorplanning')
   group.add_argument('--connectivity',
                      type=argparse.FileType('r'),
@@ -160,14 +245,15 @@ def main():
   cflag_list = []
   if args.cflags is not None:
     cflag_list = args.cflags.strip().split()
+  probe_cache = None
+  if not args.no_cache:
+    probe_cache = tapa.cache.ProbeCache(
+        os.path.join(args.cache_dir, 'probes.json'))
 
   if all_steps or args.run_tapacc is not None:
     tapacc_cmd = []
     # set tapacc executable
-    if args.tapacc is None:
-      tapacc = shutil.which('tapacc')
-    else:
-      tapacc = args.tapacc
+    tapacc = shutil.which('tapacc' if args.tapacc is None else args.tapacc)
     if tapacc is None:
       parser.error('cannot find tapacc')
     tapacc_cmd += tapacc, args.input_file
@@ -184,59 +270,41 @@ def main():
     )
     tapacc_cmd += '-top', args.top, '--', '-I', tapa_include_dir
 
-    # find clang include location
-    tapacc_version = subprocess.check_output(
-        [tapacc, '-version'],
-        universal_newlines=True,
-    )
-    match = re.compile(R'LLVM version (\d+)(\.\d+)*').search(tapacc_version)
-    if match is None:
-      parser.error(f'failed to parse tapacc output: {tapacc_version}')
-    clang_version = match[1]
-    clang_include = os.path.join('/', 'usr', 'lib', 'clang', clang_version,
-                                 'include')
-    if not os.path.isdir(clang_include):
-      parser.error(f'missing clang include directory: {clang_include}')
+    tapacc_version, clang_version, clang_include = _probe_tapacc(
+        parser, tapacc, probe_cache)
     tapacc_cmd += '-I', clang_include
     tapacc_cmd += cflag_list
 
-    proc = subprocess.run(tapacc_cmd,
-                          stdout=subprocess.PIPE,
-                          universal_newlines=True,
-                          check=False)
-    if proc.returncode != 0:
-      parser.exit(status=proc.returncode)
-    tapa_program_json_dict = json.loads(proc.stdout)
-
-    # Use -MM to find all user headers
-    input_file_basename = os.path.basename(args.input_file)
-    input_file_dirname = os.path.dirname(args.input_file) or '.'
-    deps: str = subprocess.check_output([
-        'clang++-' + clang_version,
-        '-MM',
-        input_file_basename,
-        '-I',
-        tapa_include_dir,
-        *cflag_list,
-    ],
-                                        cwd=input_file_dirname,
-                                        universal_newlines=True)
-    # partition -MM output at '.o: '
-    deps = deps.rstrip('\n').partition('.o: ')[-1].replace('\\\n', ' ')
-    # split at non-escaped space and replace escaped spaces with spaces
-    dep_set = {x.replace('\\ ', ' ') for x in re.split(r'(?<!\\) ', deps)}
-    dep_set = set(
-        filter(
-            lambda x: not os.path.isabs(x) and x not in {
-                '',
-                input_file_basename,
-                os.path.join(tapa_include_dir, 'tapa.h'),
-            }, dep_set))
-    for dep in dep_set:
-      tapa_program_json_dict.setdefault('headers', {})
-      with open(os.path.join(input_file_dirname, dep), 'r') as dep_fp:
-        tapa_program_json_dict['headers'][dep] = dep_fp.read()
-    tapa_program_json_str = json.dumps(tapa_program_json_dict, indent=2)
+    # `tapacc -version` only tells the LLVM version, so a rebuilt tapacc is
+    # told apart by its binary instead
+    tapacc_stat = os.stat(tapacc)
+    # relative paths in the command and in cflags depend on the working dir
+    tapacc_key = tapa.cache.get_key(
+        os.path.realpath(tapacc),
+        [tapacc_stat.st_mtime_ns, tapacc_stat.st_size],
+        tapacc_version,
+        tapacc_cmd,
+        os.getcwd(),
+        tapa.cache.get_file_digest(args.input_file),
+    )
+    tapacc_cache = None
+    tapa_program_json_str = None
+    if not args.no_cache:
+      tapacc_cache = tapa.cache.Cache(os.path.join(args.cache_dir, 'tapacc'))
+      tapa_program_json_str = _get_cached_tapacc_output(tapacc_cache,
+                                                        tapacc_key)
+    if tapa_program_json_str is None:
+      tapa_program_json_str, dep_files = _run_tapacc(
+          parser,
+          tapacc_cmd,
+          clang_version=clang_version,
+          input_file=args.input_file,
+          tapa_include_dir=tapa_include_dir,
+          cflag_list=cflag_list,
+      )
+      if tapacc_cache is not None:
+        _put_cached_tapacc_output(tapacc_cache, tapacc_key, dep_files,
+                                  tapa_program_json_str)
 
     # save program.json if work_dir is set or run_tapacc is the last step
     if args.work_dir is not None or last_step == 'run_tapacc':
@@ -255,6 +323,10 @@ def main():
       tapa_program_json = lambda: open(
           os.path.join(args.work_dir, 'program.json'))
 
+  # only the FRT interface needs the program if tapacc is the last step
+  if last_step == 'run_tapacc' and args.frt_interface is None:
+    return
+
   cflags = ' -I' + os.path.join(
       os.path.dirname(tapa.__file__),
       'assets',
@@ -262,25 +334,75 @@ def main():
   )
   if args.cflags is not None:
     cflags += ' ' + args.cflags
+  # imported here so that `tapac --help` does not pay for the heavy imports
+  # pylint: disable=import-outside-toplevel
+  from tapa.core import Program
+
   with tapa_program_json() as tapa_program_json_obj:
-    program = tapa.core.Program(tapa_program_json_obj,
-                                cflags=cflags,
-                                work_dir=args.work_dir)
+    program = Program(tapa_program_json_obj,
+                      cflags=cflags,
+                      work_dir=args.work_dir)
 
   if args.frt_interface is not None and program.frt_interface is not None:
     with open(args.frt_interface, 'w') as output_fp:
       output_fp.write(program.frt_interface)
 
   if all_steps or args.extract_cpp is not None:
-    program.extract_cpp()
+    cpp_cache = None
+    if not args.no_cache:
+      cpp_cache = tapa.cache.Cache(
+          os.path.join(args.cache_dir, 'cpp'),
+          max_size=_CPP_CACHE_SIZE,
+      )
+    program.extract_cpp(probe_cache, cpp_cache)
 
-  if all_steps or args.run_hls is not None:
-    program.run_hls(**_get_device_info(parser, args))
+  run_hls = all_steps or args.run_hls is not None
+  extract_rtl = all_steps or args.extract_rtl is not None
+  instrument_rtl = all_steps or args.instrument_rtl is not None
+  if args.pipeline and not (run_hls and extract_rtl and instrument_rtl):
+    parser.error('--pipeline requires running HLS, extracting RTL, and '
+                 'instrumenting RTL')
 
-  if all_steps or args.extract_rtl is not None:
-    program.extract_rtl()
+  if run_hls:
+    if args.resume and args.work_dir is None:
+      parser.error('--resume requires --work-dir')
+    hls_cache = None
+    hls_history_file = None
+    if not args.no_cache:
+      hls_cache = tapa.cache.Cache(
+          os.path.join(args.cache_dir, 'hls'),
+          max_size=int(args.hls_cache_size * 2**30),
+      )
+      # shared by all programs so new tasks can be predicted from old ones
+      hls_history_file = os.path.join(args.cache_dir, 'hls_history.json')
+    hls_executor = None
+    if args.hls_workers is not None:
+      # pylint: disable=import-outside-toplevel
+      from tapa.hls_executor import TOKEN_ENV, RemoteExecutor, parse_address
+      try:
+        hls_executor = RemoteExecutor(
+            (parse_address(x) for x in args.hls_workers.split(',') if x),
+            token=os.environ.get(TOKEN_ENV, ''),
+        )
+      except ValueError as e:
+        parser.error(str(e))
+    hls_kwargs = dict(
+        **_get_device_info(parser, args, probe_cache),
+        cache=hls_cache,
+        history_file=hls_history_file,
+        hls=args.hls,
+        executor=hls_executor,
+        keep_going=args.keep_going,
+        resume=args.resume,
+        dedup=args.hls_dedup,
+        hls_upper_tasks=args.hls_upper_tasks,
+        retry_policy=tapa.scheduler.RetryPolicy(
+            max_attempts=args.hls_max_attempts,
+            initial_delay=args.hls_retry_delay,
+        ),
+    )
 
-  if all_steps or args.instrument_rtl is not None:
+  if instrument_rtl:
     directive: Optional[Dict[str, Any]] = None
     if args.directive is not None and args.constraint is not None:
       # Read floorplan from `args.directive` and write TCL commands to
@@ -297,27 +419,229 @@ def main():
       # commands to `args.constraint`.
       directive = dict(
           connectivity=args.connectivity,
-          part_num=_get_device_info(parser, args)['part_num'],
+          part_num=_get_device_info(parser, args, probe_cache)['part_num'],
           constraint=args.constraint,
       )
     if args.register_level is not None:
       if args.register_level <= 0:
         parser.error('register level must be positive')
-    program.instrument_rtl(directive, args.register_level or 0)
+    ast_cache = None
+    if not args.no_cache:
+      ast_cache = tapa.cache.Cache(
+          os.path.join(args.cache_dir, 'ast'),
+          max_size=_AST_CACHE_SIZE,
+      )
+
+  if args.pipeline:
+    program.run_pipeline(
+        directive=directive,
+        register_level=args.register_level or 0,
+        rtl_cache=ast_cache,
+        **hls_kwargs,
+    )
+  else:
+    if run_hls:
+      program.run_hls(**hls_kwargs)
+    if extract_rtl:
+      program.extract_rtl()
+    if instrument_rtl:
+      program.instrument_rtl(directive, args.register_level or 0, ast_cache)
 
   if all_steps or args.pack_xo is not None:
     with open(args.output_file, 'wb') as packed_obj:
       program.pack_rtl(packed_obj)
 
 
+@functools.lru_cache(maxsize=None)
+def _probe_tapacc(
+    parser: argparse.ArgumentParser,
+    tapacc: str,
+    probe_cache: Optional[tapa.cache.ProbeCache] = None,
+) -> Tuple[str, str, str]:
+  """Find the clang version and include location of tapacc.
+
+  Returns:
+    Tuple of the output of `tapacc -version`, the clang major version, and the
+    clang include directory.
+  """
+  tapacc = os.path.realpath(tapacc)
+  if probe_cache is not None:
+    result = probe_cache.get('tapacc', tapacc)
+    if result is not None:
+      return tuple(result)
+  tapacc_version = subprocess.check_output(
+      [tapacc, '-version'],
+      universal_newlines=True,
+  )
+  match = re.compile(R'LLVM version (\d+)(\.\d+)*').search(tapacc_version)
+  if match is None:
+    parser.error(f'failed to parse tapacc output: {tapacc_version}')
+  clang_version = match[1]
+  clang_include = os.path.join('/', 'usr', 'lib', 'clang', clang_version,
+                               'include')
+  if not os.path.isdir(clang_include):
+    parser.error(f'missing clang include directory: {clang_include}')
+  result = tapacc_version, clang_version, clang_include
+  if probe_cache is not None:
+    probe_cache.put('tapacc', tapacc, result, (tapacc, clang_include))
+  return result
+
+
+def _run_tapacc(
+    parser: argparse.ArgumentParser,
+    tapacc_cmd: List[str],
+    clang_version: str,
+    input_file: str,
+    tapa_include_dir: str,
+    cflag_list: List[str],
+) -> Tuple[str, List[str]]:
+  """Run tapacc and collect the user headers of the input file.
+
+  Returns:
+    Tuple of the program.json content and the absolute paths of the files it
+    depends on, i.e., the input file and its transitive user headers.
+  """
+  input_file_basename = os.path.basename(input_file)
+  input_file_dirname = os.path.dirname(input_file) or '.'
+
+  # the header scan does not depend on tapacc, so run both at the same time
+  with futures.ThreadPoolExecutor(max_workers=2) as pool:
+    tapacc_future = pool.submit(
+        subprocess.run,
+        tapacc_cmd,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=False,
+    )
+    # Use -MM to find all user headers
+    deps_future = pool.submit(
+        subprocess.check_output,
+        [
+            'clang++-' + clang_version,
+            '-MM',
+            input_file_basename,
+            '-I',
+            tapa_include_dir,
+            *cflag_list,
+        ],
+        cwd=input_file_dirname,
+        universal_newlines=True,
+    )
+    proc = tapacc_future.result()
+    if proc.returncode != 0:
+      parser.exit(status=proc.returncode)
+    tapa_program_json_dict = json.loads(proc.stdout)
+    deps: str = deps_future.result()
+
+  # partition -MM output at '.o: '
+  deps = deps.rstrip('\n').partition('.o: ')[-1].replace('\\\n', ' ')
+  # split at non-escaped space and replace escaped spaces with spaces
+  dep_set = {x.replace('\\ ', ' ') for x in re.split(r'(?<!\\) ', deps)}
+  dep_set.discard('')
+  # -MM omits system headers, so these are all files that affect the output
+  dep_files = sorted(
+      os.path.abspath(os.path.join(input_file_dirname, x)) for x in dep_set)
+  dep_set = set(
+      filter(
+          lambda x: not os.path.isabs(x) and x not in {
+              input_file_basename,
+              os.path.join(tapa_include_dir, 'tapa.h'),
+          }, dep_set))
+  for dep in dep_set:
+    tapa_program_json_dict.setdefault('headers', {})
+    with open(os.path.join(input_file_dirname, dep), 'r') as dep_fp:
+      tapa_program_json_dict['headers'][dep] = dep_fp.read()
+  return json.dumps(tapa_program_json_dict, indent=2), dep_files
+
+
+def _get_tapacc_output_key(tapacc_key: str,
+                           dep_files: List[str]) -> Optional[str]:
+  """Return the cache key of the tapacc output, or None if a file is gone."""
+  try:
+    dep_digests = {x: tapa.cache.get_file_digest(x) for x in dep_files}
+  except OSError:
+    return None
+  return tapa.cache.get_key(tapacc_key, dep_digests)
+
+
+def _get_cached_tapacc_output(cache: tapa.cache.Cache,
+                              tapacc_key: str) -> Optional[str]:
+  """Return the cached program.json content if no dependency has changed.
+
+  The output is cached in two levels like ccache does: the tapacc command
+  and the input file determine the list of dependencies, and the contents of
+  the dependencies determine the output. This way, neither tapacc nor the
+  dependency scan runs on a hit.
+  """
+  buf = io.BytesIO()
+  if not cache.get(tapacc_key, buf):
+    return None
+  output_key = _get_tapacc_output_key(tapacc_key, json.loads(buf.getvalue()))
+  if output_key is None:
+    return None
+  buf = io.BytesIO()
+  if not cache.get(output_key, buf):
+    return None
+  _logger.info('reusing cached tapacc output')
+  return buf.getvalue().decode('utf-8')
+
+
+def _put_cached_tapacc_output(
+    cache: tapa.cache.Cache,
+    tapacc_key: str,
+    dep_files: List[str],
+    tapa_program_json_str: str,
+) -> None:
+  output_key = _get_tapacc_output_key(tapacc_key, dep_files)
+  if output_key is None:
+    return
+  cache.put(output_key, io.BytesIO(tapa_program_json_str.encode('utf-8')))
+  cache.put(tapacc_key, io.BytesIO(json.dumps(dep_files).encode('utf-8')))
+
+
+def _get_platform_files(platform: str) -> List[str]:
+  """Return the paths that haoda may read device info of platform from."""
+  platform = os.path.join(
+      os.path.dirname(platform),
+      os.path.basename(platform).replace(':', '_').replace('.', '_'))
+  paths = []
+  for platform_dir in (
+      '',
+      os.path.join('/', 'opt', 'xilinx'),
+      os.environ.get('XILINX_VITIS'),
+      os.environ.get('XILINX_SDX'),
+  ):
+    if platform_dir is None:
+      continue
+    hw_dir = os.path.join(platform_dir, 'platforms' if platform_dir else '',
+                          platform, 'hw')
+    paths.append(hw_dir)
+    paths.extend(glob.iglob(os.path.join(glob.escape(hw_dir), '*.[xd]sa')))
+  return paths
+
+
 def _get_device_info(
     parser: argparse.ArgumentParser,
     args: argparse.Namespace,
+    probe_cache: Optional[tapa.cache.ProbeCache] = None,
     # Intentionally parse device_info only once.
     # pylint: disable=dangerous-default-value
     device_info: Dict[str, str] = {},
 ) -> Dict[str, str]:
   if not device_info:
+    key = (
+        args.platform,
+        args.part_num,
+        args.clock_period,
+        os.getcwd(),  # the platform may be a relative path
+        os.environ.get('XILINX_VITIS'),
+        os.environ.get('XILINX_SDX'),
+    )
+    if probe_cache is not None:
+      device_info.update(probe_cache.get('device-info', key) or {})
+  if not device_info:
+    # pylint: disable=import-outside-toplevel
+    import haoda.backend.xilinx
     device_info.update(
         haoda.backend.xilinx.parse_device_info(
             parser,
@@ -326,6 +650,10 @@ def _get_device_info(
             part_num_name='part_num',
             clock_period_name='clock_period',
         ))
+    if probe_cache is not None:
+      probe_cache.put(
+          'device-info', key, device_info,
+          _get_platform_files(args.platform) if args.platform else ())
   return device_info
 
 
@@ -0,0 +1,68 @@
+# pylint: disable=protected-access
+
+import json
+import os
+import tempfile
+import unittest
+from typing import Optional
+
+import tapa.cache
+from tapa import tapac
+
+
+class TapaccCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-tapac-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.tmpdir = tmpdir.name
+    self.cache = tapa.cache.Cache(os.path.join(self.tmpdir, 'cache'))
+    self.tapacc_key = tapa.cache.get_key('tapacc', ['-top', 'Top'])
+    self.dep_files = [
+        self.write_file('top.cpp', '#include "top.h"\nvoid Top() {}\n'),
+        self.write_file('top.h', 'void Top();\n'),
+    ]
+    self.output = json.dumps({'top': 'Top', 'tasks': {}})
+    tapac._put_cached_tapacc_output(self.cache, self.tapacc_key, self.dep_files,
+                                    self.output)
+
+  def write_file(self, name: str, content: str) -> str:
+    path = os.path.join(self.tmpdir, name)
+    with open(path, 'w') as fileobj:
+      fileobj.write(content)
+    return path
+
+  def get(self) -> Optional[str]:
+    return tapac._get_cached_tapacc_output(self.cache, self.tapacc_key)
+
+  def test_hit_if_unchanged(self):
+    self.assertEqual(self.get(), self.output)
+    # the dependencies are hashed by content, not by mtime
+    os.utime(self.dep_files[1], (0, 0))
+    self.assertEqual(self.get(), self.output)
+
+  def test_miss_if_command_changed(self):
+    tapacc_key = tapa.cache.get_key('tapacc', ['-top', 'Foo'])
+    self.assertIsNone(tapac._get_cached_tapacc_output(self.cache, tapacc_key))
+
+  def test_miss_if_header_changed(self):
+    self.write_file('top.h', 'void Top();\nvoid Foo();\n')
+    self.assertIsNone(self.get())
+
+    # the new content is cached under the same command key
+    output = json.dumps({'top': 'Top', 'tasks': {'Foo': {}}})
+    tapac._put_cached_tapacc_output(self.cache, self.tapacc_key, self.dep_files,
+                                    output)
+    self.assertEqual(self.get(), output)
+
+    # restoring the header reuses the first output without running tapacc
+    self.write_file('top.h', 'void Top();\n')
+    self.assertEqual(self.get(), self.output)
+
+  def test_miss_if_header_removed(self):
+    os.remove(self.dep_files[1])
+    self.assertIsNone(self.get())
+
+
+if __name__ == '__main__':
+  unittest.main()
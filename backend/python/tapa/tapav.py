@@ -4,8 +4,6 @@ import collections
 import sys
 from typing import Dict, Set
 
-import tapa.core
-
 
 def main():
   parser = argparse.ArgumentParser(
@@ -23,9 +21,13 @@ def main():
                       default=sys.stdout)
   args = parser.parse_args()
 
+  # imported here so that `tapav --help` does not pay for the heavy imports
+  # pylint: disable=import-outside-toplevel
+  from tapa.core import Program
+
   task_fmt = '"{name}#{id}"'
   font = 'Arial'
-  program = tapa.core.Program(args.program)
+  program = Program(args.program)
   output = args.output
   output.write(f'digraph "{program.top}" {{\n')
   output.write(f'  label = "{program.top}";\n')
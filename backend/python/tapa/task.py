@@ -1,7 +1,7 @@
 import collections
 import enum
 import logging
-from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
 
 from tapa.verilog import xilinx as rtl
 from tapa.verilog import ast
@@ -31,12 +31,18 @@ class Task:
   Properties:
     is_upper: bool, True if this task is an upper-level task.
     is_lower: bool, True if this task is an lower-level task.
+    self_area: A dict mapping resource types to the area of this task alone.
+    total_area: A dict mapping resource types to the area of this task and all
+        of its descendants, memoized until the area or children of it or any
+        of its descendants change.
 
   Properties unique to upper tasks:
     instances: A tuple of Instance objects, children instances of this task.
     args: A dict mapping arg names to lists of Arg objects that belong to the
         children instances of this task.
     mmaps: A dict mapping mmap arg names to MMapConnection objects.
+    instance_areas: A dict mapping children instance names to their total
+        areas.
   """
 
   class Level(enum.Enum):
@@ -70,6 +76,10 @@ class Task:
     self._args: Optional[Dict[str, List[Instance.Arg]]] = None
     self._mmaps: Optional[Dict[str, MMapConnection]] = None
     self._self_area = {}
+    self._total_area: Optional[Dict[str, int]] = None
+    self._is_rolling_up_area = False
+    # tasks that instantiate this task, whose total_area depends on this task
+    self._parents: Set[Task] = set()
 
   @property
   def is_upper(self) -> bool:
@@ -87,7 +97,12 @@ class Task:
 
   @instances.setter
   def instances(self, instances: Tuple[Instance, ...]) -> None:
+    for instance in self._instances or ():
+      instance.task._parents.discard(self)
+    for instance in instances:
+      instance.task._parents.add(self)
     self._instances = instances
+    self._invalidate_total_area()
     self._args = collections.defaultdict(list)
 
     mmaps: Dict[str, List[Instance.Arg]] = collections.defaultdict(list)
@@ -137,15 +152,60 @@ class Task:
     if self._self_area:
       raise ValueError(f'area of task {self.name} already populated')
     self._self_area = area
+    self._invalidate_total_area()
 
   @property
   def total_area(self) -> Dict[str, int]:
-    area = dict(self.self_area)
-    for instance in self.instances:
-      for key in area:
-        area[key] += instance.task.total_area[key]
+    return dict(self._get_total_area())
+
+  def compute_total_area(self) -> None:
+    """Roll up and memoize the total area of this task.
+
+    Calling this on all tasks in topological order computes each task once from
+    the memoized results of its children.
+    """
+    self._get_total_area()
+
+  @property
+  def instance_areas(self) -> Dict[str, Dict[str, int]]:
+    return collections.OrderedDict(
+        (instance.name, dict(instance.task._get_total_area()))
+        for instance in self.instances)
+
+  def _get_total_area(self) -> Dict[str, int]:
+    """Return the memoized total area without copying it.
+
+    If the children are rolled up first (e.g., in topological order), each task
+    is visited exactly once no matter how many times it is instantiated.
+    """
+    if self._total_area is not None:
+      return self._total_area
+    if self._is_rolling_up_area:
+      raise ValueError(f'task {self.name} instantiates itself')
+    self._is_rolling_up_area = True
+    try:
+      area = dict(self.self_area)
+      for instance in self.instances:
+        # shells of upper-level tasks may report different kinds of resources
+        for key, value in instance.task._get_total_area().items():
+          area[key] = area.get(key, 0) + value
+    finally:
+      self._is_rolling_up_area = False
+    self._total_area = area
     return area
 
+  def _invalidate_total_area(self) -> None:
+    """Discard the memoized total area of this task and its ancestors."""
+    self._total_area = None
+    # a memoized total implies memoized totals of all descendants, so ancestors
+    # that are already invalidated have no memoized ancestors either
+    parents = list(self._parents)
+    while parents:
+      parent = parents.pop()
+      if parent._total_area is not None:
+        parent._total_area = None
+        parents.extend(parent._parents)
+
   def get_id_width(self, port: str) -> Optional[int]:
     if port in self.mmaps:
       return self.mmaps[port].id_width or None
@@ -266,6 +326,8 @@ class Task:
       width_table: Dict[str, int],
       tcl_files: Dict[str, str],
   ) -> None:
+    m_axi_prefix = rtl.get_m_axi_prefix()
+
     for arg_name, (m_axi_id_width, args) in self.mmaps.items():
       # add m_axi ports to the arg list
       self.module.add_m_axi(
@@ -295,7 +357,7 @@ class Task:
 
       for axi_chan, axi_ports in rtl.M_AXI_PORTS.items():
         for axi_port, direction in axi_ports:
-          m_axi_arg = f'{rtl.M_AXI_PREFIX}{arg_name}_{axi_chan}{axi_port}'
+          m_axi_arg = f'{m_axi_prefix}{arg_name}_{axi_chan}{axi_port}'
 
           if axi_port == 'ID' and direction == 'input':
             m_axi_arg = (f"{{{s_axi_id_width + 4 - m_axi_id_width}'d0, "
@@ -316,7 +378,7 @@ class Task:
         wires = []
         for axi_chan, axi_ports in rtl.M_AXI_PORTS.items():
           for axi_port, _ in axi_ports:
-            wire_name = (f'{rtl.M_AXI_PREFIX}{arg.mmap_name}_'
+            wire_name = (f'{m_axi_prefix}{arg.mmap_name}_'
                          f'{axi_chan}{axi_port}')
             wires.append(
                 ast.Wire(name=wire_name,
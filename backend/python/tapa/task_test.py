@@ -0,0 +1,99 @@
+import unittest
+
+import tapa.core  # pylint: disable=unused-import # avoid circular imports
+from tapa.instance import Instance
+from tapa.task import Task
+
+
+def make_task(name: str, area: int, *children: Task) -> Task:
+  if children:
+    task = Task(level='upper', name=name, code='', tasks={}, fifos={}, ports=[])
+  else:
+    task = Task(level='lower', name=name, code='')
+  instantiate(task, *children)
+  task.self_area = {'LUT': area, 'FF': area}
+  return task
+
+
+def instantiate(task: Task, *children: Task) -> None:
+  task.instances = tuple(
+      Instance(child, instance_id=idx, step=0, args={})
+      for idx, child in enumerate(children))
+
+
+class TotalAreaTest(unittest.TestCase):
+
+  def setUp(self):
+    self.leaf = make_task('Leaf', 1)
+    self.mid = make_task('Mid', 10, self.leaf, self.leaf)
+    self.top = make_task('Top', 100, self.mid, self.leaf)
+    self.other_leaf = make_task('OtherLeaf', 1000)
+    self.other_top = make_task('OtherTop', 10000, self.other_leaf)
+    self.tasks = (self.leaf, self.mid, self.top, self.other_leaf,
+                  self.other_top)
+    for task in self.tasks:
+      task.compute_total_area()
+
+  def is_memoized(self, task: Task) -> bool:
+    return task._total_area is not None  # pylint: disable=protected-access
+
+  def test_total_area(self):
+    self.assertEqual(self.mid.total_area, {'LUT': 12, 'FF': 12})
+    self.assertEqual(self.top.total_area, {'LUT': 113, 'FF': 113})
+    self.assertEqual(self.other_top.total_area, {'LUT': 11000, 'FF': 11000})
+    self.assertEqual(self.top.instance_areas, {
+        'Mid_0': {
+            'LUT': 12,
+            'FF': 12
+        },
+        'Leaf_1': {
+            'LUT': 1,
+            'FF': 1
+        },
+    })
+    self.assertTrue(all(map(self.is_memoized, self.tasks)))
+
+  def test_changing_children_invalidates_only_ancestors(self):
+    new_leaf = make_task('NewLeaf', 5)
+    instantiate(self.mid, new_leaf, new_leaf)
+
+    self.assertFalse(self.is_memoized(self.mid))
+    self.assertFalse(self.is_memoized(self.top))
+    for task in self.leaf, self.other_leaf, self.other_top:
+      self.assertTrue(self.is_memoized(task))
+
+    self.assertEqual(self.mid.total_area, {'LUT': 20, 'FF': 20})
+    self.assertEqual(self.top.total_area, {'LUT': 121, 'FF': 121})
+
+    # the replaced child no longer invalidates mid
+    self.leaf._invalidate_total_area()  # pylint: disable=protected-access
+    self.assertTrue(self.is_memoized(self.mid))
+    self.assertFalse(self.is_memoized(self.top))
+    self.assertEqual(self.top.total_area, {'LUT': 121, 'FF': 121})
+
+  def test_populating_area_invalidates_only_ancestors(self):
+    leaf = Task(level='lower', name='LateLeaf', code='')
+    instantiate(leaf)
+    top = Task(level='upper',
+               name='LateTop',
+               code='',
+               tasks={},
+               fifos={},
+               ports=[])
+    instantiate(top, leaf)
+    top.self_area = {'LUT': 100, 'FF': 100}
+    with self.assertRaises(ValueError):
+      top.compute_total_area()
+
+    leaf.self_area = {'LUT': 1, 'FF': 1}
+    self.assertTrue(all(map(self.is_memoized, self.tasks)))
+    self.assertEqual(top.total_area, {'LUT': 101, 'FF': 101})
+
+    # the area of a populated task is not changed
+    with self.assertRaises(ValueError):
+      leaf.self_area = {'LUT': 2, 'FF': 2}
+    self.assertEqual(top.total_area, {'LUT': 101, 'FF': 101})
+
+
+if __name__ == '__main__':
+  unittest.main()
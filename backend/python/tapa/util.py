@@ -1,25 +1,89 @@
+import io
+import itertools
+import os
 import shutil
 import subprocess
-from typing import Tuple
+from typing import List, Optional, Tuple
 
+from tapa.cache import Cache, ProbeCache, get_key
 
-def clang_format(code: str, *args: str) -> str:
-  """Apply clang-format with given arguments, if possible."""
-  for version in range(10, 4, -1):
-    clang_format_exe = shutil.which('clang-format-%d' % version)
+_CLANG_FORMAT_NAMES = tuple(f'clang-format-{version}'
+                            for version in range(10, 4, -1)) + ('clang-format',)
+
+
+def find_clang_format(
+    probe_cache: Optional[ProbeCache] = None) -> Optional[str]:
+  """Return the path to the newest clang-format, or None if there is none.
+
+  Args:
+    probe_cache: Optional cache of the result. It is invalidated whenever the
+        result may change, e.g., when a newer clang-format is installed.
+  """
+  path = os.environ.get('PATH', os.defpath)
+  if probe_cache is not None:
+    result = probe_cache.get('clang-format', path)
+    if result is not None:
+      return result[0]
+  clang_format_exe = None
+  for name in _CLANG_FORMAT_NAMES:
+    clang_format_exe = shutil.which(name, path=path)
     if clang_format_exe is not None:
       break
-  else:
-    clang_format_exe = shutil.which('clang-format')
-  if clang_format_exe is not None:
-    proc = subprocess.run([clang_format_exe, *args],
-                          input=code,
-                          stdout=subprocess.PIPE,
-                          check=True,
-                          universal_newlines=True)
-    proc.check_returncode()
-    return proc.stdout
-  return code
+  if probe_cache is not None:
+    # every directory is searched for the newer names before an older one is
+    # found, but the newest one is found in the first directory that has it
+    newest = _CLANG_FORMAT_NAMES[0]
+    stamps: List[str] = [x for x in path.split(os.pathsep) if x]
+    if clang_format_exe is not None:
+      if os.path.basename(clang_format_exe) == newest:
+        stamps = list(
+            itertools.takewhile(lambda x: shutil.which(newest, path=x) is None,
+                                stamps))
+      stamps.append(clang_format_exe)
+    probe_cache.put('clang-format', path, [clang_format_exe], stamps)
+  return clang_format_exe
+
+
+def clang_format(
+    code: str,
+    *args: str,
+    probe_cache: Optional[ProbeCache] = None,
+    cache: Optional[Cache] = None,
+) -> str:
+  """Apply clang-format with given arguments, if possible.
+
+  Args:
+    code: C++ code to format.
+    args: Arguments passed to clang-format.
+    probe_cache: Optional cache of the location of clang-format.
+    cache: Optional cache of the formatted code, keyed by the code, the
+        arguments, and the clang-format binary.
+  """
+  clang_format_exe = find_clang_format(probe_cache)
+  if clang_format_exe is None:
+    return code
+  key = ''
+  if cache is not None:
+    stat = os.stat(clang_format_exe)
+    key = get_key(
+        clang_format_exe,
+        [stat.st_mtime_ns, stat.st_size],
+        args,
+        os.getcwd(),  # clang-format looks for .clang-format from here
+        code,
+    )
+    buf = io.BytesIO()
+    if cache.get(key, buf):
+      return buf.getvalue().decode('utf-8')
+  proc = subprocess.run([clang_format_exe, *args],
+                        input=code,
+                        stdout=subprocess.PIPE,
+                        check=True,
+                        universal_newlines=True)
+  proc.check_returncode()
+  if cache is not None:
+    cache.put(key, io.BytesIO(proc.stdout.encode('utf-8')))
+  return proc.stdout
 
 
 def get_instance_name(item: Tuple[str, int]) -> str:
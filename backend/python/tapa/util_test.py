@@ -0,0 +1,78 @@
+# pylint: disable=protected-access
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from tapa import util
+from tapa.cache import ProbeCache
+
+
+class FindClangFormatTest(unittest.TestCase):
+
+  def setUp(self):
+    tmpdir = tempfile.TemporaryDirectory(prefix='tapa-util-test-')
+    self.addCleanup(tmpdir.cleanup)
+    self.dirs = [os.path.join(tmpdir.name, x) for x in 'abc']
+    for dirname in self.dirs:
+      os.mkdir(dirname)
+    patcher = unittest.mock.patch.dict(os.environ,
+                                       {'PATH': os.pathsep.join(self.dirs)})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.probe_cache = ProbeCache(os.path.join(tmpdir.name, 'probe.json'))
+
+  def install(self, idx: int, name: str) -> str:
+    path = os.path.join(self.dirs[idx], name)
+    with open(path, 'w') as fileobj:
+      fileobj.write('#!/bin/sh\n')
+    os.chmod(path, 0o755)
+    return path
+
+  def find(self):
+    return util.find_clang_format(self.probe_cache)
+
+  def get_stamps(self):
+    return list(self.probe_cache._entries['clang-format']['stamps'])
+
+  def test_newest(self):
+    exe = self.install(1, 'clang-format-10')
+    self.assertEqual(self.find(), exe)
+    # only the directories searched before it are stamped
+    self.assertEqual(self.get_stamps(), [self.dirs[0], exe])
+
+    # a later directory cannot change the result
+    self.install(2, 'clang-format-10')
+    self.assertEqual(self.find(), exe)
+    self.assertEqual(self.get_stamps(), [self.dirs[0], exe])
+
+    # an earlier directory shadows it
+    exe = self.install(0, 'clang-format-10')
+    self.assertEqual(self.find(), exe)
+    self.assertEqual(self.get_stamps(), [exe])
+
+  def test_older(self):
+    exe = self.install(0, 'clang-format')
+    self.assertEqual(self.find(), exe)
+    # every directory is searched for newer versions first
+    self.assertEqual(self.get_stamps(), self.dirs + [exe])
+
+    exe = self.install(2, 'clang-format-9')
+    self.assertEqual(self.find(), exe)
+
+  def test_missing(self):
+    self.assertIsNone(self.find())
+    self.assertEqual(self.get_stamps(), self.dirs)
+
+    exe = self.install(2, 'clang-format')
+    self.assertEqual(self.find(), exe)
+
+  def test_without_probe_cache(self):
+    self.assertIsNone(util.find_clang_format())
+    exe = self.install(1, 'clang-format-6')
+    self.assertEqual(util.find_clang_format(), exe)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,386 @@
+"""Fast Verilog code generation for the AST nodes that TAPA generates.
+
+`pyverilog.ast_code_generator.codegen.ASTCodeGenerator` renders every node
+through a Jinja template, which dominates the time spent on emitting large
+top-level modules. `Emitter` renders the node types created by `tapa.verilog`
+directly with string operations and produces the same code as pyverilog. Nodes
+of other types (e.g., those that are only present in the HLS-generated code)
+are delegated to pyverilog.
+"""
+
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from pyverilog.ast_code_generator import codegen
+from tapa.verilog import ast
+
+__all__ = [
+    'Emitter',
+]
+
+# marks and precedences of binary operators; see `pyverilog.utils.op2mark`
+_BINARY_OPERATORS: Dict[Type[ast.Operator], Tuple[str, int]] = {
+    ast.Power: ('**', 1),
+    ast.Times: ('*', 2),
+    ast.Divide: ('/', 2),
+    ast.Mod: ('%', 2),
+    ast.Plus: ('+', 3),
+    ast.Minus: ('-', 3),
+    ast.Sll: ('<<', 4),
+    ast.Srl: ('>>', 4),
+    ast.Sla: ('<<<', 4),
+    ast.Sra: ('>>>', 4),
+    ast.LessThan: ('<', 5),
+    ast.GreaterThan: ('>', 5),
+    ast.LessEq: ('<=', 5),
+    ast.GreaterEq: ('>=', 5),
+    ast.Eq: ('==', 6),
+    ast.NotEq: ('!=', 6),
+    ast.Eql: ('===', 6),
+    ast.NotEql: ('!==', 6),
+    ast.And: ('&', 7),
+    ast.Xor: ('^', 8),
+    ast.Xnor: ('~^', 8),
+    ast.Or: ('|', 9),
+    ast.Land: ('&&', 10),
+    ast.Lor: ('||', 11),
+}
+
+_UNARY_OPERATORS: Dict[Type[ast.UnaryOperator], str] = {
+    ast.Uminus: '-',
+    ast.Ulnot: '!',
+    ast.Unot: '~',
+    ast.Uand: '&',
+    ast.Unand: '~&',
+    ast.Uor: '|',
+    ast.Unor: '~|',
+    ast.Uxor: '^',
+    ast.Uxnor: '~^',
+}
+
+# operands of these operators keep their parentheses regardless of precedence
+_PARENTHESIZED_OPERATORS = (
+    ast.Sll,
+    ast.Srl,
+    ast.Sra,
+    ast.LessThan,
+    ast.GreaterThan,
+    ast.LessEq,
+    ast.GreaterEq,
+    ast.Eq,
+    ast.NotEq,
+    ast.Eql,
+    ast.NotEql,
+)
+
+_escape = codegen.escape
+_del_paren = codegen.del_paren
+_del_space = codegen.del_space
+
+
+def _get_order(node: ast.Node) -> Optional[int]:
+  if type(node) in _UNARY_OPERATORS:
+    return 0
+  binary_operator = _BINARY_OPERATORS.get(type(node))
+  if binary_operator is not None:
+    return binary_operator[1]
+  return None
+
+
+class Emitter:
+  """Verilog code generator that is a drop-in replacement of pyverilog's.
+
+  Attributes:
+    indent: Function that indents a multi-line string by one level.
+  """
+
+  def __init__(self, indentsize: int = 2):
+    self._fallback = codegen.ASTCodeGenerator(indentsize=indentsize)
+    self.indent = self._fallback.indent
+    self._visitors: Dict[Type[ast.Node], Callable[[ast.Node], str]] = {
+        ast.Source: self._visit_source,
+        ast.Description: self._visit_description,
+        ast.ModuleDef: self._visit_module_def,
+        ast.Paramlist: self._visit_paramlist,
+        ast.Portlist: self._visit_portlist,
+        ast.Port: self._visit_port,
+        ast.Identifier: self._visit_identifier,
+        ast.IntConst: self._visit_const,
+        ast.FloatConst: self._visit_const,
+        ast.Constant: self._visit_const,
+        ast.StringConst: self._visit_string_const,
+        ast.Width: self._visit_width,
+        ast.Partselect: self._visit_partselect,
+        ast.Pointer: self._visit_pointer,
+        ast.Concat: self._visit_concat,
+        ast.Lvalue: self._visit_value,
+        ast.Rvalue: self._visit_value,
+        ast.Cond: self._visit_cond,
+        ast.Input: self._visit_variable,
+        ast.Output: self._visit_variable,
+        ast.Inout: self._visit_variable,
+        ast.Wire: self._visit_variable,
+        ast.Reg: self._visit_variable,
+        ast.Parameter: self._visit_parameter,
+        ast.Localparam: self._visit_parameter,
+        ast.Decl: self._visit_decl,
+        ast.Pragma: self._visit_pragma,
+        ast.PragmaEntry: self._visit_pragma_entry,
+        ast.Assign: self._visit_assign,
+        ast.Always: self._visit_always,
+        ast.SensList: self._visit_sens_list,
+        ast.Sens: self._visit_sens,
+        ast.BlockingSubstitution: self._visit_substitution,
+        ast.NonblockingSubstitution: self._visit_substitution,
+        ast.IfStatement: self._visit_if_statement,
+        ast.CaseStatement: self._visit_case_statement,
+        ast.Case: self._visit_case,
+        ast.Block: self._visit_block,
+        ast.SingleStatement: self._visit_single_statement,
+        ast.SystemCall: self._visit_system_call,
+        ast.InstanceList: self._visit_instance_list,
+        ast.Instance: self._visit_instance,
+        ast.ParamArg: self._visit_arg,
+        ast.PortArg: self._visit_arg,
+    }
+    for operator in _BINARY_OPERATORS:
+      self._visitors[operator] = self._visit_operator
+    # pyverilog has no dedicated visitor for Sla; delegate to keep it identical
+    del self._visitors[ast.Sla]
+    for operator in _UNARY_OPERATORS:
+      self._visitors[operator] = self._visit_unary_operator
+
+  def visit(self, node: ast.Node) -> str:
+    """Return the Verilog code of node."""
+    visitor = self._visitors.get(type(node))
+    if visitor is None:
+      return self._fallback.visit(node)
+    return visitor(node)
+
+  def _visit_source(self, node: ast.Source) -> str:
+    return self.visit(node.description)
+
+  def _visit_description(self, node: ast.Description) -> str:
+    return ''.join(
+        f'\n{self.visit(definition)}\n' for definition in node.definitions)
+
+  def _visit_module_def(self, node: ast.ModuleDef) -> str:
+    code = ['\nmodule ', _escape(node.name)]
+    if node.paramlist is not None:
+      paramlist = self.indent(self.visit(node.paramlist))
+      if paramlist:
+        code.extend((' #\n(\n', paramlist, '\n)'))
+    code.append('\n(\n')
+    if node.portlist is not None:
+      code.append(self.indent(self.visit(node.portlist)))
+    code.append('\n);\n\n')
+    for item in node.items or ():
+      code.extend((self.indent(self.visit(item)), '\n'))
+    code.append('\nendmodule\n')
+    return ''.join(code)
+
+  def _visit_paramlist(self, node: ast.Paramlist) -> str:
+    return ',\n'.join(
+        self.visit(param).replace(';', '') for param in node.params)
+
+  def _visit_portlist(self, node: ast.Portlist) -> str:
+    return ',\n'.join(self.visit(port) for port in node.ports)
+
+  def _visit_port(self, node: ast.Port) -> str:
+    return _escape(node.name)
+
+  def _visit_identifier(self, node: ast.Identifier) -> str:
+    if node.scope is not None:
+      return self._fallback.visit(node)
+    return _escape(node.name)
+
+  def _visit_const(self, node: ast.Constant) -> str:
+    return str(node.value)
+
+  def _visit_string_const(self, node: ast.StringConst) -> str:
+    return f'"{node.value}"'
+
+  def _visit_width(self, node: ast.Width) -> str:
+    msb = _del_space(_del_paren(self.visit(node.msb)))
+    lsb = _del_space(_del_paren(self.visit(node.lsb)))
+    return f'[{msb}:{lsb}]'
+
+  def _visit_partselect(self, node: ast.Partselect) -> str:
+    msb = _del_space(_del_paren(self.visit(node.msb)))
+    lsb = _del_space(_del_paren(self.visit(node.lsb)))
+    return f'{self.visit(node.var)}[{msb}:{lsb}]'
+
+  def _visit_pointer(self, node: ast.Pointer) -> str:
+    return f'{self.visit(node.var)}[{_del_paren(self.visit(node.ptr))}]'
+
+  def _visit_concat(self, node: ast.Concat) -> str:
+    items = ', '.join(_del_paren(self.visit(item)) for item in node.list)
+    return f'{{ {items} }}'
+
+  def _visit_value(self, node: ast.Node) -> str:
+    return _del_paren(self.visit(node.var))
+
+  def _visit_operator(self, node: ast.Operator) -> str:
+    mark, order = _BINARY_OPERATORS[type(node)]
+    left = self.visit(node.left)
+    right = self.visit(node.right)
+    if not isinstance(node.left, _PARENTHESIZED_OPERATORS):
+      left_order = _get_order(node.left)
+      if left_order is not None and left_order <= order:
+        left = _del_paren(left)
+    if not isinstance(node.right, _PARENTHESIZED_OPERATORS):
+      right_order = _get_order(node.right)
+      if right_order is not None and order > right_order:
+        right = _del_paren(right)
+    return f'({left} {mark} {right})'
+
+  def _visit_unary_operator(self, node: ast.UnaryOperator) -> str:
+    return f'({_UNARY_OPERATORS[type(node)]}{self.visit(node.right)})'
+
+  def _visit_cond(self, node: ast.Cond) -> str:
+    cond = _del_paren(self.visit(node.cond))
+    true_value = _del_paren(self.visit(node.true_value))
+    false_value = _del_paren(self.visit(node.false_value))
+    if isinstance(node.false_value, ast.Cond):
+      false_value = '\n' + false_value
+    return f'(({cond})? {true_value} : {false_value})'
+
+  def _visit_variable(self, node: ast.Variable) -> str:
+    code = [type(node).__name__.lower(), ' ']
+    if node.signed:
+      code.append('signed ')
+    if node.width is not None:
+      code.extend((self.visit(node.width), ' '))
+    code.append(_escape(node.name))
+    if node.dimensions is not None:
+      code.extend((' ', self.visit(node.dimensions)))
+    code.append(';')
+    return ''.join(code)
+
+  def _visit_parameter(self, node: ast.Parameter) -> str:
+    value = self.visit(node.value)
+    code = [type(node).__name__.lower(), ' ']
+    if node.signed:
+      code.append('signed ')
+    if node.width is not None and not (value.startswith('"') and
+                                       value.endswith('"')):
+      code.extend((self.visit(node.width), ' '))
+    code.extend((_escape(node.name), ' = ', value, ';'))
+    return ''.join(code)
+
+  def _visit_decl(self, node: ast.Decl) -> str:
+    return ''.join(self.visit(item) for item in node.list)
+
+  def _visit_pragma(self, node: ast.Pragma) -> str:
+    return f'(* {self.visit(node.entry)} *)'
+
+  def _visit_pragma_entry(self, node: ast.PragmaEntry) -> str:
+    if node.value is None:
+      return _escape(node.name)
+    value = self.visit(node.value)
+    if not value:
+      return _escape(node.name)
+    return f'{_escape(node.name)} = {value}'
+
+  def _visit_assign(self, node: ast.Assign) -> str:
+    return codegen.indent_multiline_assign(
+        f'assign {self.visit(node.left)} = {self.visit(node.right)};')
+
+  def _visit_always(self, node: ast.Always) -> str:
+    return (f'\nalways @({self.visit(node.sens_list)}) '
+            f'{self.visit(node.statement)}\n')
+
+  def _visit_sens_list(self, node: ast.SensList) -> str:
+    return ' or '.join(self.visit(item) for item in node.list)
+
+  def _visit_sens(self, node: ast.Sens) -> str:
+    if node.type == 'all':
+      return '*'
+    if node.type in {'posedge', 'negedge'}:
+      return f'{node.type} {self.visit(node.sig)}'
+    return self.visit(node.sig)
+
+  def _visit_substitution(self, node: ast.Substitution) -> str:
+    if node.ldelay is not None or node.rdelay is not None:
+      return self._fallback.visit(node)
+    operator = '<=' if isinstance(node, ast.NonblockingSubstitution) else '='
+    return codegen.indent_multiline_assign(
+        f'{self.visit(node.left)} {operator} {self.visit(node.right)};')
+
+  def _visit_if_statement(self, node: ast.IfStatement) -> str:
+    if node.true_statement is None:
+      return self._fallback.visit(node)
+    true_statement = self.visit(node.true_statement)
+    false_statement = ('' if node.false_statement is None else self.visit(
+        node.false_statement))
+    code = ['if(', _del_paren(self.visit(node.cond)), ') ', true_statement]
+    if true_statement[-1] not in {' ', '\n'}:
+      code.append(' ')
+    if false_statement:
+      if '\n' not in true_statement:
+        code.append('\n')
+      code.extend(('else ', false_statement))
+    return ''.join(code)
+
+  def _visit_case_statement(self, node: ast.CaseStatement) -> str:
+    code = ['case(', _del_paren(self.visit(node.comp)), ')']
+    for case in node.caselist:
+      code.extend(('\n', self.indent(self.visit(case))))
+    code.append('\nendcase')
+    return ''.join(code)
+
+  def _visit_case(self, node: ast.Case) -> str:
+    if node.cond is None:
+      cond = 'default'
+    else:
+      cond = ', '.join(_del_paren(self.visit(x)) for x in node.cond)
+    return f'{cond}: {self.visit(node.statement)}'
+
+  def _visit_block(self, node: ast.Block) -> str:
+    code = ['begin']
+    if node.scope is not None:
+      code.extend((' : ', _escape(node.scope)))
+    for statement in node.statements:
+      code.extend(('\n', self.indent(self.visit(statement))))
+    code.append('\nend')
+    return ''.join(code)
+
+  def _visit_single_statement(self, node: ast.SingleStatement) -> str:
+    return f'{self.visit(node.statement)};'
+
+  def _visit_system_call(self, node: ast.SystemCall) -> str:
+    if not node.args:
+      return f'${_escape(node.syscall)}'
+    args = ', '.join(self.visit(arg) for arg in node.args)
+    return f'${_escape(node.syscall)}({args})'
+
+  def _visit_instance_list(self, node: ast.InstanceList) -> str:
+    code = ['\n', _escape(node.module)]
+    if node.parameterlist:
+      code.append('\n#(')
+      code.append(','.join('\n' + self.indent(self.visit(param))
+                           for param in node.parameterlist))
+      code.append('\n)')
+    code.append(','.join(
+        '\n' + self.visit(instance) for instance in node.instances))
+    code.append(';\n')
+    return ''.join(code)
+
+  def _visit_instance(self, node: ast.Instance) -> str:
+    code = [_escape(node.name)]
+    if node.array is not None:
+      code.append(self.visit(node.array))
+    code.append('\n(')
+    code.append(','.join(
+        '\n' + self.indent(self.visit(port)) for port in node.portlist))
+    code.append('\n)')
+    return ''.join(code)
+
+  def _visit_arg(self, node: ast.Node) -> str:
+    if isinstance(node, ast.PortArg):
+      name = node.portname
+    else:
+      name = node.paramname
+    arg = '' if node.argname is None else _del_paren(self.visit(node.argname))
+    if name is None or name == '':
+      return arg
+    return f'.{_escape(name)}({arg})'
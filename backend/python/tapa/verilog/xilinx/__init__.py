@@ -8,11 +8,12 @@ import os
 import shutil
 import sys
 import tempfile
-from typing import IO, BinaryIO, Dict, Iterable, Iterator, List, TextIO, Union
+from typing import (IO, Any, BinaryIO, Dict, Iterable, Iterator, List, TextIO,
+                    Union)
 
 import tapa.instance
-from haoda.backend import xilinx as backend
 from tapa.verilog import ast
+from tapa.verilog.xilinx import const, m_axi
 # pylint: disable=wildcard-import,unused-wildcard-import
 from tapa.verilog.util import *
 from tapa.verilog.xilinx.async_mmap import *
@@ -20,9 +21,19 @@ from tapa.verilog.xilinx.axis import *
 from tapa.verilog.xilinx.const import *
 from tapa.verilog.xilinx.m_axi import *
 from tapa.verilog.xilinx.module import *
+from tapa.verilog.xilinx.shell import *
 from tapa.verilog.xilinx.typing import *
 
 
+def __getattr__(name: str) -> Any:
+  # names that need haoda are not star-imported so that it is loaded lazily
+  if name == 'M_AXI_PREFIX':
+    return m_axi.get_m_axi_prefix()
+  if name == 'OTHER_MODULES':
+    return const.OTHER_MODULES
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 def ctrl_instance_name(top: str) -> str:
   return f'{top}_control_s_axi_U'
 
@@ -66,6 +77,9 @@ def generate_peek_ports(verilog, port: str, arg: str) -> Iterator[ast.PortArg]:
 
 def pack(top_name: str, rtl_dir: str, ports: Iterable[tapa.instance.Port],
          output_file: Union[str, BinaryIO]) -> None:
+  # pylint: disable=import-outside-toplevel
+  from haoda.backend import xilinx as backend
+
   port_tuple = tuple(ports)
   if isinstance(output_file, str):
     xo_file = output_file
@@ -131,6 +145,9 @@ def print_kernel_xml(name: str, ports: Iterable[tapa.instance.Port],
     ports: Iterable of tapa.instance.Port.
     kernel_xml: file object to write to.
   """
+  # pylint: disable=import-outside-toplevel
+  from haoda.backend import xilinx as backend
+
   args = []
   for port in ports:
     if port.cat == tapa.instance.Instance.Arg.Cat.SCALAR:
@@ -1,6 +1,6 @@
-from typing import Optional
+import functools
+from typing import Any, Dict, Optional
 
-import haoda.backend.xilinx
 from tapa.verilog import ast
 
 __all__ = [
@@ -35,7 +35,7 @@ __all__ = [
     'ALL_SENS_LIST',
     'STATE',
     'BUILTIN_INSTANCES',
-    'OTHER_MODULES',
+    'get_other_modules',
     'get_stream_width',
 ]
 
@@ -136,29 +136,47 @@ STATE = ast.Identifier('tapa_state')
 
 BUILTIN_INSTANCES = {'hmss_0'}
 
-OTHER_MODULES = {
-    'fifo_bram':
-        haoda.backend.xilinx.BRAM_FIFO_TEMPLATE.format(
-            name='fifo_bram',
-            width=32,
-            depth=32,
-            addr_width=(32 - 1).bit_length(),
-        ),
-    'fifo_srl':
-        haoda.backend.xilinx.SRL_FIFO_TEMPLATE.format(
-            name='fifo_srl',
-            width=32,
-            depth=32,
-            addr_width=(32 - 1).bit_length(),
-        ),
-    'fifo':
-        haoda.backend.xilinx.AUTO_FIFO_TEMPLATE.format(
-            name='fifo',
-            width=32,
-            depth=32,
-            addr_width=(32 - 1).bit_length(),
-        ),
-}
+
+@functools.lru_cache(maxsize=None)
+def get_other_modules() -> Dict[str, str]:
+  """Return the code of modules instantiated by TAPA but not by HLS.
+
+  haoda is expensive to import, so the templates are rendered on first use.
+  """
+  # pylint: disable=import-outside-toplevel
+  import haoda.backend.xilinx
+
+  return {
+      'fifo_bram':
+          haoda.backend.xilinx.BRAM_FIFO_TEMPLATE.format(
+              name='fifo_bram',
+              width=32,
+              depth=32,
+              addr_width=(32 - 1).bit_length(),
+          ),
+      'fifo_srl':
+          haoda.backend.xilinx.SRL_FIFO_TEMPLATE.format(
+              name='fifo_srl',
+              width=32,
+              depth=32,
+              addr_width=(32 - 1).bit_length(),
+          ),
+      'fifo':
+          haoda.backend.xilinx.AUTO_FIFO_TEMPLATE.format(
+              name='fifo',
+              width=32,
+              depth=32,
+              addr_width=(32 - 1).bit_length(),
+          ),
+  }
+
+
+def __getattr__(name: str) -> Any:
+  # kept for compatibility; OTHER_MODULES is rendered on first access
+  if name == 'OTHER_MODULES':
+    return get_other_modules()
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 def get_stream_width(port: str, data_width: int) -> Optional[ast.Width]:
   width = STREAM_PORT_WIDTH[port]
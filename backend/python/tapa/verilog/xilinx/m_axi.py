@@ -1,13 +1,13 @@
 import collections
 import copy
-from typing import Dict, Iterable, Optional, Tuple, Union
+import functools
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
 
-from haoda.backend.xilinx import M_AXI_PREFIX
 from tapa.verilog import ast
 from tapa.verilog.xilinx.typing import IOPort
 
 __all__ = [
-    'M_AXI_PREFIX',
+    'get_m_axi_prefix',
     'M_AXI_PORT_WIDTHS',
     'M_AXI_ADDR_PORTS',
     'M_AXI_PORTS',
@@ -24,6 +24,27 @@ __all__ = [
     'get_m_axi_port_width',
 ]
 
+
+@functools.lru_cache(maxsize=None)
+def get_m_axi_prefix() -> str:
+  """Return the prefix of m_axi ports.
+
+  The prefix is defined by haoda, which is expensive to import, so it is
+  imported on first use.
+  """
+  # pylint: disable=import-outside-toplevel
+  from haoda.backend.xilinx import M_AXI_PREFIX
+
+  return M_AXI_PREFIX
+
+
+def __getattr__(name: str) -> Any:
+  # kept for compatibility; M_AXI_PREFIX is imported on first access
+  if name == 'M_AXI_PREFIX':
+    return get_m_axi_prefix()
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 # width=0 means configurable
 M_AXI_PORT_WIDTHS = dict(
     ADDR=0,
@@ -143,7 +164,7 @@ M_AXI_PARAMS = ('C_M_AXI_DATA_WIDTH', 'C_M_AXI_WSTRB_WIDTH')
 def is_m_axi_port(port: Union[str, IOPort]) -> bool:
   if not isinstance(port, str):
     port = port.name
-  return (port.startswith(M_AXI_PREFIX) and
+  return (port.startswith(get_m_axi_prefix()) and
           '_' + port.split('_')[-1] in M_AXI_SUFFIXES)
 
 
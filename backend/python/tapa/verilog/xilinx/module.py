@@ -1,10 +1,16 @@
+import bisect
 import collections
-import itertools
+import copy
+import hashlib
+import io
 import logging
-from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+import pickle
+import re
+from typing import (Dict, FrozenSet, Iterable, Iterator, List, NamedTuple,
+                    Optional, TextIO, Tuple, Type, Union)
 
-from pyverilog.ast_code_generator import codegen
-from pyverilog.vparser import parser
+import pyverilog
+from tapa.cache import Cache, get_key
 from tapa.verilog import ast
 # pylint: disable=wildcard-import,unused-wildcard-import
 from tapa.verilog.util import *
@@ -16,19 +22,119 @@ from tapa.verilog.xilinx.typing import *
 _logger = logging.getLogger().getChild(__name__)
 
 __all__ = [
+    'ItemRule',
     'Module',
     'generate_m_axi_ports',
 ]
 
 
+class ItemRule(NamedTuple):
+  """A declarative predicate on the items of a module.
+
+  An item matches if it is one of `types` and its name starts with `prefix`,
+  ends with `suffix`, is one of `names` if `names` is not empty, and is a
+  substring of `within` if `within` is not empty. For ast.Decl, the first
+  declared variable is matched instead. The name of an ast.InstanceList is its
+  module name and the name of an ast.Pragma is the name of its entry. Items
+  without a name match by type only.
+  """
+  types: Tuple[Type[ast.Node], ...]
+  prefix: str = ''
+  suffix: str = ''
+  names: FrozenSet[str] = frozenset()
+  within: str = ''
+
+  def matches(self, item: ast.Node) -> bool:
+    if isinstance(item, ast.Decl):
+      item = item.list[0]
+    if not isinstance(item, self.types):
+      return False
+    if isinstance(item, ast.InstanceList):
+      name = item.module
+    elif isinstance(item, ast.Pragma):
+      name = item.entry.name
+    else:
+      name = getattr(item, 'name', None)
+    if name is None:
+      return True
+    return (name.startswith(self.prefix) and name.endswith(self.suffix) and
+            (not self.names or name in self.names) and
+            (not self.within or name in self.within))
+
+
+_SIGNAL_TYPES = (ast.Reg, ast.Wire)
+_PARAM_TYPES = (ast.Parameter,)
+_LOGIC_TYPES = (ast.Assign, ast.Always, ast.Initial)
+_INSTANCE_TYPES = (ast.InstanceList,)
+_PRAGMA_TYPES = (ast.Pragma,)
+
+# Items generated by HLS for upper-level tasks that are replaced by TAPA.
+_CLEANUP_RULES = (
+    ItemRule(_PARAM_TYPES, prefix='ap_ST_fsm_state'),
+    ItemRule(_SIGNAL_TYPES, prefix='ap_CS_fsm'),
+    ItemRule(_SIGNAL_TYPES, prefix='ap_NS_fsm'),
+    ItemRule(_SIGNAL_TYPES, suffix='_read'),
+    ItemRule(_SIGNAL_TYPES, suffix='_write'),
+    ItemRule(_SIGNAL_TYPES, suffix='_blk_n'),
+    ItemRule(_SIGNAL_TYPES, suffix='_regslice'),
+    ItemRule(_SIGNAL_TYPES, prefix='regslice_'),
+    ItemRule(_SIGNAL_TYPES, prefix=HANDSHAKE_RST),
+    ItemRule(_SIGNAL_TYPES, prefix=HANDSHAKE_DONE),
+    ItemRule(_SIGNAL_TYPES, prefix=HANDSHAKE_IDLE),
+    ItemRule(_SIGNAL_TYPES, prefix=HANDSHAKE_READY),
+    ItemRule(_LOGIC_TYPES),
+    ItemRule(_INSTANCE_TYPES, suffix='_regslice_both'),
+    ItemRule(_PRAGMA_TYPES, within='fsm_encoding'),
+)
+
+# Kinds of items that are added by add_* methods, each after the last item of
+# the same kind.
+_ITEM_KINDS = ('param', 'io_port', 'signal', 'instance', 'logic')
+
+
+def _get_item_kind(item: ast.Node) -> Optional[str]:
+  """Return the kind of item whose _last_*_idx is moved by item, if any.
+
+  Declarations added by add_* are not wrapped in Decl and do not move it.
+  """
+  if isinstance(item, ast.Decl):
+    if any(
+        isinstance(x, (ast.Input, ast.Output, ast.Inout)) for x in item.list):
+      return 'io_port'
+    if any(isinstance(x, (ast.Wire, ast.Reg)) for x in item.list):
+      return 'signal'
+    if any(isinstance(x, ast.Parameter) for x in item.list):
+      return 'param'
+  elif isinstance(item, (ast.Assign, ast.Always)):
+    return 'logic'
+  elif isinstance(item, ast.InstanceList):
+    return 'instance'
+  return None
+
+
 class Module:
   """AST and helpers for a verilog module.
 
   _last_*_idx is the array bound if the type of item is not present.
 
+  Items added by add_* methods are queued and merged into the AST only when the
+  AST is read, so adding items does not copy the whole item tuple. The merged
+  items are in the same order as if each was inserted when it was added.
+
+  A Module constructed with `ports_only=True` is populated from the port
+  declarations only; the files are parsed the first time the AST is needed.
+
   Attributes:
-    ast: The ast.Source node.
+    ast: The ast.Source node, with all pending items merged.
     directives: Tuple of Directives.
+    _ast: The ast.Source node, possibly without the pending items, or None if
+        the files are not parsed yet.
+    _files: Verilog files of this module, parsed lazily if _ast is None.
+    _cache: Optional cache of parsed ASTs, used when parsing lazily.
+    _header_name: Name of the module before the files are parsed.
+    _pending_items: List of (kind, items) in the order they are added, where
+        consecutive items of the same kind are in the same list.
+    _pending_ports: List of ast.Port to be appended to the port list.
     _handshake_output_ports: A mapping from ap_done, ap_idle, ap_ready signal
         names to their ast.Assign nodes.
     _last_io_port_idx: Last index of an IOPort in module_def.items.
@@ -36,46 +142,152 @@ class Module:
     _last_param_idx: Last index of ast.Parameter in module_def.items.
     _last_instance_idx: Last index of ast.InstanceList in module_def.items.
     _last_logic_idx: Last index of ast.Assign or ast.Always in module_def.items.
+    _ports: A mapping from names to IOPorts in the order of declaration.
+    _signals: A mapping from names to ast.Wire or ast.Reg nodes.
+    _params: A mapping from names to ast.Parameter nodes.
+    _sorted_port_names: Sorted port names, used to look up ports by prefix.
+    _port_order: A mapping from port names to their order of declaration.
   """
 
-  def __init__(self, files: Iterable[str]):
-    """Construct a Module from files. """
+  def __init__(self,
+               files: Iterable[str],
+               cache: Optional[Cache] = None,
+               ports_only: bool = False):
+    """Construct a Module from files.
+
+    Args:
+      files: Verilog files to parse.
+      cache: Optional cache of parsed ASTs. If given, files whose content is
+          unchanged are not parsed again.
+      ports_only: If True, only scan the port declarations and defer parsing
+          until the AST is needed. Falls back to parsing if the declarations
+          are not recognized by the scanner.
+    """
     if not files:
       return
-    self.ast: ast.Source
-    self.directives: Tuple[Directive, ...]
-    self.ast, self.directives = parser.parse(files, debug=False)
+    self._files = tuple(files)
+    self._cache = cache
+    self._ast: Optional[ast.Source] = None
+    self._directives: Tuple[Directive, ...] = ()
     self._handshake_output_ports: Dict[str, ast.Assign] = {}
+    self._pending_items: List[Tuple[str, List[ast.Node]]] = []
+    self._pending_ports: List[ast.Port] = []
+    header = scan_ports(self._files) if ports_only else None
+    if header is None:
+      self._load()
+    else:
+      self._header_name, decls = header
+      self._reset_indices()
+      self._index_items(decls)
+
+  def _load(self) -> None:
+    """Parse the files and index the items, keeping the pending items."""
+    self._ast, self._directives = parse(self._files, self._cache)
     self._calculate_indices()
+    for kind, items in self._pending_items:
+      if kind in {'param', 'io_port', 'signal'}:
+        self._index_items(items)
+
+  def _add_items(self, kind: str, items: Iterable[ast.Node]) -> None:
+    if self._pending_items and self._pending_items[-1][0] == kind:
+      self._pending_items[-1][1].extend(items)
+    else:
+      self._pending_items.append((kind, list(items)))
+
+  def _materialize(self) -> None:
+    """Merge the pending items into the AST.
+
+    The insertions are replayed in the order they were added. Each inserts the
+    items after _last_*_idx of the same kind and shifts the indices of the other
+    kinds behind it. The resulting indices are kept rather than recalculated,
+    so the items are placed exactly as if each was inserted when added.
+    """
+    if not self._pending_ports and not self._pending_items:
+      return
+    module_def = self._get_module_def()
+    module_def.portlist.ports += tuple(self._pending_ports)
+    self._pending_ports.clear()
+
+    items = list(module_def.items)
+    last_idx = {x: getattr(self, f'_last_{x}_idx') for x in _ITEM_KINDS}
+    for kind, new_items in self._pending_items:
+      idx = last_idx[kind]
+      items[idx + 1:idx + 1] = new_items
+      for other in _ITEM_KINDS:
+        if other != kind and last_idx[other] > idx:
+          last_idx[other] += len(new_items)
+      last_idx[kind] = idx + len(new_items)
+    self._pending_items.clear()
+    module_def.items = tuple(items)
+    for kind, idx in last_idx.items():
+      setattr(self, f'_last_{kind}_idx', idx)
+
+  def _reset_indices(self) -> None:
+    self._reset_tables()
+    for attr in _ITEM_KINDS:
+      setattr(self, f'_last_{attr}_idx', None)
+
+  def _reset_tables(self) -> None:
+    self._ports: Dict[str, IOPort] = collections.OrderedDict()
+    self._signals: Dict[str, Union[ast.Wire, ast.Reg]]
+    self._signals = collections.OrderedDict()
+    self._params: Dict[str, ast.Parameter] = collections.OrderedDict()
+    self._sorted_port_names: List[str] = []
+    self._port_order: Dict[str, int] = {}
 
   def _calculate_indices(self) -> None:
-    for idx, item in enumerate(self._module_def.items):
-      if isinstance(item, ast.Decl):
-        if any(
-            isinstance(x, (ast.Input, ast.Output, ast.Input))
-            for x in item.list):
-          self._last_io_port_idx = idx
-        elif any(isinstance(x, (ast.Wire, ast.Reg)) for x in item.list):
-          self._last_signal_idx = idx
-        elif any(isinstance(x, ast.Parameter) for x in item.list):
-          self._last_param_idx = idx
-      elif isinstance(item, (ast.Assign, ast.Always)):
-        self._last_logic_idx = idx
-        if isinstance(item, ast.Assign):
-          if item.left.var.name in HANDSHAKE_OUTPUT_PORTS:
-            self._handshake_output_ports[item.left.var.name] = item
-      elif isinstance(item, ast.InstanceList):
-        self._last_instance_idx = idx
-
-    # if the item type is not present, set idx to the array bound
-    for attr in 'io_port', 'signal', 'param', 'logic', 'instance':
-      if not hasattr(self, '_last_%s_idx' % attr):
-        setattr(self, '_last_%s_idx' % attr, len(self._module_def.items))
+    self._reset_tables()
+    items = self._get_module_def().items
+    last_idx: Dict[str, int] = {}
+    for idx, item in enumerate(items):
+      # items added by add_* are not wrapped in Decl
+      self._index_items(item.list if isinstance(item, ast.Decl) else (item,))
+      kind = _get_item_kind(item)
+      if kind is not None:
+        last_idx[kind] = idx
+      if isinstance(item, ast.Assign):
+        # parsed assignments wrap the target in Lvalue but generated ones may
+        # not
+        left = item.left
+        if isinstance(left, ast.Lvalue):
+          left = left.var
+        name = getattr(left, 'name', None)
+        if name in HANDSHAKE_OUTPUT_PORTS:
+          self._handshake_output_ports[name] = item
+
+    # if the item type is not present, keep the previous idx if any, or set it
+    # to the array bound
+    for kind in _ITEM_KINDS:
+      attr = f'_last_{kind}_idx'
+      if kind in last_idx:
+        setattr(self, attr, last_idx[kind])
+      elif getattr(self, attr, None) is None:
+        setattr(self, attr, len(items))
+
+  def _index_items(self, items: Iterable[ast.Node]) -> None:
+    """Add declarations to the name-indexed tables."""
+    for item in items:
+      if isinstance(item, (ast.Input, ast.Output, ast.Inout)):
+        if item.name not in self._ports:
+          bisect.insort(self._sorted_port_names, item.name)
+          self._port_order[item.name] = len(self._port_order)
+        self._ports[item.name] = item
+      elif isinstance(item, (ast.Wire, ast.Reg)):
+        self._signals[item.name] = item
+      elif isinstance(item, ast.Parameter):
+        self._params[item.name] = item
 
   @property
   def _module_def(self) -> ast.ModuleDef:
+    self._materialize()
+    return self._get_module_def()
+
+  def _get_module_def(self) -> ast.ModuleDef:
+    """Return the ModuleDef node without merging the pending items."""
+    if self._ast is None:
+      self._load()
     _module_defs = [
-        x for x in self.ast.description.definitions
+        x for x in self._ast.description.definitions
         if isinstance(x, ast.ModuleDef)
     ]
     if len(_module_defs) != 1:
@@ -84,11 +296,13 @@ class Module:
 
   @property
   def name(self) -> str:
-    return self._module_def.name
+    if self._ast is None:
+      return self._header_name
+    return self._get_module_def().name
 
   @name.setter
   def name(self, name: str) -> None:
-    self._module_def.name = name
+    self._get_module_def().name = name
 
   @property
   def register_level(self) -> int:
@@ -126,12 +340,11 @@ class Module:
 
   @property
   def ports(self) -> Dict[str, IOPort]:
-    port_lists = (
-        x.list for x in self._module_def.items if isinstance(x, ast.Decl))
-    return collections.OrderedDict(
-        (x.name, x)
-        for x in itertools.chain.from_iterable(port_lists)
-        if isinstance(x, (ast.Input, ast.Output, ast.Inout)))
+    """IOPorts of this module in the order of declaration.
+
+    The returned mapping is maintained in place and must not be modified.
+    """
+    return self._ports
 
   def get_port_of(self, fifo: str, suffix: str) -> IOPort:
     """Return the IOPort of the given fifo with the given suffix.
@@ -178,62 +391,104 @@ class Module:
 
   @property
   def signals(self) -> Dict[str, Union[ast.Wire, ast.Reg]]:
-    signal_lists = (
-        x.list for x in self._module_def.items if isinstance(x, ast.Decl))
-    return collections.OrderedDict(
-        (x.name, x)
-        for x in itertools.chain.from_iterable(signal_lists)
-        if isinstance(x, (ast.Wire, ast.Reg)))
+    return self._signals
 
   @property
   def params(self) -> Dict[str, ast.Parameter]:
-    param_lists = (
-        x.list for x in self._module_def.items if isinstance(x, ast.Decl))
-    return collections.OrderedDict(
-        (x.name, x)
-        for x in itertools.chain.from_iterable(param_lists)
-        if isinstance(x, ast.Parameter))
+    return self._params
+
+  @property
+  def directives(self) -> Tuple[Directive, ...]:
+    if self._ast is None:
+      self._load()
+    return self._directives
 
   @property
   def code(self) -> str:
-    return '\n'.join(directive for _, directive in self.directives
-                    ) + codegen.ASTCodeGenerator().visit(self.ast)
+    # pylint: disable=import-outside-toplevel
+    from tapa.verilog.emitter import Emitter
+
+    return '\n'.join(
+        directive for _, directive in self.directives) + Emitter().visit(
+            self.ast)
 
-  def _increment_idx(self, length: int, target: str) -> None:
-    attrs = 'io_port', 'signal', 'param', 'logic', 'instance'
-    if target not in attrs:
-      raise ValueError('target must be one of %s' % str(attrs))
+  def write(self, fileobj: TextIO) -> None:
+    """Write the code of this module to fileobj item by item.
 
-    for attr in attrs:
-      if attr == target:
+    The output is the same as `code`, but only one item is rendered in memory
+    at a time so that peak memory does not grow with the module size.
+    """
+    # pylint: disable=import-outside-toplevel
+    from tapa.verilog.emitter import Emitter
+
+    generator = Emitter()
+    module_def = self._module_def
+
+    fileobj.write('\n'.join(directive for _, directive in self.directives))
+    # other definitions, e.g., pragmas, are small and rendered as a whole
+    for definition in self.ast.description.definitions:
+      fileobj.write('\n')  # from the template of ast.Description
+      if definition is not module_def:
+        fileobj.write(generator.visit(definition))
+        fileobj.write('\n')  # from the template of ast.Description
         continue
-      attr = '_last_%s_idx' % attr
-      idx = '_last_%s_idx' % target
-      if getattr(self, attr) > getattr(self, idx):
-        setattr(self, attr, getattr(self, attr) + length)
-    setattr(self, idx, getattr(self, idx) + length)
-
-  def _filter(self, func: Callable[[ast.Node], bool], target: str) -> None:
-    self._module_def.items = tuple(filter(func, self._module_def.items))
+
+      # render the module without items to obtain the header and the footer
+      empty_module_def = copy.copy(module_def)
+      empty_module_def.items = ()
+      header, _, footer = generator.visit(empty_module_def).rpartition(
+          '\nendmodule')
+      fileobj.write(header)
+      for item in module_def.items:
+        fileobj.write(generator.indent(generator.visit(item)))
+        fileobj.write('\n')
+      fileobj.write('\nendmodule')
+      fileobj.write(footer)
+      fileobj.write('\n')  # from the template of ast.Description
+
+  def del_items(self, rules: Iterable[ItemRule]) -> None:
+    """Delete items matching any of the rules in a single pass.
+
+    The _last_*_idx are updated as if the rules were applied one by one, so
+    that items added later are placed the same way.
+    """
+    rule_tuple = tuple(rules)
+    items = self._module_def.items
+    # index of the first rule that deletes each item, or len(rule_tuple)
+    steps = [
+        next((i for i, x in enumerate(rule_tuple) if x.matches(item)),
+             len(rule_tuple)) for item in items
+    ]
+    kinds = [_get_item_kind(x) for x in items]
+    for kind in _ITEM_KINDS:
+      # items of the kind are present until they are all deleted at this step
+      last_step = max((s for s, k in zip(steps, kinds) if k == kind), default=0)
+      if last_step in {0, len(rule_tuple)}:
+        continue
+      # keep the index of the last item of the kind before that step
+      idx = 0
+      for s, k in zip(steps, kinds):
+        if s >= last_step:
+          if k == kind:
+            setattr(self, f'_last_{kind}_idx', idx)
+          idx += 1
+    self._module_def.items = tuple(
+        item for item, s in zip(items, steps) if s == len(rule_tuple))
     self._calculate_indices()
 
   def add_ports(self, ports: Iterable[IOPort]) -> 'Module':
     port_tuple = tuple(ports)
-    self._module_def.portlist.ports += tuple(
+    self._pending_ports.extend(
         ast.Port(name=port.name, width=None, dimensions=None, type=None)
         for port in port_tuple)
-    self._module_def.items = (
-        self._module_def.items[:self._last_io_port_idx + 1] + port_tuple +
-        self._module_def.items[self._last_io_port_idx + 1:])
-    self._increment_idx(len(port_tuple), 'io_port')
+    self._index_items(port_tuple)
+    self._add_items('io_port', port_tuple)
     return self
 
   def add_signals(self, signals: Iterable[Signal]) -> 'Module':
     signal_tuple = tuple(signals)
-    self._module_def.items = (
-        self._module_def.items[:self._last_signal_idx + 1] + signal_tuple +
-        self._module_def.items[self._last_signal_idx + 1:])
-    self._increment_idx(len(signal_tuple), 'signal')
+    self._index_items(signal_tuple)
+    self._add_items('signal', signal_tuple)
     return self
 
   def add_pipeline(self, q: Pipeline, init: ast.Node) -> None:
@@ -255,38 +510,16 @@ class Module:
     ))
 
   def del_signals(self, prefix: str = '', suffix: str = '') -> None:
-
-    def func(item: ast.Node) -> bool:
-      if isinstance(item, ast.Decl):
-        item = item.list[0]
-        if isinstance(item, (ast.Reg, ast.Wire)):
-          name: str = item.name
-          if name.startswith(prefix) and name.endswith(suffix):
-            return False
-      return True
-
-    self._filter(func, 'signal')
+    self.del_items([ItemRule(_SIGNAL_TYPES, prefix=prefix, suffix=suffix)])
 
   def add_params(self, params: Iterable[ast.Parameter]) -> 'Module':
     param_tuple = tuple(params)
-    self._module_def.items = (
-        self._module_def.items[:self._last_param_idx + 1] + param_tuple +
-        self._module_def.items[self._last_param_idx + 1:])
-    self._increment_idx(len(param_tuple), 'param')
+    self._index_items(param_tuple)
+    self._add_items('param', param_tuple)
     return self
 
   def del_params(self, prefix: str = '', suffix: str = '') -> None:
-
-    def func(item: ast.Node) -> bool:
-      if isinstance(item, ast.Decl):
-        item = item.list[0]
-        if isinstance(item, ast.Parameter):
-          name: str = item.name
-          if name.startswith(prefix) and name.endswith(suffix):
-            return False
-      return True
-
-    self._filter(func, 'param')
+    self.del_items([ItemRule(_PARAM_TYPES, prefix=prefix, suffix=suffix)])
 
   def add_instance(
       self,
@@ -295,54 +528,32 @@ class Module:
       ports: Iterable[ast.ParamArg],
       params: Iterable[ast.ParamArg] = ()
   ) -> 'Module':
-    self._module_def.items = (
-        self._module_def.items[:self._last_instance_idx + 1] +
-        (ast.InstanceList(module=module_name,
-                          parameterlist=params,
-                          instances=(ast.Instance(module=None,
-                                                  name=instance_name,
-                                                  parameterlist=None,
-                                                  portlist=ports),)),) +
-        self._module_def.items[self._last_instance_idx + 1:])
-    self._increment_idx(1, 'instance')
+    instance = ast.Instance(module=None,
+                            name=instance_name,
+                            parameterlist=None,
+                            portlist=tuple(ports))
+    self._add_items('instance', (ast.InstanceList(module=module_name,
+                                                  parameterlist=tuple(params),
+                                                  instances=(instance,)),))
     return self
 
   def add_logics(self, logics: Iterable[Logic]) -> 'Module':
-    logic_tuple = tuple(logics)
-    self._module_def.items = (
-        self._module_def.items[:self._last_logic_idx + 1] + logic_tuple +
-        self._module_def.items[self._last_logic_idx + 1:])
-    self._increment_idx(len(logic_tuple), 'logic')
+    self._add_items('logic', logics)
     return self
 
   def del_logics(self) -> None:
-
-    def func(item: ast.Node) -> bool:
-      if isinstance(item, (ast.Assign, ast.Always, ast.Initial)):
-        return False
-      return True
-
-    self._filter(func, 'param')
+    self.del_items([ItemRule(_LOGIC_TYPES)])
 
   def del_instances(self, prefix: str = '', suffix: str = '') -> None:
-    def func(item: ast.Node) -> bool:
-      if isinstance(item, ast.InstanceList) and \
-          item.module.startswith(prefix) and \
-          item.module.endswith(suffix):
-        return False
-      return True
-
-    self._filter(func, 'instance')
-
-  def del_pragmas(self, pragma: Iterable[str]) -> None:
-
-    def func(item: ast.Node) -> bool:
-      if isinstance(item, ast.Pragma):
-        if item.entry.name == pragma or item.entry.name in pragma:
-          return False
-      return True
+    self.del_items([ItemRule(_INSTANCE_TYPES, prefix=prefix, suffix=suffix)])
 
-    self._filter(func, 'signal')
+  def del_pragmas(self, pragma: Union[str, Iterable[str]]) -> None:
+    """Delete pragmas named by pragma, or by a substring of it if a str."""
+    if isinstance(pragma, str):
+      rule = ItemRule(_PRAGMA_TYPES, within=pragma)
+    else:
+      rule = ItemRule(_PRAGMA_TYPES, names=frozenset(pragma))
+    self.del_items([rule])
 
   def add_fifo_instance(
       self,
@@ -400,6 +611,8 @@ class Module:
       max_burst_len: Optional[int] = None,
       offset_name: str = '',
   ) -> 'Module':
+    m_axi_prefix = get_m_axi_prefix()
+
     rst_q = Pipeline(f'{name}__rst', level=self.register_level)
     self.add_pipeline(rst_q, init=ast.Unot(RST_N))
 
@@ -438,8 +651,8 @@ class Module:
     for channel, ports in M_AXI_PORTS.items():
       for port, direction in ports:
         portargs.append(
-            ast.make_port_arg(port=f'{M_AXI_PREFIX}{channel}{port}',
-                              arg=f'{M_AXI_PREFIX}{name}_{channel}{port}'))
+            ast.make_port_arg(port=f'{m_axi_prefix}{channel}{port}',
+                              arg=f'{m_axi_prefix}{name}_{channel}{port}'))
 
     tags = set(tags)
     for tag in ASYNC_MMAP_SUFFIXES:
@@ -468,11 +681,19 @@ class Module:
                              params=paramargs)
 
   def find_port(self, prefix: str, suffix: str) -> Optional[str]:
-    '''Find an IO port with given prefix and suffix in this module.'''
-    for port_name in self.ports:
-      if port_name.startswith(prefix) and port_name.endswith(suffix):
-        return port_name
-    return None
+    '''Find an IO port with given prefix and suffix in this module.
+
+    If multiple ports match, the one declared first is returned.
+    '''
+    names = self._sorted_port_names
+    matches = []
+    for idx in range(bisect.bisect_left(names, prefix), len(names)):
+      port_name = names[idx]
+      if not port_name.startswith(prefix):
+        break
+      if port_name.endswith(suffix):
+        matches.append(port_name)
+    return min(matches, key=self._port_order.__getitem__, default=None)
 
   def add_m_axi(
       self,
@@ -481,38 +702,164 @@ class Module:
       addr_width: int = 64,
       id_width: Optional[int] = None,
   ) -> 'Module':
+    m_axi_prefix = get_m_axi_prefix()
+
     for channel, ports in M_AXI_PORTS.items():
       io_ports = []
       for port, direction in ports:
         io_ports.append((ast.Input if direction == 'input' else ast.Output)(
-            name=f'{M_AXI_PREFIX}{name}_{channel}{port}',
+            name=f'{m_axi_prefix}{name}_{channel}{port}',
             width=get_m_axi_port_width(port, data_width, addr_width, id_width),
         ))
       self.add_ports(io_ports)
     return self
 
   def cleanup(self) -> None:
-    self.del_params(prefix='ap_ST_fsm_state')
-    self.del_signals(prefix='ap_CS_fsm')
-    self.del_signals(prefix='ap_NS_fsm')
-    self.del_signals(suffix='_read')
-    self.del_signals(suffix='_write')
-    self.del_signals(suffix='_blk_n')
-    self.del_signals(suffix='_regslice')
-    self.del_signals(prefix='regslice_')
-    self.del_signals(HANDSHAKE_RST)
-    self.del_signals(HANDSHAKE_DONE)
-    self.del_signals(HANDSHAKE_IDLE)
-    self.del_signals(HANDSHAKE_READY)
-    self.del_logics()
-    self.del_instances(suffix='_regslice_both')
-    self.del_pragmas('fsm_encoding')
+    self.del_items(_CLEANUP_RULES)
     self.add_signals(
         map(ast.Wire,
             (HANDSHAKE_RST, HANDSHAKE_DONE, HANDSHAKE_IDLE, HANDSHAKE_READY)))
     self.add_pipeline(self.rst_n_q, init=RST_N)
     self.add_logics([ast.Assign(left=RST, right=ast.Unot(self.rst_n_q[-1]))])
 
+  # Defined last because it shadows the `ast` module in the class body.
+  @property
+  def ast(self) -> ast.Source:
+    self._materialize()
+    return self._ast
+
+
+def parse(
+    files: Iterable[str],
+    cache: Optional[Cache] = None,
+) -> Tuple[ast.Source, Tuple[Directive, ...]]:
+  """Parse Verilog files, reusing the cached result if possible.
+
+  Args:
+    files: Verilog files to parse.
+    cache: Optional cache of parsed ASTs keyed by the file contents and the
+        pyverilog version.
+
+  Returns:
+    Tuple of the ast.Source node and the directives.
+  """
+  # pylint: disable=import-outside-toplevel
+  from pyverilog.vparser import parser
+
+  files = tuple(files)
+  if cache is None:
+    return parser.parse(files, debug=False)
+
+  digests = []
+  for filename in files:
+    with open(filename, 'rb') as fileobj:
+      digests.append(hashlib.sha256(fileobj.read()).hexdigest())
+  key = get_key(getattr(pyverilog, '__version__', ''), digests)
+
+  buf = io.BytesIO()
+  if cache.get(key, buf):
+    _logger.debug('reusing cached AST for %s', ', '.join(files))
+    return pickle.loads(buf.getvalue())
+
+  result = parser.parse(files, debug=False)
+  cache.put(key, io.BytesIO(pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+  return result
+
+
+_PORT_DECL_PATTERN = re.compile(r'(?P<direction>input|output|inout)\s+'
+                                r'(?:(?P<type>wire|reg)\s+)?'
+                                r'(?P<signed>signed\s+)?'
+                                r'(?:\[(?P<msb>[^:\]]+):(?P<lsb>[^\]]+)\]\s*)?'
+                                r'(?P<names>\w+(?:\s*,\s*\w+)*)')
+_WIDTH_EXPR_PATTERN = re.compile(r'(?P<int>\d+)|'
+                                 r'(?P<id>[a-zA-Z_]\w*)'
+                                 r'(?:\s*(?P<op>[-+])\s*(?P<rhs>\d+))?')
+_COMMENT_PATTERN = re.compile(
+    r'(?P<sens>@\s*\(\s*\*\s*\))|/\*.*?\*/|//[^\n]*|\(\*.*?\*\)', re.DOTALL)
+_DIRECTION_TYPES = {
+    'input': ast.Input,
+    'output': ast.Output,
+    'inout': ast.Inout,
+}
+_SIGNAL_TYPE_OF = {'wire': ast.Wire, 'reg': ast.Reg}
+
+
+def _scan_width_expr(expr: str) -> Optional[ast.Node]:
+  match = _WIDTH_EXPR_PATTERN.fullmatch(expr.strip())
+  if match is None:
+    return None
+  if match['int'] is not None:
+    return ast.IntConst(match['int'])
+  node = ast.Identifier(match['id'])
+  if match['op'] is None:
+    return node
+  operator = ast.Minus if match['op'] == '-' else ast.Plus
+  return operator(node, ast.IntConst(match['rhs']))
+
+
+def scan_ports(
+    files: Iterable[str]) -> Optional[Tuple[str, Tuple[ast.Node, ...]]]:
+  """Scan the module name and port declarations without a full parse.
+
+  The scanner recognizes the non-ANSI module headers generated by HLS, e.g.,
+  `input  [C_WIDTH - 1:0] foo;` and `output reg ap_done;`, and builds the same
+  nodes as pyverilog does.
+
+  Args:
+    files: Verilog files of a single module.
+
+  Returns:
+    Tuple of the module name and the declared IOPorts (and Wires or Regs for
+    ports declared as such), or None if the files are not recognized.
+  """
+  texts = []
+  for filename in files:
+    with open(filename) as fileobj:
+      texts.append(fileobj.read())
+  text = '\n'.join(texts)
+  # `@ (*)` is kept as is rather than taken as the start of an attribute
+  text = _COMMENT_PATTERN.sub(lambda match: match['sens'] or ' ', text)
+
+  modules = re.findall(r'\bmodule\s+(\w+)\s*\(([^;]*)\)\s*;', text)
+  if len(modules) != 1 or len(re.findall(r'\bmodule\b', text)) != 1:
+    return None
+  name, port_list = modules[0]
+  port_names = [x.strip() for x in port_list.split(',')]
+  if not all(re.fullmatch(r'\w+', x) for x in port_names):
+    return None  # ANSI-style or unusual header
+
+  decls: List[ast.Node] = []
+  for statement in text.split(';'):
+    statement = statement.strip()
+    if not statement.startswith(tuple(_DIRECTION_TYPES)):
+      continue
+    match = _PORT_DECL_PATTERN.fullmatch(statement)
+    if match is None:
+      if re.match(r'(input|output|inout)\b', statement):
+        return None
+      continue
+    width = None
+    if match['msb'] is not None:
+      msb = _scan_width_expr(match['msb'])
+      lsb = _scan_width_expr(match['lsb'])
+      if msb is None or lsb is None:
+        return None
+      width = ast.Width(msb=msb, lsb=lsb)
+    signed = match['signed'] is not None
+    for port_name in re.split(r'\s*,\s*', match['names']):
+      decls.append(_DIRECTION_TYPES[match['direction']](name=port_name,
+                                                        width=width,
+                                                        signed=signed))
+      if match['type'] is not None:
+        decls.append(_SIGNAL_TYPE_OF[match['type']](name=port_name,
+                                                    width=width,
+                                                    signed=signed))
+
+  if sorted(x.name for x in decls if isinstance(x, (
+      ast.Input, ast.Output, ast.Inout))) != sorted(port_names):
+    return None
+  return name, tuple(decls)
+
 
 def generate_m_axi_ports(
     module: Module,
@@ -534,9 +881,11 @@ def generate_m_axi_ports(
   Yields:
       Iterator[ast.PortArg]: PortArgs.
   """
+  m_axi_prefix = get_m_axi_prefix()
+
   for suffix in M_AXI_SUFFIXES:
-    yield ast.make_port_arg(port=M_AXI_PREFIX + port + suffix,
-                            arg=M_AXI_PREFIX + arg + suffix)
+    yield ast.make_port_arg(port=m_axi_prefix + port + suffix,
+                            arg=m_axi_prefix + arg + suffix)
   for suffix in '_offset', '_data_V', '_V', '':
     port_name = module.find_port(prefix=port, suffix=suffix)
     if port_name is not None:
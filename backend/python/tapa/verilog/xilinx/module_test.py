@@ -0,0 +1,233 @@
+import io
+import os
+import tempfile
+import unittest
+
+from pyverilog.ast_code_generator.codegen import ASTCodeGenerator
+
+import tapa.core  # pylint: disable=unused-import # avoid circular imports
+from tapa.verilog import ast
+from tapa.verilog import xilinx as rtl
+
+# top module as generated by Vitis HLS, with a pragma before the module
+HLS_TOP = '''
+(* CORE_GENERATION_INFO="Top_Top,hls_ip_2020_2,{HLS_INPUT_TYPE=cxx}" *)
+
+module Top (
+        ap_clk,
+        ap_rst_n,
+        ap_start,
+        ap_done,
+        ap_idle,
+        ap_ready
+);
+
+input   ap_clk;
+input   ap_rst_n;
+input   ap_start;
+output   ap_done;
+output   ap_idle;
+output   ap_ready;
+
+assign ap_done = ap_start;
+assign ap_idle = 1'b1;
+assign ap_ready = ap_start;
+
+endmodule //Top
+'''
+
+# upper-level module as generated by Vitis HLS, with items removed by cleanup
+HLS_UPPER = '''
+module Upper (
+        ap_clk,
+        ap_rst_n,
+        ap_start,
+        ap_done,
+        ap_idle,
+        ap_ready
+);
+
+parameter    ap_ST_fsm_state1 = 1'd1;
+
+input   ap_clk;
+input   ap_rst_n;
+input   ap_start;
+output   ap_done;
+output   ap_idle;
+output   ap_ready;
+
+reg   [0:0] ap_CS_fsm;
+wire    ap_CS_fsm_state1;
+reg   [0:0] ap_NS_fsm;
+reg    ap_rst_n_inv;
+
+always @ (posedge ap_clk) begin
+    if (ap_rst_n_inv == 1'b1) begin
+        ap_CS_fsm <= ap_ST_fsm_state1;
+    end else begin
+        ap_CS_fsm <= ap_NS_fsm;
+    end
+end
+
+assign ap_CS_fsm_state1 = ap_CS_fsm[32'd0];
+
+always @ (*) begin
+    ap_rst_n_inv = ~ap_rst_n;
+end
+
+endmodule //Upper
+'''
+
+# module with a port declared between `always @ (*)` and an attribute
+LATE_PORT = '''
+module Late (
+        ap_clk,
+        ap_start,
+        ap_ready
+);
+
+input   ap_clk;
+input   ap_start;
+
+always @ (*) ap_ready = ap_start;
+output   ap_ready;
+(* fsm_encoding = "none" *) reg   [0:0] ap_CS_fsm;
+reg ap_ready;
+
+endmodule //Late
+'''
+
+
+class ModuleWriteTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.TemporaryDirectory(prefix='tapa-module-test-')
+    self.addCleanup(self._tmpdir.cleanup)
+    self.module = self.make_module('Top', HLS_TOP)
+
+  def make_module(self, name: str, code: str) -> rtl.Module:
+    filename = os.path.join(self._tmpdir.name, f'{name}.v')
+    with open(filename, 'w') as fileobj:
+      fileobj.write(code)
+    return rtl.Module([filename])
+
+  def assert_write_equals_code(self) -> None:
+    fileobj = io.StringIO()
+    self.module.write(fileobj)
+    self.assertEqual(fileobj.getvalue(), self.module.code)
+
+  def test_write_keeps_pragma(self):
+    self.assert_write_equals_code()
+    self.assertIn('CORE_GENERATION_INFO', self.module.code)
+
+  def test_write_with_added_items(self):
+    self.module.register_level = 2
+    self.module.add_signals([ast.Wire(name='foo', width=ast.make_width(32))])
+    self.module.add_fifo_instance(name='fifo_0', width=33, depth=2)
+    self.assert_write_equals_code()
+
+  def test_added_items_keep_insertion_order(self):
+    # without any logic or instance, items of both kinds go to the end
+    code = ''.join(
+        x for x in HLS_TOP.splitlines(True) if not x.startswith('assign'))
+
+    def add_items(module: rtl.Module, materialize: bool) -> str:
+      module.add_pipeline(rtl.Pipeline('foo__rst', level=2), rtl.RST_N)
+      if materialize:
+        _ = module.code
+      module.add_instance('foo', 'foo_0', ())
+      if materialize:
+        _ = module.code
+      module.add_signals([ast.Wire(name='bar_done')])
+      if materialize:
+        _ = module.code
+      module.add_instance('bar', 'bar_0', ())
+      return module.code
+
+    deferred = add_items(self.make_module('Deferred', code), False)
+    eager = add_items(self.make_module('Eager', code), True)
+    self.assertEqual(deferred, eager)
+
+  def test_del_items_keeps_indices_of_rules_one_by_one(self):
+
+    def cleanup(module: rtl.Module, one_by_one: bool) -> str:
+      # pylint: disable=protected-access
+      if one_by_one:
+        for rule in rtl.module._CLEANUP_RULES:
+          module.del_items([rule])
+      else:
+        module.del_items(rtl.module._CLEANUP_RULES)
+      module.add_pipeline(module.rst_n_q, init=rtl.RST_N)
+      module.add_instance('foo', 'foo_0', ())
+      module.add_signals([ast.Wire(name='foo_done')])
+      return module.code
+
+    self.assertEqual(
+        cleanup(self.make_module('Upper', HLS_UPPER), False),
+        cleanup(self.make_module('UpperOneByOne', HLS_UPPER), True),
+    )
+
+  def test_del_pragmas(self):
+    # pylint: disable=protected-access
+    code = '''
+module Pragmas (ap_clk);
+input ap_clk;
+(* fsm_encoding = "none" *) reg a;
+(* fsm *) reg b;
+(* encoding_x *) reg c;
+(* keep = "true" *) reg d;
+endmodule
+'''
+
+    def get_pragmas(module: rtl.Module):
+      return [
+          x.entry.name
+          for x in module._get_module_def().items
+          if isinstance(x, ast.Pragma)
+      ]
+
+    # a str also names the pragmas that are its substrings
+    module = self.make_module('Substring', code)
+    module.del_pragmas('fsm_encoding')
+    self.assertEqual(get_pragmas(module), ['encoding_x', 'keep'])
+
+    module = self.make_module('Names', code)
+    module.del_pragmas(['fsm', 'keep'])
+    self.assertEqual(get_pragmas(module), ['fsm_encoding', 'encoding_x'])
+
+    module = self.make_module('Cleanup', code)
+    module.del_items(rtl.module._CLEANUP_RULES)
+    self.assertEqual(get_pragmas(module), ['encoding_x', 'keep'])
+
+
+class ScanPortsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.TemporaryDirectory(prefix='tapa-module-test-')
+    self.addCleanup(self._tmpdir.cleanup)
+
+  def assert_scan_equals_parse(self, name: str, code: str) -> None:
+    filename = os.path.join(self._tmpdir.name, f'{name}.v')
+    with open(filename, 'w') as fileobj:
+      fileobj.write(code)
+    self.assertIsNotNone(rtl.module.scan_ports([filename]))
+    scanned = rtl.Module([filename], ports_only=True)
+    parsed = rtl.Module([filename])
+    codegen = ASTCodeGenerator()
+    self.assertEqual(scanned.name, parsed.name)
+    self.assertEqual(
+        {k: codegen.visit(v) for k, v in scanned.ports.items()},
+        {k: codegen.visit(v) for k, v in parsed.ports.items()},
+    )
+
+  def test_hls_top(self):
+    self.assert_scan_equals_parse('Top', HLS_TOP)
+
+  def test_always_star(self):
+    self.assertIn('always @ (*)', HLS_UPPER)
+    self.assert_scan_equals_parse('Upper', HLS_UPPER)
+    self.assert_scan_equals_parse('Late', LATE_PORT)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,614 @@
+"""Shells of upper-level tasks generated without HLS.
+
+HLS generates an FSM, logics, and register slices for upper-level tasks, which
+are all removed by `Module.cleanup` before the children are instantiated. The
+shells generated here only have what is kept: the handshake ports, the ports
+of the arguments, and, for the top-level task, the AXI-Lite control interface.
+"""
+
+from typing import Iterable, Iterator, List, Tuple
+
+import tapa.instance
+from tapa.verilog.xilinx.axis import *
+from tapa.verilog.xilinx.const import *
+
+__all__ = [
+    'generate_control_s_axi',
+    'generate_upper_shell',
+    'get_s_axi_registers',
+]
+
+# (port, direction, width) of the AXI-Lite interface, where width is a Verilog
+# expression of C_S_AXI_ADDR_WIDTH and C_S_AXI_DATA_WIDTH, or '' for 1 bit
+S_AXI_PORTS = (
+    ('AWVALID', 'input', ''),
+    ('AWREADY', 'output', ''),
+    ('AWADDR', 'input', 'C_S_AXI_ADDR_WIDTH'),
+    ('WVALID', 'input', ''),
+    ('WREADY', 'output', ''),
+    ('WDATA', 'input', 'C_S_AXI_DATA_WIDTH'),
+    ('WSTRB', 'input', 'C_S_AXI_DATA_WIDTH / 8'),
+    ('ARVALID', 'input', ''),
+    ('ARREADY', 'output', ''),
+    ('ARADDR', 'input', 'C_S_AXI_ADDR_WIDTH'),
+    ('RVALID', 'output', ''),
+    ('RREADY', 'input', ''),
+    ('RDATA', 'output', 'C_S_AXI_DATA_WIDTH'),
+    ('RRESP', 'output', '2'),
+    ('BVALID', 'output', ''),
+    ('BREADY', 'input', ''),
+    ('BRESP', 'output', '2'),
+)
+
+# (port, direction) of an AXI-Stream input; outputs have opposite directions
+AXIS_PORTS = (
+    ('TDATA', 'input'),
+    ('TVALID', 'input'),
+    ('TREADY', 'output'),
+    ('TKEEP', 'input'),
+    ('TLAST', 'input'),
+)
+
+_OPPOSITE_DIRECTION = {'input': 'output', 'output': 'input'}
+
+SHELL_TEMPLATE = '''\
+// ==============================================================
+// Shell of upper-level task {name} generated by tapac
+// ==============================================================
+
+`timescale 1 ns / 1 ps
+
+module {name} (
+{port_names}
+);
+
+{decls}
+
+endmodule //{name}
+'''
+
+CONTROL_S_AXI_TEMPLATE = '''\
+// ==============================================================
+// AXI-Lite control interface of {name} generated by tapac
+// ==============================================================
+// 0x00 : Control signals
+//        bit 0  - ap_start (Read/Write/COH)
+//        bit 1  - ap_done (Read/COR)
+//        bit 2  - ap_idle (Read)
+//        bit 3  - ap_ready (Read/COR)
+//        bit 7  - auto_restart (Read/Write)
+//        others - reserved
+// 0x04 : Global Interrupt Enable Register
+//        bit 0  - Global Interrupt Enable (Read/Write)
+//        others - reserved
+// 0x08 : IP Interrupt Enable Register (Read/Write)
+//        bit 0  - enable ap_done interrupt (Read/Write)
+//        bit 1  - enable ap_ready interrupt (Read/Write)
+//        others - reserved
+// 0x0c : IP Interrupt Status Register (Read/TOW)
+//        bit 0  - ap_done (COR/TOW)
+//        bit 1  - ap_ready (COR/TOW)
+//        others - reserved
+{register_map}
+// (SC = Self Clear, COR = Clear on Read, TOW = Toggle on Write, COH = Clear on
+// Handshake)
+
+`timescale 1 ns / 1 ps
+
+module {name}_control_s_axi
+#(parameter
+    C_S_AXI_ADDR_WIDTH = {addr_width},
+    C_S_AXI_DATA_WIDTH = 32
+)(
+    input  wire                          ACLK,
+    input  wire                          ARESET,
+    input  wire                          ACLK_EN,
+    input  wire [C_S_AXI_ADDR_WIDTH-1:0] AWADDR,
+    input  wire                          AWVALID,
+    output wire                          AWREADY,
+    input  wire [C_S_AXI_DATA_WIDTH-1:0] WDATA,
+    input  wire [C_S_AXI_DATA_WIDTH/8-1:0] WSTRB,
+    input  wire                          WVALID,
+    output wire                          WREADY,
+    output wire [1:0]                    BRESP,
+    output wire                          BVALID,
+    input  wire                          BREADY,
+    input  wire [C_S_AXI_ADDR_WIDTH-1:0] ARADDR,
+    input  wire                          ARVALID,
+    output wire                          ARREADY,
+    output wire [C_S_AXI_DATA_WIDTH-1:0] RDATA,
+    output wire [1:0]                    RRESP,
+    output wire                          RVALID,
+    input  wire                          RREADY,
+    output wire                          interrupt,
+{arg_ports}
+    output wire                          ap_start,
+    input  wire                          ap_done,
+    input  wire                          ap_ready,
+    input  wire                          ap_idle
+);
+
+//------------------------Parameter----------------------
+localparam
+    ADDR_AP_CTRL = {addr_width}'h00,
+    ADDR_GIE     = {addr_width}'h04,
+    ADDR_IER     = {addr_width}'h08,
+    ADDR_ISR     = {addr_width}'h0c,
+{arg_addrs}
+    WRIDLE       = 2'd0,
+    WRDATA       = 2'd1,
+    WRRESP       = 2'd2,
+    WRRESET      = 2'd3,
+    RDIDLE       = 2'd0,
+    RDDATA       = 2'd1,
+    RDRESET      = 2'd2,
+    ADDR_BITS    = {addr_width};
+
+//------------------------Local signal-------------------
+    reg  [1:0]                    wstate = WRRESET;
+    reg  [1:0]                    wnext;
+    reg  [ADDR_BITS-1:0]          waddr;
+    wire [C_S_AXI_DATA_WIDTH-1:0] wmask;
+    wire                          aw_hs;
+    wire                          w_hs;
+    reg  [1:0]                    rstate = RDRESET;
+    reg  [1:0]                    rnext;
+    reg  [C_S_AXI_DATA_WIDTH-1:0] rdata;
+    wire                          ar_hs;
+    wire [ADDR_BITS-1:0]          raddr;
+    // internal registers
+    reg                           int_ap_idle = 1'b0;
+    reg                           int_ap_ready = 1'b0;
+    reg                           int_ap_done = 1'b0;
+    reg                           int_ap_start = 1'b0;
+    reg                           int_auto_restart = 1'b0;
+    reg                           int_gie = 1'b0;
+    reg  [1:0]                    int_ier = 2'b0;
+    reg  [1:0]                    int_isr = 2'b0;
+{arg_regs}
+
+//------------------------AXI write fsm------------------
+assign AWREADY = (wstate == WRIDLE);
+assign WREADY  = (wstate == WRDATA);
+assign BRESP   = 2'b00;  // OKAY
+assign BVALID  = (wstate == WRRESP);
+assign wmask   = {{ {{8{{WSTRB[3]}}}}, {{8{{WSTRB[2]}}}},
+                    {{8{{WSTRB[1]}}}}, {{8{{WSTRB[0]}}}} }};
+assign aw_hs   = AWVALID & AWREADY;
+assign w_hs    = WVALID & WREADY;
+
+// wstate
+always @(posedge ACLK) begin
+    if (ARESET)
+        wstate <= WRRESET;
+    else if (ACLK_EN)
+        wstate <= wnext;
+end
+
+// wnext
+always @(*) begin
+    case (wstate)
+        WRIDLE:
+            if (AWVALID)
+                wnext = WRDATA;
+            else
+                wnext = WRIDLE;
+        WRDATA:
+            if (WVALID)
+                wnext = WRRESP;
+            else
+                wnext = WRDATA;
+        WRRESP:
+            if (BREADY)
+                wnext = WRIDLE;
+            else
+                wnext = WRRESP;
+        default:
+            wnext = WRIDLE;
+    endcase
+end
+
+// waddr
+always @(posedge ACLK) begin
+    if (ACLK_EN) begin
+        if (aw_hs)
+            waddr <= AWADDR[ADDR_BITS-1:0];
+    end
+end
+
+//------------------------AXI read fsm-------------------
+assign ARREADY = (rstate == RDIDLE);
+assign RDATA   = rdata;
+assign RRESP   = 2'b00;  // OKAY
+assign RVALID  = (rstate == RDDATA);
+assign ar_hs   = ARVALID & ARREADY;
+assign raddr   = ARADDR[ADDR_BITS-1:0];
+
+// rstate
+always @(posedge ACLK) begin
+    if (ARESET)
+        rstate <= RDRESET;
+    else if (ACLK_EN)
+        rstate <= rnext;
+end
+
+// rnext
+always @(*) begin
+    case (rstate)
+        RDIDLE:
+            if (ARVALID)
+                rnext = RDDATA;
+            else
+                rnext = RDIDLE;
+        RDDATA:
+            if (RREADY & RVALID)
+                rnext = RDIDLE;
+            else
+                rnext = RDDATA;
+        default:
+            rnext = RDIDLE;
+    endcase
+end
+
+// rdata
+always @(posedge ACLK) begin
+    if (ACLK_EN) begin
+        if (ar_hs) begin
+            rdata <= 'b0;
+            case (raddr)
+                ADDR_AP_CTRL: begin
+                    rdata[0] <= int_ap_start;
+                    rdata[1] <= int_ap_done;
+                    rdata[2] <= int_ap_idle;
+                    rdata[3] <= int_ap_ready;
+                    rdata[7] <= int_auto_restart;
+                end
+                ADDR_GIE: begin
+                    rdata <= int_gie;
+                end
+                ADDR_IER: begin
+                    rdata <= int_ier;
+                end
+                ADDR_ISR: begin
+                    rdata <= int_isr;
+                end
+{arg_reads}
+            endcase
+        end
+    end
+end
+
+//------------------------Register logic-----------------
+assign interrupt = int_gie & (|int_isr);
+assign ap_start  = int_ap_start;
+{arg_assigns}
+
+// int_ap_start
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_ap_start <= 1'b0;
+    else if (ACLK_EN) begin
+        if (w_hs && waddr == ADDR_AP_CTRL && WSTRB[0] && WDATA[0])
+            int_ap_start <= 1'b1;
+        else if (ap_ready)
+            int_ap_start <= int_auto_restart; // clear on handshake/auto restart
+    end
+end
+
+// int_ap_done
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_ap_done <= 1'b0;
+    else if (ACLK_EN) begin
+        if (ap_done)
+            int_ap_done <= 1'b1;
+        else if (ar_hs && raddr == ADDR_AP_CTRL)
+            int_ap_done <= 1'b0; // clear on read
+    end
+end
+
+// int_ap_idle
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_ap_idle <= 1'b0;
+    else if (ACLK_EN) begin
+            int_ap_idle <= ap_idle;
+    end
+end
+
+// int_ap_ready
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_ap_ready <= 1'b0;
+    else if (ACLK_EN) begin
+        if (ap_ready)
+            int_ap_ready <= 1'b1;
+        else if (ar_hs && raddr == ADDR_AP_CTRL)
+            int_ap_ready <= 1'b0; // clear on read
+    end
+end
+
+// int_auto_restart
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_auto_restart <= 1'b0;
+    else if (ACLK_EN) begin
+        if (w_hs && waddr == ADDR_AP_CTRL && WSTRB[0])
+            int_auto_restart <=  WDATA[7];
+    end
+end
+
+// int_gie
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_gie <= 1'b0;
+    else if (ACLK_EN) begin
+        if (w_hs && waddr == ADDR_GIE && WSTRB[0])
+            int_gie <= WDATA[0];
+    end
+end
+
+// int_ier
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_ier <= 1'b0;
+    else if (ACLK_EN) begin
+        if (w_hs && waddr == ADDR_IER && WSTRB[0])
+            int_ier <= WDATA[1:0];
+    end
+end
+
+// int_isr[0]
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_isr[0] <= 1'b0;
+    else if (ACLK_EN) begin
+        if (int_ier[0] & ap_done)
+            int_isr[0] <= 1'b1;
+        else if (w_hs && waddr == ADDR_ISR && WSTRB[0])
+            int_isr[0] <= int_isr[0] ^ WDATA[0]; // toggle on write
+    end
+end
+
+// int_isr[1]
+always @(posedge ACLK) begin
+    if (ARESET)
+        int_isr[1] <= 1'b0;
+    else if (ACLK_EN) begin
+        if (int_ier[1] & ap_ready)
+            int_isr[1] <= 1'b1;
+        else if (w_hs && waddr == ADDR_ISR && WSTRB[0])
+            int_isr[1] <= int_isr[1] ^ WDATA[1]; // toggle on write
+    end
+end
+{arg_writes}
+endmodule
+'''
+
+ARG_WRITE_TEMPLATE = '''
+// int_{name}[{msb}:{lsb}]
+always @(posedge ACLK) begin
+    if (ACLK_EN) begin
+        if (w_hs && waddr == ADDR_{name}_DATA_{idx})
+            int_{name}[{msb}:{lsb}] <=
+                (WDATA[31:0] & wmask) | (int_{name}[{msb}:{lsb}] & ~wmask);
+    end
+end
+'''
+
+
+def _width(width: int) -> str:
+  return '' if width == 1 else f'[{width - 1}:0] '
+
+
+def _get_arg_width(port: tapa.instance.Port) -> int:
+  """Return the width of the control register of a port."""
+  if port.cat == tapa.instance.Instance.Arg.Cat.SCALAR:
+    return port.width
+  return 64  # 64-bit address of mmaps
+
+
+def get_s_axi_registers(
+    ports: Iterable[tapa.instance.Port],) -> Iterator[Tuple[str, int, int]]:
+  """Return the control registers of the arguments of the top-level task.
+
+  The offsets must be the same as the ones written to kernel.xml by
+  `print_kernel_xml`, from which the host finds the arguments.
+
+  Args:
+    ports: Ports of the top-level task, in the order of the arguments.
+
+  Yields:
+    Tuple of the name, offset, and number of 32-bit words of each register.
+  """
+  offset = 0x10
+  for port in ports:
+    if port.cat in {
+        tapa.instance.Instance.Arg.Cat.ISTREAM,
+        tapa.instance.Instance.Arg.Cat.OSTREAM,
+    }:
+      continue
+    if port.cat == tapa.instance.Instance.Arg.Cat.SCALAR:
+      size = max(4, port.width // 8)
+    else:
+      size = 8
+    yield port.name, offset, (size + 3) // 4
+    offset += size + 4
+
+
+def generate_control_s_axi(
+    name: str,
+    ports: Iterable[tapa.instance.Port],
+) -> str:
+  """Generate the AXI-Lite control interface of the top-level task.
+
+  The interface has the same ports and register map as the one generated by
+  HLS for `#pragma HLS interface s_axilite port = return bundle = control`.
+
+  Args:
+    name: Name of the top-level module.
+    ports: Ports of the top-level task, in the order of the arguments.
+
+  Returns:
+    Verilog code of module `{name}_control_s_axi`.
+  """
+  port_dict = {x.name: x for x in ports}
+  registers = list(get_s_axi_registers(port_dict.values()))
+  end = max((offset + words * 4 for _, offset, words in registers),
+            default=0x10)
+  addr_width = max(5, (end - 1).bit_length())
+
+  register_map: List[str] = []
+  arg_ports: List[str] = []
+  arg_addrs: List[str] = []
+  arg_regs: List[str] = []
+  arg_reads: List[str] = []
+  arg_assigns: List[str] = []
+  arg_writes: List[str] = []
+  for arg, offset, words in registers:
+    width = _get_arg_width(port_dict[arg])
+    arg_ports.append(f'    output wire {_width(width):<25}{arg},')
+    arg_regs.append(f'    reg  {_width(words * 32):<25}int_{arg} = \'b0;')
+    # bits that do not fit in the registers are zero-extended
+    arg_assigns.append(
+        f'assign {arg} = int_{arg}[{min(width, words * 32) - 1}:0];')
+    for idx in range(words):
+      addr = offset + idx * 4
+      msb, lsb = min(width, (idx + 1) * 32) - 1, idx * 32
+      register_map.append(f'// {addr:#04x} : Data signal of {arg}\n'
+                          f'//        bit {msb - lsb}~0 - {arg}[{msb}:{lsb}] '
+                          '(Read/Write)')
+      arg_addrs.append(f'    ADDR_{arg}_DATA_{idx} = {addr_width}\'h{addr:x},')
+      arg_reads.append(f'                ADDR_{arg}_DATA_{idx}: begin\n'
+                       f'                    rdata <= int_{arg}'
+                       f'[{idx * 32 + 31}:{idx * 32}];\n'
+                       f'                end')
+      arg_writes.append(
+          ARG_WRITE_TEMPLATE.format(name=arg,
+                                    idx=idx,
+                                    msb=idx * 32 + 31,
+                                    lsb=idx * 32))
+    register_map.append(f'// {offset + words * 4:#04x} : reserved')
+
+  return CONTROL_S_AXI_TEMPLATE.format(
+      name=name,
+      addr_width=addr_width,
+      register_map='\n'.join(register_map),
+      arg_ports='\n'.join(arg_ports),
+      arg_addrs='\n'.join(arg_addrs),
+      arg_regs='\n'.join(arg_regs),
+      arg_reads='\n'.join(arg_reads),
+      arg_assigns='\n'.join(arg_assigns),
+      arg_writes=''.join(arg_writes),
+  )
+
+
+def generate_upper_shell(
+    name: str,
+    ports: Iterable[tapa.instance.Port],
+    is_top: bool,
+) -> str:
+  """Generate the shell of an upper-level task.
+
+  The shell has the same ports as the module generated by HLS for the task, and
+  the top-level shell instantiates `{name}_control_s_axi`. Everything else is
+  added when the RTL is instrumented.
+
+  Args:
+    name: Name of the module.
+    ports: Ports of the task, in the order of the arguments.
+    is_top: Whether the task is the top-level task.
+
+  Returns:
+    Verilog code of the module.
+  """
+  # pylint: disable=import-outside-toplevel
+  from haoda.backend.xilinx import S_AXI_NAME
+
+  port_tuple = tuple(ports)
+  port_names: List[str] = [HANDSHAKE_CLK, HANDSHAKE_RST_N]
+  decls: List[str] = [
+      f'input {HANDSHAKE_CLK};',
+      f'input {HANDSHAKE_RST_N};',
+  ]
+
+  def add_port(port: str, direction: str, width: str = '') -> None:
+    port_names.append(port)
+    decls.append(f'{direction} {width}{port};')
+
+  if not is_top:
+    add_port(HANDSHAKE_START, 'input')
+    for port in HANDSHAKE_OUTPUT_PORTS:
+      add_port(port, 'output')
+
+  for port in port_tuple:
+    if port.cat == tapa.instance.Instance.Arg.Cat.ISTREAM:
+      if is_top:
+        for suffix, direction in AXIS_PORTS:
+          add_port(f'{port.name}_{suffix}', direction,
+                   _width(get_axis_port_width_int(suffix, port.width)))
+      else:
+        for suffix in ISTREAM_SUFFIXES:
+          add_port(f'{port.name}{suffix}', STREAM_PORT_DIRECTION[suffix],
+                   _width(STREAM_PORT_WIDTH[suffix] or port.width + 1))
+    elif port.cat == tapa.instance.Instance.Arg.Cat.OSTREAM:
+      if is_top:
+        for suffix, direction in AXIS_PORTS:
+          add_port(f'{port.name}_{suffix}', _OPPOSITE_DIRECTION[direction],
+                   _width(get_axis_port_width_int(suffix, port.width)))
+      else:
+        for suffix in OSTREAM_SUFFIXES:
+          add_port(f'{port.name}{suffix}', STREAM_PORT_DIRECTION[suffix],
+                   _width(STREAM_PORT_WIDTH[suffix] or port.width + 1))
+    elif not is_top:
+      add_port(port.name, 'input', _width(_get_arg_width(port)))
+
+  if is_top:
+    for suffix, direction, width in S_AXI_PORTS:
+      if width:
+        width = f'[{width.replace("C_S_AXI_", "C_S_AXI_CONTROL_")} - 1:0] '
+      add_port(f'{S_AXI_NAME}_{suffix}', direction, width)
+    add_port('interrupt', 'output')
+
+    registers = list(get_s_axi_registers(port_tuple))
+    end = max((offset + words * 4 for _, offset, words in registers),
+              default=0x10)
+    decls[:0] = [
+        'parameter C_S_AXI_CONTROL_DATA_WIDTH = 32;',
+        'parameter C_S_AXI_CONTROL_ADDR_WIDTH = '
+        f'{max(5, (end - 1).bit_length())};',
+        '',
+    ]
+    decls.append('')
+    decls.append(f'wire {HANDSHAKE_START};')
+    portargs = [
+        f'    .{suffix}({S_AXI_NAME}_{suffix})' for suffix, _, _ in S_AXI_PORTS
+    ]
+    portargs += [
+        f'    .ACLK({HANDSHAKE_CLK})',
+        f'    .ARESET({HANDSHAKE_RST})',
+        "    .ACLK_EN(1'b1)",
+    ]
+    port_dict = {x.name: x for x in port_tuple}
+    for arg, _, _ in registers:
+      decls.append(f'wire {_width(_get_arg_width(port_dict[arg]))}{arg};')
+      portargs.append(f'    .{arg}({arg})')
+    portargs.append('    .interrupt(interrupt)')
+    portargs += [
+        f'    .{x}({x})' for x in (HANDSHAKE_START,) + HANDSHAKE_OUTPUT_PORTS
+    ]
+    decls += [
+        '',
+        f'{name}_control_s_axi #(',
+        '    .C_S_AXI_ADDR_WIDTH( C_S_AXI_CONTROL_ADDR_WIDTH ),',
+        '    .C_S_AXI_DATA_WIDTH( C_S_AXI_CONTROL_DATA_WIDTH ))',
+        f'{name}_control_s_axi_U (',
+        ',\n'.join(portargs),
+        ');',
+    ]
+
+  return SHELL_TEMPLATE.format(
+      name=name,
+      port_names=',\n'.join(f'        {x}' for x in port_names),
+      decls='\n'.join(decls),
+  )
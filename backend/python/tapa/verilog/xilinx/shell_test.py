@@ -0,0 +1,139 @@
+import io
+import os
+import re
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from typing import Dict, Tuple
+
+import tapa.core  # pylint: disable=unused-import # avoid circular imports
+from tapa.instance import Port
+from tapa.verilog import xilinx as rtl
+
+# arguments of the top-level task, with scalars of all sizes and a stream
+PORTS = tuple(
+    Port({
+        'cat': cat,
+        'name': name,
+        'type': ctype,
+        'width': width
+    }) for cat, name, ctype, width in (
+        ('scalar', 'n', 'int', 32),
+        ('mmap', 'mem', 'int*', 32),
+        ('istream', 'q', 'int', 32),
+        ('scalar', 'big', 'uint64_t', 64),
+        ('scalar', 'small', 'char', 8),
+        ('mmap', 'b', 'float*', 32),
+    ))
+
+# name, offset, and number of 32-bit words of each register
+REGISTERS = [
+    ('n', 0x10, 1),
+    ('mem', 0x18, 2),
+    ('big', 0x24, 2),
+    ('small', 0x30, 1),
+    ('b', 0x38, 2),
+]
+
+# widths of the registers, with pointers extended to 64 bits
+ARG_WIDTHS = {
+    'n': '31:0',
+    'mem': '63:0',
+    'big': '63:0',
+    'small': '7:0',
+    'b': '63:0',
+}
+
+
+class ShellTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.TemporaryDirectory(prefix='tapa-shell-test-')
+    self.addCleanup(self._tmpdir.cleanup)
+
+  def make_module(self, name: str, code: str) -> rtl.Module:
+    filename = os.path.join(self._tmpdir.name, f'{name}.v')
+    with open(filename, 'w') as fileobj:
+      fileobj.write(code)
+    return rtl.Module([filename])
+
+  def get_widths(self, module: rtl.Module, *names: str) -> Dict[str, str]:
+    """Return the width of each named port, e.g., `31:0` for 32-bit."""
+    widths: Dict[str, str] = {}
+    for name in names:
+      width = module.ports[name].width
+      widths[name] = '' if width is None else (
+          f'{width.msb.value}:{width.lsb.value}')
+    return widths
+
+  def get_addr_width(self, code: str) -> Tuple[str, ...]:
+    return tuple(set(re.findall(r"ADDR_\w+ = (\d+)'h", code)))
+
+  def test_s_axi_registers(self):
+    self.assertEqual(list(rtl.get_s_axi_registers(PORTS)), REGISTERS)
+
+  def test_s_axi_registers_match_kernel_xml(self):
+    kernel_xml = io.StringIO()
+    rtl.print_kernel_xml('Top', PORTS, kernel_xml)
+    offsets = {
+        x.get('name'): int(x.get('offset'), 16)
+        for x in ET.fromstring(kernel_xml.getvalue().strip()).iter('arg')
+        if x.get('name') != 'q'
+    }
+    self.assertEqual(offsets, {name: offset for name, offset, _ in REGISTERS})
+
+  def test_control_s_axi(self):
+    code = rtl.generate_control_s_axi('Top', PORTS)
+    module = self.make_module('Top_control_s_axi', code)
+    self.assertEqual(module.name, 'Top_control_s_axi')
+
+    # the ports are declared in the ANSI style, which Module does not scan
+    widths = dict(
+        x[::-1] for x in re.findall(r'output wire \[(\d+:\d+)\] +(\w+),', code))
+    self.assertEqual({x: widths.get(x) for x in ARG_WIDTHS}, ARG_WIDTHS)
+    self.assertNotIn('q', widths)
+    self.assertIn('assign small = int_small[7:0];', code)
+
+    addrs = {
+        match[1]: int(match[2], 16)
+        for match in re.finditer(r"ADDR_(\w+_DATA_\d+) = \d+'h(\w+)", code)
+    }
+    self.assertEqual(
+        addrs, {
+            f'{name}_DATA_{idx}': offset + idx * 4
+            for name, offset, words in REGISTERS for idx in range(words)
+        })
+    # the last register ends at 0x40
+    self.assertEqual(self.get_addr_width(code), ('6',))
+
+  def test_control_s_axi_without_arguments(self):
+    code = rtl.generate_control_s_axi('Top', ())
+    self.make_module('Top_control_s_axi', code)
+    self.assertNotRegex(code, r'ADDR_\w+_DATA_')
+    self.assertEqual(self.get_addr_width(code), ('5',))
+
+  def test_top_upper_shell(self):
+    code = rtl.generate_upper_shell('Top', PORTS, is_top=True)
+    module = self.make_module('Top', code)
+    self.assertEqual(
+        module.params['C_S_AXI_CONTROL_ADDR_WIDTH'].value.var.value, '6')
+    self.assertEqual(self.get_widths(module, 'q_TDATA'), {'q_TDATA': '31:0'})
+    for name in ARG_WIDTHS:
+      self.assertNotIn(name, module.ports)
+      self.assertIn(f'.{name}({name})', code)
+    self.assertIn('Top_control_s_axi_U (', code)
+
+  def test_upper_shell(self):
+    code = rtl.generate_upper_shell('Sub', PORTS, is_top=False)
+    module = self.make_module('Sub', code)
+    self.assertEqual(self.get_widths(module, *ARG_WIDTHS), ARG_WIDTHS)
+    # the stream carries an extra end-of-transaction bit
+    self.assertEqual(self.get_widths(module, 'q_dout', 'q_read'), {
+        'q_dout': '32:0',
+        'q_read': '',
+    })
+    self.assertNotIn('s_axi_control', code)
+
+
+if __name__ == '__main__':
+  unittest.main()
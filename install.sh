@@ -19,8 +19,11 @@ if test "${codename}" = "xenial"; then
   sudo apt install -y software-properties-common
   sudo add-apt-repository -y ppa:deadsnakes/ppa
   sudo apt update
-  sudo apt install -y python3.6 python3-pip
-  pip="python3.6 -m pip"
+  sudo apt install -y python3.7 python3-pip
+  pip="python3.7 -m pip"
+elif test "${codename}" = "bionic"; then
+  sudo apt install -y python3.7 python3-pip
+  pip="python3.7 -m pip"
 else
   sudo apt install -y python3 python3-pip
   pip="python3 -m pip"